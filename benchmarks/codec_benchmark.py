@@ -0,0 +1,94 @@
+"""
+Microbenchmarks comparing the table-driven `Codec` against the original
+per-frame decode path.
+
+Usage:
+  python benchmarks/codec_benchmark.py [--frames N] [--repeat N]
+"""
+import argparse
+import struct
+import timeit
+
+from kesslerav.protocol2k.io import Codec, Command, Instruction
+
+def legacy_decode(data: bytes) -> list[int]:
+  """
+  Frame decoding as implemented before the codec became table-driven
+  """
+  cmd_id, *encoded_values = [byte for byte in data]
+  if cmd_id not in iter(Command):
+    cmd_id = cmd_id ^ 0b01000000
+  values = list(map(lambda value: value ^ 0b10000000, encoded_values))
+  return [cmd_id] + values
+
+def legacy_encode(instruction: Instruction) -> bytes:
+  cmd_id, *values = instruction.frame
+  encoded_values = list(map(lambda value: 0b10000000 | value, values))
+  return bytes([cmd_id] + encoded_values)
+
+def legacy_receive(data: bytes) -> list[list[int]]:
+  """
+  Receive path as implemented before frame reassembly: unpack to integers, then
+  convert each back to bytes before decoding.
+  """
+  return [
+    legacy_decode(response[0].to_bytes(Instruction.SIZE_BYTES))
+    for response in struct.iter_unpack(Instruction.FORMAT, data)
+  ]
+
+def build_payload(frame_count: int) -> tuple[list[Instruction], bytes]:
+  commands = list(Command)
+  instructions = [
+    Instruction(commands[i % len(commands)], i % 16, 1, 1)
+    for i in range(frame_count)
+  ]
+  return (instructions, Codec.encode_many(instructions))
+
+def measure(label: str, fn, frame_count: int, repeat: int) -> float:
+  best = min(timeit.repeat(fn, number = 1, repeat = repeat))
+  ns_per_frame = best / frame_count * 1e9
+  print(f'  {label:<36} {ns_per_frame:>10.1f} ns/frame')
+  return ns_per_frame
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+  parser.add_argument('--frames', type = int, default = 10_000)
+  parser.add_argument('--repeat', type = int, default = 5)
+  args = parser.parse_args()
+
+  (instructions, data) = build_payload(args.frames)
+  frames = [data[i:i + 4] for i in range(0, len(data), Instruction.SIZE_BYTES)]
+  n = args.frames
+  r = args.repeat
+
+  print(f'Decode ({n} frames, best of {r})')
+  legacy = measure(
+    'legacy per-frame decode',
+    lambda: [Instruction(*legacy_decode(frame)) for frame in frames], n, r
+  )
+  legacy_rx = measure(
+    'legacy receive path (iter_unpack)',
+    lambda: [Instruction(*frame) for frame in legacy_receive(data)], n, r
+  )
+  single = measure('Codec.decode', lambda: [Codec.decode(frame) for frame in frames], n, r)
+  bulk = measure('Codec.decode_many', lambda: Codec.decode_many(data), n, r)
+  raw = measure('Codec.decode_many (raw)', lambda: Codec.decode_many(data, raw = True), n, r)
+  print(f'  speedup, decode vs legacy:           {legacy / single:>6.1f}x')
+  print(f'  speedup, decode_many vs legacy rx:   {legacy_rx / bulk:>6.1f}x')
+  print(f'  speedup, raw decode_many vs legacy:  {legacy / raw:>6.1f}x')
+
+  print(f'Encode ({n} frames, best of {r})')
+  legacy = measure(
+    'legacy per-frame encode',
+    lambda: [legacy_encode(instruction) for instruction in instructions], n, r
+  )
+  single = measure(
+    'Codec.encode',
+    lambda: [Codec.encode(instruction) for instruction in instructions], n, r
+  )
+  bulk = measure('Codec.encode_many', lambda: Codec.encode_many(instructions), n, r)
+  print(f'  speedup, encode vs legacy:           {legacy / single:>6.1f}x')
+  print(f'  speedup, encode_many vs legacy:      {legacy / bulk:>6.1f}x')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,104 @@
+"""
+Import-time benchmark for the kesslerav package.
+
+Each scenario runs in a fresh interpreter, so module caches from one do not
+flatter the next. Scenarios measure importing the package alone, with many
+extra drivers registered, and importing the built-in TCP driver on first use.
+The run fails if importing the package exceeds `--max-ms`, or loads any module
+that drivers are expected to defer (e.g., `socket` or `asyncio`).
+
+Usage:
+  python benchmarks/import_time.py [--runs 20] [--max-ms 50] [--drivers 100]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from pathlib import Path
+
+# Modules that only drivers should import, and only on first use
+DEFERRED_MODULES = ('asyncio', 'kesslerav.fleet', 'kesslerav.protocol2k', 'select', 'socket')
+DEFAULT_MAX_MS = 50.0
+
+_MEASURE = '''
+import json, sys, time
+start = time.perf_counter_ns()
+import kesslerav
+{setup}
+elapsed = time.perf_counter_ns() - start
+print(json.dumps({{'ns': elapsed, 'modules': sorted(sys.modules)}}))
+'''
+
+def scenarios(driver_count: int) -> dict[str, str]:
+  return {
+    'import kesslerav': '',
+    f'import kesslerav + {driver_count} drivers': (
+      f'for i in range({driver_count}):\n'
+      f'  kesslerav.DRIVERS.register(f"scheme{{i}}", "protocol2k", "example.drivers:DRIVER")'
+    ),
+    'import kesslerav + tcp driver': 'kesslerav.DRIVERS.get("tcp", "protocol2k")',
+  }
+
+def measure(setup: str, runs: int) -> dict:
+  src = Path(__file__).resolve().parent.parent / 'src'
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(src), env.get('PYTHONPATH')]))
+  # Bytecode is written by the first run, so that runs measure imports alone
+  timings = []
+  modules = []
+  for _ in range(runs + 1):
+    output = subprocess.run(
+      [sys.executable, '-c', _MEASURE.format(setup = setup)],
+      env = env,
+      capture_output = True,
+      text = True,
+      check = True
+    ).stdout
+    result = json.loads(output)
+    timings.append(result['ns'] / 1e6)
+    modules = result['modules']
+  timings = timings[1:]
+  return {
+    'median_ms': statistics.median(timings),
+    'min_ms': min(timings),
+    'modules': modules,
+  }
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+  parser.add_argument('--runs', type = int, default = 20)
+  parser.add_argument('--drivers', type = int, default = 100,
+    help = 'extra drivers to register in the registration scenario')
+  parser.add_argument('--max-ms', type = float, default = DEFAULT_MAX_MS,
+    help = 'median import time treated as a failure (default: %(default)s)')
+  args = parser.parse_args()
+
+  failures = []
+  results = {}
+  for (name, setup) in scenarios(args.drivers).items():
+    result = results[name] = measure(setup, args.runs)
+    print(
+      f'  {name:<36} median {result["median_ms"]:>7.2f}ms '
+      f'min {result["min_ms"]:>7.2f}ms {len(result["modules"]):>5} modules',
+      flush = True
+    )
+
+  baseline = results['import kesslerav']
+  if baseline['median_ms'] > args.max_ms:
+    failures.append(f'import kesslerav took {baseline["median_ms"]:.2f}ms (max: {args.max_ms}ms)')
+  for name in list(results)[:2]:
+    loaded = [module for module in DEFERRED_MODULES if module in results[name]['modules']]
+    if len(loaded) > 0:
+      failures.append(f'{name} loaded deferred modules: {", ".join(loaded)}')
+
+  if len(failures) > 0:
+    for failure in failures:
+      print(failure)
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
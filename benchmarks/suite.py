@@ -0,0 +1,285 @@
+"""
+Benchmark suite measuring throughput, latency percentiles and allocations of
+the codec, instructions, TCP device and media switch.
+
+Device benchmarks run against the in-package emulator on a local port. The
+emulator runs in a separate process, so that its work is not counted against
+the library's latency or allocations.
+
+Usage:
+  python benchmarks/suite.py [--filter TEXT] [--quick]
+  python benchmarks/suite.py --save-baseline [PATH]
+  python benchmarks/suite.py --compare [PATH] [--threshold 0.10]
+
+Comparing against a baseline exits with status 1 when any benchmark regressed
+by more than the threshold.
+"""
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from pathlib import Path
+from typing import Callable, Optional
+
+from kesslerav.protocol2k.io import \
+  Codec, Command, Instruction, InstructionBatch, TcpDevice, TcpEndpoint
+from kesslerav.protocol2k.media_switch import MediaSwitch
+
+DEFAULT_BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+DEFAULT_THRESHOLD = 0.10
+
+class Benchmark:
+  """
+  A named operation, timed in groups of `inner` calls so that very fast
+  operations are not dominated by timer overhead
+  """
+
+  def __init__(
+      self,
+      name: str,
+      operation: Callable[[], object],
+      inner: int = 1,
+      samples: int = 1000
+    ):
+    self.name = name
+    self.operation = operation
+    self.inner = inner
+    self.samples = samples
+
+  def run(self, samples: Optional[int] = None) -> dict[str, float]:
+    samples = samples or self.samples
+    operation = self.operation
+    inner = range(self.inner)
+    for _ in range(min(samples, 100)):
+      operation()
+
+    timings = []
+    gc.disable()
+    try:
+      for _ in range(samples):
+        start = time.perf_counter_ns()
+        for _ in inner:
+          operation()
+        timings.append((time.perf_counter_ns() - start) / self.inner)
+    finally:
+      gc.enable()
+
+    timings.sort()
+    total_ops = samples * self.inner
+    return {
+      'ops_per_sec': total_ops / (sum(timings) * self.inner / 1e9),
+      'p50_ns': _percentile(timings, 0.50),
+      'p99_ns': _percentile(timings, 0.99),
+      'alloc_bytes_per_op': self._allocations(),
+    }
+
+  def _allocations(self, count: int = 100) -> float:
+    """
+    Mean peak memory allocated while running the operation once
+    """
+    tracemalloc.start()
+    try:
+      peaks = []
+      for _ in range(count):
+        tracemalloc.reset_peak()
+        (base, _) = tracemalloc.get_traced_memory()
+        self.operation()
+        (_, peak) = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    finally:
+      tracemalloc.stop()
+    return statistics.fmean(peaks)
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+  index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+  return sorted_values[index]
+
+def codec_benchmarks() -> list[Benchmark]:
+  instruction = Instruction(Command.SWITCH_VIDEO, 3, 1, 1)
+  batch = [Instruction(Command.SWITCH_VIDEO, i % 16, 1, 1) for i in range(64)]
+  columnar = InstructionBatch.from_instructions(batch)
+  frame = Codec.encode(instruction)
+  frames = Codec.encode_many(batch)
+  return [
+    Benchmark('codec.encode', lambda: Codec.encode(instruction), inner = 1000),
+    Benchmark('codec.encode_many[64]', lambda: Codec.encode_many(batch), inner = 100),
+    Benchmark('codec.decode', lambda: Codec.decode(frame), inner = 1000),
+    Benchmark('codec.decode_many[64]', lambda: Codec.decode_many(frames), inner = 100),
+    Benchmark('codec.encode_batch[64]', lambda: Codec.encode_batch(columnar), inner = 100),
+    Benchmark('codec.decode_batch[64]', lambda: Codec.decode_batch(frames), inner = 100),
+  ]
+
+def instruction_benchmarks() -> list[Benchmark]:
+  return [
+    Benchmark(
+      'instruction.construct',
+      lambda: Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+      inner = 1000
+    ),
+  ]
+
+class EmulatorProcess:
+  """
+  Runs the emulator as a child process, hosting a single switch
+  """
+
+  def __init__(self, *args: str):
+    self._args = args
+    self._process: Optional[subprocess.Popen] = None
+    self.port = 0
+
+  def __enter__(self) -> 'EmulatorProcess':
+    self._process = subprocess.Popen(
+      [sys.executable, '-m', 'kesslerav.protocol2k.emulator', '--port', '0', *self._args],
+      stdout = subprocess.PIPE,
+      text = True
+    )
+    url = self._process.stdout.readline().strip()
+    if not url:
+      self._process.kill()
+      raise RuntimeError('Emulator failed to start')
+    self.port = int(url.rsplit(':', 1)[1])
+    return self
+
+  def __exit__(self, *_) -> None:
+    self._process.terminate()
+    self._process.wait()
+
+def device_benchmarks(port: int) -> list[Benchmark]:
+  endpoint = TcpEndpoint('127.0.0.1', port, 1.0)
+  device = TcpDevice(endpoint)
+  pipelined_device = TcpDevice(endpoint, pipelined = True)
+  query = Instruction(Command.QUERY_PANEL_LOCK)
+  batch = [Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1)] * 16
+  columnar = InstructionBatch.from_instructions(batch)
+
+  media_switch = MediaSwitch(TcpDevice(endpoint))
+  sources = iter(range(1 << 62))
+  return [
+    Benchmark('tcp.process', lambda: device.process(query), samples = 500),
+    Benchmark('tcp.process[16]', lambda: device.process(batch), samples = 200),
+    Benchmark(
+      'tcp.process[16] pipelined',
+      lambda: pipelined_device.process(batch),
+      samples = 500
+    ),
+    Benchmark(
+      'tcp.process[16] pipelined batch',
+      lambda: pipelined_device.process(columnar),
+      samples = 500
+    ),
+    Benchmark('media_switch.update', media_switch.update, samples = 300),
+    Benchmark(
+      'media_switch.select_source',
+      lambda: media_switch.select_source(next(sources) % 16 + 1),
+      samples = 500
+    ),
+  ]
+
+def run_suite(name_filter: Optional[str] = None, quick: bool = False) -> dict[str, dict]:
+  results = {}
+  with EmulatorProcess('--inputs', '16') as emulator:
+    benchmarks = codec_benchmarks() + instruction_benchmarks() + device_benchmarks(emulator.port)
+    for benchmark in benchmarks:
+      if name_filter is not None and name_filter not in benchmark.name:
+        continue
+      samples = max(benchmark.samples // 10, 20) if quick else None
+      results[benchmark.name] = benchmark.run(samples)
+      _print_result(benchmark.name, results[benchmark.name])
+  return results
+
+def compare(
+    results: dict[str, dict],
+    baseline: dict[str, dict],
+    threshold: float
+  ) -> list[str]:
+  """
+  Returns a description of each metric that regressed by more than
+  `threshold`, as a fraction of its baseline
+  """
+  regressions = []
+  for (name, result) in results.items():
+    previous = baseline.get(name)
+    if previous is None:
+      continue
+    checks = (
+      # Lower is better for latency and allocations; higher for throughput
+      ('p50_ns', result['p50_ns'] / previous['p50_ns'] - 1),
+      ('p99_ns', result['p99_ns'] / previous['p99_ns'] - 1),
+      ('ops_per_sec', previous['ops_per_sec'] / result['ops_per_sec'] - 1),
+      (
+        'alloc_bytes_per_op',
+        (result['alloc_bytes_per_op'] - previous['alloc_bytes_per_op'])
+          / max(previous['alloc_bytes_per_op'], 1.0)
+      ),
+    )
+    for (metric, change) in checks:
+      if change > threshold:
+        regressions.append(
+          f'{name}: {metric} regressed {change:.0%} '
+          f'({previous[metric]:.1f} -> {result[metric]:.1f})'
+        )
+  return regressions
+
+def _print_result(name: str, result: dict[str, float]) -> None:
+  print(
+    f'  {name:<30} {result["ops_per_sec"]:>12.0f} ops/s '
+    f'p50 {_format_ns(result["p50_ns"]):>9} '
+    f'p99 {_format_ns(result["p99_ns"]):>9} '
+    f'{result["alloc_bytes_per_op"]:>9.0f} B/op',
+    flush = True
+  )
+
+def _format_ns(value: float) -> str:
+  if value >= 1e6:
+    return f'{value / 1e6:.2f}ms'
+  if value >= 1e3:
+    return f'{value / 1e3:.2f}us'
+  return f'{value:.0f}ns'
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+  parser.add_argument('--filter', help = 'only run benchmarks whose name contains this')
+  parser.add_argument('--quick', action = 'store_true', help = 'take fewer samples')
+  parser.add_argument('--save-baseline', nargs = '?', const = DEFAULT_BASELINE_PATH,
+    type = Path, metavar = 'PATH')
+  parser.add_argument('--compare', nargs = '?', const = DEFAULT_BASELINE_PATH,
+    type = Path, metavar = 'PATH')
+  parser.add_argument('--threshold', type = float, default = DEFAULT_THRESHOLD,
+    help = 'fractional change treated as a regression (default: %(default)s)')
+  parser.add_argument('--output', type = Path, help = 'write results as JSON')
+  args = parser.parse_args()
+
+  results = run_suite(args.filter, args.quick)
+  document = {
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'results': results,
+  }
+  if args.output is not None:
+    args.output.write_text(json.dumps(document, indent = 2) + '\n')
+  if args.save_baseline is not None:
+    args.save_baseline.write_text(json.dumps(document, indent = 2) + '\n')
+    print(f'Saved baseline to {args.save_baseline}')
+
+  if args.compare is not None:
+    baseline = json.loads(args.compare.read_text())
+    if baseline.get('python') != document['python']:
+      print(f'Note: baseline was recorded with Python {baseline.get("python")}')
+    regressions = compare(results, baseline['results'], args.threshold)
+    if len(regressions) > 0:
+      print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}:')
+      for regression in regressions:
+        print(f'  {regression}')
+      return 1
+    print(f'No regressions beyond {args.threshold:.0%}')
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
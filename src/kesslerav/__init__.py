@@ -1,17 +1,47 @@
 """Kramer A/V Protcol 2000 control library"""
 from typing import Optional
 
-from .constants import PROTOCOL_2K, SCHEME_TCP
+from .constants import PROTOCOL_2K, SCHEME_SERIAL, SCHEME_TCP, SCHEME_UDP, \
+  DISCOVERY_BACKGROUND, DISCOVERY_EAGER, DISCOVERY_LAZY
+from .drivers import DRIVERS, DriverRegistry
+from .instance_cache import InstanceCache, SharedInstance
 from .url_parser import parse_url
-from .media_switch import MediaSwitch
+from .matrix_switch import MatrixSwitch
+from .media_switch import AsyncMediaSwitch, MediaSwitch
 
-from .protocol2k import get_tcp_media_switch
+# Imported on first access, so that importing the package stays cheap
+_LAZY_EXPORTS: dict[str, str] = {
+  'FleetResult': '.fleet',
+  'SwitchFleet': '.fleet',
+  'get_async_tcp_media_switch': '.protocol2k',
+  'get_serial_media_switch': '.protocol2k',
+  'get_tcp_matrix_switch': '.protocol2k',
+  'get_tcp_media_switch': '.protocol2k',
+  'get_udp_media_switch': '.protocol2k',
+}
+
+# Media switches shared by `get_media_switch(..., shared = True)` callers
+SHARED_MEDIA_SWITCHES = InstanceCache()
+
+def __getattr__(name: str):
+  module_name = _LAZY_EXPORTS.get(name)
+  if module_name is None:
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+  from importlib import import_module
+  value = getattr(import_module(module_name, __name__), name)
+  globals()[name] = value
+  return value
+
+def __dir__() -> list[str]:
+  return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
 def get_media_switch(
     url: str,
     timeout_sec: Optional[float] = None,
-    machine_id: Optional[int] = None
-  ) -> MediaSwitch:
+    machine_id: Optional[int] = None,
+    discovery: str = DISCOVERY_EAGER,
+    shared: bool = False
+  ) -> MediaSwitch | SharedInstance:
   """
   Create media switch representation whose state can be accessed via the specified
   URL.
@@ -19,12 +49,19 @@ def get_media_switch(
   Currently supported:
     + Schemes:
       + TCP (identifier: tcp)
+      + UDP (identifier: udp)
+      + Serial (identifier: serial)
     + Protocols:
       + Protocol 2000 (identifier: protocol2k)
 
+  Other schemes and protocols can be supported by registering a driver; see
+  `kesslerav.drivers`.
+
   Defaults:
     + Default scheme: TCP (identifier: tcp)
     + Default TCP port: 5000
+    + Default UDP port: 50000
+    + Default serial baud rate: 9600
     + Default protocol: Protocol 2000 (identifier: protocol2k)
 
   URL format:
@@ -44,6 +81,18 @@ def get_media_switch(
           Scheme: tcp, Host: switch.local, Port: 8080, Protocol: protocol2k
       + tcp://localhost:8080#protocol2k
           Scheme: tcp, Host: localhost, Port: 8080, Protocol: protocol2k
+      + udp://10.0.0.1 ->
+          Scheme: udp, Host: 10.0.0.1, Port: 50000, Protocol: protocol2k
+
+  Serial URLs take the form of `serial://<path>?baud=<rate>&machine_id=<id>`,
+  with all but the path being optional. Switches daisy-chained on one port share
+  a single bus, so use one URL (or `machine_id`) per switch.
+
+      + serial:///dev/ttyUSB0?machine_id=2 ->
+          Scheme: serial, Path: /dev/ttyUSB0, Baud rate: 9600, Machine ID: 2
+
+  UDP switches share a single socket, so polling many of them costs one
+  datagram each way per query and no connection setup.
 
   Args:
     url (str): The URL at which the device state can be accessed.
@@ -51,20 +100,93 @@ def get_media_switch(
       with the device. Default: None, which allows the underlying protocol driver
       to determine.
     machine_id (Optional[int]): Specifies the machine ID of the target device.
-      This is only applicable with serial communications. Default: None, which
-      allows the underlying protocol driver to determine.
+      This is only applicable with serial communications, where it takes
+      precedence over the URL's `machine_id`. Default: None, which allows the
+      underlying protocol driver to determine.
+    discovery (str): When initial device state is loaded. One of `eager`
+      (before returning), `lazy` (on first use) or `background` (in a background
+      thread, so this returns without waiting on the device.) Default: `eager`.
+    shared (bool): When `True`, callers asking for the same endpoint (in any
+      equivalent URL form, e.g., `10.0.0.5` and `tcp://10.0.0.5:5000#protocol2k`)
+      and machine ID share one media switch and device connection. Each caller
+      gets its own handle, whose `close()` releases it; the media switch is
+      closed once every handle has been. Later callers must pass the same
+      `timeout_sec` and `discovery` as the first, or `ValueError` is raised.
+      Default: `False`.
 
   Returns:
     MediaSwitch: Representation of the media switch device, including methods for
-      controlling it (e.g., selecting sources.)
+      controlling it (e.g., selecting sources.) When `shared`, a `SharedInstance`
+      handle that passes attribute access through to the media switch, whose
+      `instance` is the media switch itself.
   """
   endpoint = parse_url(url)
-  if endpoint.protocol == PROTOCOL_2K and endpoint.scheme == SCHEME_TCP:
-    return get_tcp_media_switch(
-      host = endpoint.host,
-      port = endpoint.port,
-      timeout_sec = timeout_sec,
-      machine_id = machine_id
+  factory = DRIVERS.factory(endpoint, 'media_switch', url)
+  create = lambda: factory(
+    endpoint,
+    timeout_sec = timeout_sec,
+    machine_id = machine_id,
+    discovery = discovery
+  )
+  if shared:
+    return SHARED_MEDIA_SWITCHES.acquire(
+      (endpoint, machine_id),
+      create,
+      options = {'timeout_sec': timeout_sec, 'discovery': discovery}
     )
-  else:
-    raise ValueError(f'Unsupported url specified: {url}')
\ No newline at end of file
+  return create()
+
+def get_matrix_switch(
+    url: str,
+    timeout_sec: Optional[float] = None,
+    machine_id: Optional[int] = None
+  ) -> MatrixSwitch:
+  """
+  Create matrix switch representation whose state, including its full routing
+  table, can be accessed via the specified URL.
+
+  See `get_media_switch` for the supported URL format, schemes and protocols.
+
+  Args:
+    url (str): The URL at which the device state can be accessed.
+    timeout_sec (Optional[float]): Timeout, in seconds, to use when communicating
+      with the device. Default: None, which allows the underlying protocol driver
+      to determine.
+    machine_id (Optional[int]): Specifies the machine ID of the target device.
+      Default: None, which allows the underlying protocol driver to determine.
+
+  Returns:
+    MatrixSwitch: Representation of the matrix switch device, including methods
+      for controlling it (e.g., routing inputs to outputs.)
+  """
+  endpoint = parse_url(url)
+  factory = DRIVERS.factory(endpoint, 'matrix_switch', url)
+  return factory(endpoint, timeout_sec = timeout_sec, machine_id = machine_id)
+
+async def get_async_media_switch(
+    url: str,
+    timeout_sec: Optional[float] = None,
+    machine_id: Optional[int] = None
+  ) -> AsyncMediaSwitch:
+  """
+  asyncio counterpart to `get_media_switch`, returning a media switch whose
+  device operations are awaitable.
+
+  Device state is loaded before returning. See `get_media_switch` for the
+  supported URL format, schemes and protocols.
+
+  Args:
+    url (str): The URL at which the device state can be accessed.
+    timeout_sec (Optional[float]): Timeout, in seconds, to use when communicating
+      with the device. Default: None, which allows the underlying protocol driver
+      to determine.
+    machine_id (Optional[int]): Specifies the machine ID of the target device.
+      Default: None, which allows the underlying protocol driver to determine.
+
+  Returns:
+    AsyncMediaSwitch: Representation of the media switch device, including
+      awaitable methods for controlling it (e.g., selecting sources.)
+  """
+  endpoint = parse_url(url)
+  factory = DRIVERS.factory(endpoint, 'async_media_switch', url)
+  return await factory(endpoint, timeout_sec = timeout_sec, machine_id = machine_id)
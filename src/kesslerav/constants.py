@@ -3,4 +3,12 @@ from logging import getLogger as get_logger
 LOGGER = get_logger(__package__)
 
 PROTOCOL_2K = 'protocol2k'
-SCHEME_TCP = 'tcp'
\ No newline at end of file
+SCHEME_TCP = 'tcp'
+SCHEME_UDP = 'udp'
+SCHEME_SERIAL = 'serial'
+
+# Media switch discovery modes: when initial device state is loaded
+DISCOVERY_EAGER = 'eager'
+DISCOVERY_LAZY = 'lazy'
+DISCOVERY_BACKGROUND = 'background'
+DISCOVERY_MODES = (DISCOVERY_EAGER, DISCOVERY_LAZY, DISCOVERY_BACKGROUND)
@@ -0,0 +1,133 @@
+"""
+Registry of the drivers that create switches for each scheme and protocol.
+
+A driver is any object providing some of these factory methods, each taking the
+parsed `url_parser.Endpoint` and the options given to the matching
+`kesslerav.get_*` function:
+
+  media_switch(endpoint, timeout_sec, machine_id, discovery) -> MediaSwitch
+  matrix_switch(endpoint, timeout_sec, machine_id) -> MatrixSwitch
+  async async_media_switch(endpoint, timeout_sec, machine_id) -> AsyncMediaSwitch
+
+Drivers are registered as `module:attribute` references and only imported when
+a URL first needs them, so importing `kesslerav` costs the same however many
+drivers are available. Third-party packages can provide drivers through the
+`kesslerav.drivers` entry point group, naming each entry point
+`<scheme>#<protocol>` (e.g., `mqtt#protocol2k`), matching the URL format.
+"""
+import threading
+
+from importlib import import_module
+from typing import Optional
+
+from .constants import LOGGER, PROTOCOL_2K, SCHEME_SERIAL, SCHEME_TCP, SCHEME_UDP
+from .url_parser import Endpoint
+
+ENTRY_POINT_GROUP = 'kesslerav.drivers'
+
+class DriverRegistry:
+  """
+  Maps `(scheme, protocol)` pairs to drivers, importing each driver on first use
+  """
+
+  def __init__(self, entry_point_group: Optional[str] = ENTRY_POINT_GROUP):
+    self._entry_point_group = entry_point_group
+    # Values are either loaded drivers or `module:attribute` references
+    self._drivers: dict[tuple[str, str], object] = {}
+    self._entry_points_loaded = entry_point_group is None
+    self._lock = threading.Lock()
+
+  def register(self, scheme: str, protocol: str, driver: object) -> None:
+    """
+    Registers a driver, or a `module:attribute` reference to one, replacing any
+    driver already registered for the scheme and protocol
+    """
+    if isinstance(driver, str) and ':' not in driver:
+      raise ValueError(f'Driver references take the form module:attribute. Received: {driver}')
+    with self._lock:
+      self._drivers[(scheme, protocol)] = driver
+
+  def unregister(self, scheme: str, protocol: str) -> None:
+    with self._lock:
+      self._drivers.pop((scheme, protocol), None)
+
+  def registered(self) -> list[tuple[str, str]]:
+    """
+    Returns the `(scheme, protocol)` pairs with a driver, including those
+    provided through entry points
+    """
+    self._load_entry_points()
+    with self._lock:
+      return sorted(self._drivers)
+
+  def is_imported(self, scheme: str, protocol: str) -> bool:
+    """
+    Returns `true` once the driver for the scheme and protocol has been imported
+    """
+    driver = self._drivers.get((scheme, protocol))
+    return driver is not None and not isinstance(driver, str)
+
+  def get(self, scheme: str, protocol: str) -> Optional[object]:
+    """
+    Returns the driver for the scheme and protocol, importing it if needed, or
+    `None` when there is none
+    """
+    key = (scheme, protocol)
+    if key not in self._drivers:
+      self._load_entry_points()
+    driver = self._drivers.get(key)
+    if isinstance(driver, str):
+      loaded = _load_reference(driver)
+      with self._lock:
+        # Keep a driver registered while this one was being imported
+        if self._drivers.get(key) == driver:
+          self._drivers[key] = loaded
+        driver = self._drivers.get(key)
+    return driver
+
+  def factory(self, endpoint: Endpoint, kind: str, url: str):
+    """
+    Returns the driver method creating a `kind` of switch (e.g., `media_switch`)
+    for the endpoint.
+
+    Raises:
+      ValueError: When no driver supports the endpoint's scheme and protocol,
+        or the driver cannot create that kind of switch
+    """
+    driver = self.get(endpoint.scheme, endpoint.protocol)
+    factory = getattr(driver, kind, None)
+    if factory is None:
+      raise ValueError(f'Unsupported url specified: {url}')
+    return factory
+
+  def _load_entry_points(self) -> None:
+    if self._entry_points_loaded:
+      return
+    # Deferred, since reading package metadata is relatively slow
+    from importlib.metadata import entry_points
+
+    discovered = {}
+    for entry_point in entry_points(group = self._entry_point_group):
+      (scheme, _, protocol) = entry_point.name.partition('#')
+      if len(scheme) == 0 or len(protocol) == 0:
+        LOGGER.warning('Ignoring driver entry point not named <scheme>#<protocol>: %s', entry_point.name)
+        continue
+      discovered[(scheme, protocol)] = entry_point.value
+    with self._lock:
+      for (key, reference) in discovered.items():
+        # Drivers registered in code take precedence
+        self._drivers.setdefault(key, reference)
+      self._entry_points_loaded = True
+
+def _load_reference(reference: str) -> object:
+  (module_name, _, attribute) = reference.partition(':')
+  driver = import_module(module_name)
+  for name in attribute.split('.'):
+    driver = getattr(driver, name)
+  return driver
+
+# Registry used by `get_media_switch` and friends
+DRIVERS = DriverRegistry()
+DRIVERS.register(SCHEME_TCP, PROTOCOL_2K, 'kesslerav.protocol2k.drivers:TCP_DRIVER')
+DRIVERS.register(SCHEME_UDP, PROTOCOL_2K, 'kesslerav.protocol2k.drivers:UDP_DRIVER')
+DRIVERS.register(SCHEME_SERIAL, PROTOCOL_2K, 'kesslerav.protocol2k.drivers:SERIAL_DRIVER')
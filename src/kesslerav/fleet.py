@@ -0,0 +1,248 @@
+import functools
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Generic, Iterable, Optional, TypeVar
+
+from .constants import DISCOVERY_LAZY, LOGGER
+from .media_switch import MediaSwitch
+
+T = TypeVar('T')
+
+class FleetResult(Generic[T]):
+  """
+  Outcome of an operation against a single device in a fleet
+  """
+
+  def __init__(
+      self,
+      url: str,
+      value: Optional[T] = None,
+      error: Optional[BaseException] = None,
+      elapsed_sec: float = 0.0
+    ):
+    self._url = url
+    self._value = value
+    self._error = error
+    self._elapsed_sec = elapsed_sec
+
+  @property
+  def url(self) -> str:
+    return self._url
+
+  @property
+  def value(self) -> Optional[T]:
+    return self._value
+
+  @property
+  def error(self) -> Optional[BaseException]:
+    return self._error
+
+  @property
+  def elapsed_sec(self) -> float:
+    return self._elapsed_sec
+
+  @property
+  def ok(self) -> bool:
+    return self._error is None
+
+  def __repr__(self) -> str:
+    if self.ok:
+      return f'FleetResult({self._url!r}, value={self._value!r})'
+    return f'FleetResult({self._url!r}, error={self._error!r})'
+
+class SwitchFleet:
+  """
+  Polls and controls many media switches concurrently.
+
+  Each operation runs against every device at once, up to `max_concurrency`
+  devices at a time, so a sweep takes about as long as its slowest device rather
+  than the sum of all of them. Devices are connected on first use.
+
+  When `deadline_sec` is given to an operation, a device that has not finished
+  within that many seconds of starting is reported with a `TimeoutError`. Its
+  work is abandoned rather than interrupted, so it can occupy a worker until the
+  device's own I/O timeout elapses.
+
+  Devices reporting themselves unavailable (see `TcpDevice.is_available`) are
+  skipped, and reported with a `ConnectionError`, until they are due to be
+  probed again.
+  """
+  DEFAULT_MAX_CONCURRENCY: int = 32
+
+  def __init__(
+      self,
+      urls: Iterable[str],
+      timeout_sec: Optional[float] = None,
+      machine_id: Optional[int] = None,
+      max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+      factory: Optional[Callable[..., MediaSwitch]] = None
+    ):
+    if max_concurrency < 1:
+      raise ValueError(f'max_concurrency must be at least 1. Received: {max_concurrency}')
+    if factory is None:
+      from . import get_media_switch
+      # State is loaded by the first operation, rather than once more on creation
+      factory = functools.partial(get_media_switch, discovery = DISCOVERY_LAZY)
+
+    # Preserve order, dropping duplicates
+    self._urls = list(dict.fromkeys(urls))
+    self._timeout_sec = timeout_sec
+    self._machine_id = machine_id
+    self._max_concurrency = max_concurrency
+    self._factory = factory
+    self._switches: dict[str, MediaSwitch] = {}
+    self._switches_lock = threading.Lock()
+    self._executor: Optional[ThreadPoolExecutor] = None
+
+  @property
+  def urls(self) -> list[str]:
+    return list(self._urls)
+
+  @property
+  def switches(self) -> dict[str, MediaSwitch]:
+    """
+    Media switches that have been connected, keyed by URL
+    """
+    with self._switches_lock:
+      return dict(self._switches)
+
+  def connect(self, deadline_sec: Optional[float] = None) -> dict[str, FleetResult[MediaSwitch]]:
+    """
+    Connects to every device not yet connected, loading its state
+    """
+    def connect_switch(switch: MediaSwitch) -> MediaSwitch:
+      if not getattr(switch, 'is_ready', True):
+        switch.update()
+      return switch
+    return self.run(connect_switch, deadline_sec)
+
+  def refresh(self, deadline_sec: Optional[float] = None) -> dict[str, FleetResult[MediaSwitch]]:
+    """
+    Refreshes the state of every device
+    """
+    def refresh_switch(switch: MediaSwitch) -> MediaSwitch:
+      switch.update()
+      if not getattr(switch, 'is_responsive', True):
+        raise TimeoutError('No response from device')
+      return switch
+    return self.run(refresh_switch, deadline_sec)
+
+  def select_source(
+      self,
+      input: int,
+      deadline_sec: Optional[float] = None
+    ) -> dict[str, FleetResult[None]]:
+    return self.run(lambda switch: switch.select_source(input), deadline_sec)
+
+  def lock(self, deadline_sec: Optional[float] = None) -> dict[str, FleetResult[None]]:
+    return self.run(lambda switch: switch.lock(), deadline_sec)
+
+  def unlock(self, deadline_sec: Optional[float] = None) -> dict[str, FleetResult[None]]:
+    return self.run(lambda switch: switch.unlock(), deadline_sec)
+
+  def run(
+      self,
+      operation: Callable[[MediaSwitch], T],
+      deadline_sec: Optional[float] = None
+    ) -> dict[str, FleetResult[T]]:
+    """
+    Runs the operation against every device concurrently, returning the result
+    for each device keyed by URL, in fleet order.
+    """
+    executor = self._get_executor()
+    started_at: dict[str, float] = {}
+    futures: dict[Future, str] = {}
+    for url in self._urls:
+      future = executor.submit(self._run_one, url, operation, started_at)
+      futures[future] = url
+
+    results: dict[str, FleetResult[T]] = {}
+    pending = set(futures)
+    while len(pending) > 0:
+      timeout = None
+      if deadline_sec is not None:
+        now = time.monotonic()
+        for future in list(pending):
+          url = futures[future]
+          start = started_at.get(url)
+          if start is not None and now - start >= deadline_sec and not future.done():
+            pending.remove(future)
+            LOGGER.info('Device %s missed its %.3fs deadline', url, deadline_sec)
+            results[url] = FleetResult(
+              url,
+              error = TimeoutError(f'Device missed its {deadline_sec}s deadline'),
+              elapsed_sec = now - start
+            )
+        # Wake for the next deadline, or shortly to notice newly started work
+        expiries = [
+          started_at[futures[future]] + deadline_sec - now
+          for future in pending if futures[future] in started_at
+        ]
+        timeout = max(min(expiries, default = min(deadline_sec, 0.05)), 0.001)
+      (done, pending) = wait(pending, timeout = timeout, return_when = FIRST_COMPLETED)
+      for future in done:
+        results[futures[future]] = future.result()
+
+    return {url: results[url] for url in self._urls}
+
+  def close(self) -> None:
+    """
+    Closes every connected device and stops the fleet's workers
+    """
+    with self._switches_lock:
+      switches = list(self._switches.values())
+      self._switches.clear()
+    for switch in switches:
+      self._close_switch(switch)
+    if self._executor is not None:
+      self._executor.shutdown(wait = False, cancel_futures = True)
+      self._executor = None
+
+  def _get_executor(self) -> ThreadPoolExecutor:
+    if self._executor is None:
+      self._executor = ThreadPoolExecutor(
+        max_workers = self._max_concurrency,
+        thread_name_prefix = 'kesslerav-fleet'
+      )
+    return self._executor
+
+  def _run_one(
+      self,
+      url: str,
+      operation: Callable[[MediaSwitch], T],
+      started_at: dict[str, float]
+    ) -> FleetResult[T]:
+    start = time.monotonic()
+    started_at[url] = start
+    try:
+      switch = self._switch_for(url)
+      if not getattr(switch, 'is_available', True):
+        # Skip devices known to be down until they are due to be probed again
+        raise ConnectionError('Device unavailable')
+      value = operation(switch)
+      return FleetResult(url, value = value, elapsed_sec = time.monotonic() - start)
+    except Exception as ex:
+      return FleetResult(url, error = ex, elapsed_sec = time.monotonic() - start)
+
+  def _switch_for(self, url: str) -> MediaSwitch:
+    with self._switches_lock:
+      switch = self._switches.get(url)
+    if switch is None:
+      switch = self._factory(url, timeout_sec = self._timeout_sec, machine_id = self._machine_id)
+      with self._switches_lock:
+        existing = self._switches.setdefault(url, switch)
+      if existing is not switch:
+        # Another operation created the switch first; release the duplicate
+        self._close_switch(switch)
+        switch = existing
+    return switch
+
+  def _close_switch(self, switch: MediaSwitch) -> None:
+    close = getattr(switch, 'close', None)
+    if close is not None:
+      try:
+        close()
+      except Exception as ex:
+        LOGGER.error('Failed closing media switch: %s', ex)
@@ -0,0 +1,167 @@
+import threading
+
+from typing import Callable, Hashable, Optional
+
+class _Entry:
+  __slots__ = ('instance', 'options', 'error', 'references', 'ready')
+
+  def __init__(self, options: Optional[dict]):
+    self.instance = None
+    self.options = options
+    self.error: Optional[BaseException] = None
+    self.references = 0
+    self.ready = threading.Event()
+
+class SharedInstance:
+  """
+  Handle to an instance shared through an `InstanceCache`.
+
+  Attribute access is passed through to the shared instance. Closing the handle
+  releases its reference; the instance itself is closed once every handle to it
+  has been.
+  """
+  _ATTRIBUTES = frozenset(('_cache', '_key', '_entry', '_is_released', '_lock'))
+
+  def __init__(self, cache: 'InstanceCache', key: Hashable, entry: _Entry):
+    self._cache = cache
+    self._key = key
+    self._entry = entry
+    self._is_released = False
+    self._lock = threading.Lock()
+
+  @property
+  def instance(self):
+    """
+    The shared instance
+    """
+    return self._entry.instance
+
+  @property
+  def key(self) -> Hashable:
+    return self._key
+
+  @property
+  def is_released(self) -> bool:
+    return self._is_released
+
+  def release(self) -> None:
+    """
+    Releases this handle's reference to the shared instance. Releasing a handle
+    more than once has no further effect.
+    """
+    with self._lock:
+      if self._is_released:
+        return
+      self._is_released = True
+    self._cache._release(self._key, self._entry)
+
+  def close(self) -> None:
+    """
+    Equivalent to `release`
+    """
+    self.release()
+
+  def __getattr__(self, name: str):
+    if name.startswith('__') or name in SharedInstance._ATTRIBUTES:
+      # The handle's own attributes are never passed through
+      raise AttributeError(name)
+    if self._is_released:
+      raise RuntimeError('Shared instance has been released')
+    return getattr(self._entry.instance, name)
+
+  def __repr__(self) -> str:
+    return f'SharedInstance({self._key!r}, {self._entry.instance!r})'
+
+class InstanceCache:
+  """
+  Reference-counted cache of instances (e.g., media switches), so that callers
+  asking for the same key share a single instance.
+
+  Instances are created on first request, and closed when the last handle to
+  them is released. Callers that ask for a key while its instance is still
+  being created wait for it, rather than creating another.
+  """
+
+  def __init__(self):
+    self._entries: dict[Hashable, _Entry] = {}
+    self._lock = threading.Lock()
+
+  def acquire(
+      self,
+      key: Hashable,
+      factory: Callable[[], object],
+      options: Optional[dict] = None
+    ) -> SharedInstance:
+    """
+    Returns a handle to the instance for the key, creating it with `factory`
+    when there is none. Every handle must be released (or closed.)
+
+    `options` describes how `factory` configures the instance. Asking for an
+    existing instance with different options raises `ValueError`, rather than
+    silently handing back an instance configured otherwise.
+    """
+    with self._lock:
+      entry = self._entries.get(key)
+      is_creator = entry is None
+      if is_creator:
+        entry = self._entries[key] = _Entry(options)
+      elif entry.options != options:
+        raise ValueError(
+          f'Shared instance {key!r} exists with options {entry.options!r}, not {options!r}'
+        )
+      entry.references += 1
+
+    if is_creator:
+      try:
+        entry.instance = factory()
+      except BaseException as ex:
+        with self._lock:
+          # Let later requests retry, rather than share the failure
+          del self._entries[key]
+        entry.error = ex
+        raise
+      finally:
+        entry.ready.set()
+    else:
+      entry.ready.wait()
+      if entry.error is not None:
+        raise entry.error
+    return SharedInstance(self, key, entry)
+
+  def reference_count(self, key: Hashable) -> int:
+    """
+    Number of unreleased handles to the instance for the key
+    """
+    with self._lock:
+      entry = self._entries.get(key)
+      return 0 if entry is None else entry.references
+
+  def __contains__(self, key: Hashable) -> bool:
+    with self._lock:
+      return key in self._entries
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._entries)
+
+  def close(self) -> None:
+    """
+    Closes every cached instance, whether or not its handles were released
+    """
+    with self._lock:
+      entries = list(self._entries.values())
+      self._entries.clear()
+    for entry in entries:
+      if entry.instance is not None:
+        entry.instance.close()
+
+  def _release(self, key: Hashable, entry: _Entry) -> None:
+    with self._lock:
+      if self._entries.get(key) is not entry:
+        # Already closed through `close`
+        return
+      entry.references -= 1
+      if entry.references > 0:
+        return
+      del self._entries[key]
+    entry.instance.close()
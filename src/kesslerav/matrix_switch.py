@@ -0,0 +1,73 @@
+from typing import Mapping, Protocol
+
+class MatrixSwitch(Protocol):
+  """
+  Representation of a multi-input, multi-output matrix switch, where any input
+  can be routed to each output independently, such as a 16x16 HDMI matrix.
+
+  Inputs and outputs are numbered from 1.
+
+  Example Kramer devices: VS-1616D, VS-3232DN
+  """
+
+  def route(self, output: int, input: int) -> None:
+    """
+    Route the specified input to the specified output
+    """
+
+  def route_many(self, routes: Mapping[int, int]) -> None:
+    """
+    Apply several routes at once, given as a mapping of output to input. Only
+    routes that differ from the current routing are sent to the device.
+    """
+
+  def source_for(self, output: int) -> int:
+    """
+    Returns the input number routed to the specified output
+    """
+
+  def lock(self) -> None:
+     """
+     Lock front panel
+     """
+
+  def unlock(self) -> None:
+     """
+     Unlock front panel
+     """
+
+  def update(self) -> None:
+    """
+    Refresh device state, including the full routing table.
+    """
+
+  def close(self) -> None:
+    """
+    Release the connection to the device.
+    """
+
+  @property
+  def routes(self) -> dict[int, int]:
+    """
+    Returns the routing table as a mapping of output to input
+    """
+
+  @property
+  def is_locked(self) -> bool:
+    """ Returns `true` when front panel is locked, `false` otherwise.
+    
+    Note that the device can still be controlled remotely when front panel is
+    locked.
+    """
+
+  @property
+  def input_count(self) -> int:
+    """
+    Returns the number of inputs the switch has
+    """
+
+  @property
+  def output_count(self) -> int:
+    """
+    Returns the number of outputs the switch has
+    """
@@ -28,6 +28,67 @@ class MediaSwitch(Protocol):
     Refresh device state.
     """
 
+  def close(self) -> None:
+    """
+    Release the connection to the device.
+    """
+
+  @property
+  def selected_source(self) -> int:
+    """
+    Returns the input number of the selected source
+    """
+
+  @property
+  def is_locked(self) -> bool:
+    """ Returns `true` when front panel is locked, `false` otherwise.
+    
+    Note that the device can still be controlled remotely when front panel is
+    locked.
+    """
+
+  @property
+  def input_count(self) -> int:
+    """
+    Returns the number of inputs the switch has
+    """
+
+  @property
+  def output_count(self) -> int:
+    """
+    Returns the number of outputs the switch has
+    """
+
+class AsyncMediaSwitch(Protocol):
+  """
+  asyncio counterpart to `MediaSwitch`, whose device operations are awaitable.
+  """
+
+  async def select_source(self, input: int) -> None:
+    """
+    Select the specified video input
+    """
+
+  async def lock(self) -> None:
+     """
+     Lock front panel
+     """
+
+  async def unlock(self) -> None:
+     """
+     Unlock front panel
+     """
+
+  async def update(self) -> None:
+    """
+    Refresh device state.
+    """
+
+  async def close(self) -> None:
+    """
+    Release the connection to the device.
+    """
+
   @property
   def selected_source(self) -> int:
     """
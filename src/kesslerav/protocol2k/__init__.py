@@ -3,20 +3,140 @@ Encapsulates Protocol 2000 communication and devices
 """
 from typing import Optional
 
-from ..media_switch import MediaSwitch as MediaSwitchProtocol
-from .io import TcpDevice, TcpEndpoint
-from .media_switch import MediaSwitch
+from ..constants import DISCOVERY_EAGER
+from ..matrix_switch import MatrixSwitch as MatrixSwitchProtocol
+from ..media_switch import \
+  AsyncMediaSwitch as AsyncMediaSwitchProtocol, \
+  MediaSwitch as MediaSwitchProtocol
+from .async_io import AsyncTcpDevice
+from .capture import WireCapture
+from .health import CircuitBreaker, CircuitState
+from .io import InstructionBatch, TcpDevice, TcpEndpoint
+from .matrix_switch import MatrixSwitch
+from .media_switch import AsyncMediaSwitch, MediaSwitch
+from .metrics import METRICS, MetricsRegistry
+from .udp import UdpDevice, UdpEndpoint, UdpTransport
+from .worker import WorkerDevice
 
 def get_tcp_media_switch(
     host: str,
     port: Optional[int] = None,
     timeout_sec: Optional[float] = None,
-    machine_id: Optional[int] = None
+    machine_id: Optional[int] = None,
+    pipelined: bool = False,
+    max_age_sec: Optional[float] = None,
+    stale_while_revalidate: bool = False,
+    discovery: str = DISCOVERY_EAGER,
+    coalesce_window_sec: Optional[float] = None,
+    threaded: bool = False,
+    capture: Optional[WireCapture] = None
+  ) -> MediaSwitchProtocol:
+  if timeout_sec is None:
+    # Let `TcpEndpoint` manage timeout
+    endpoint = TcpEndpoint(host, port)
+  else:
+    endpoint = TcpEndpoint(host, port, timeout_sec)
+  tcp_device = TcpDevice(endpoint, pipelined = pipelined, capture = capture)
+  # A worker thread owns the connection for switches shared between threads
+  device = WorkerDevice(tcp_device) if threaded else tcp_device
+  return MediaSwitch(
+    device,
+    machine_id,
+    max_age_sec = max_age_sec,
+    stale_while_revalidate = stale_while_revalidate,
+    discovery = discovery,
+    coalesce_window_sec = coalesce_window_sec
+  )
+
+def get_udp_media_switch(
+    host: str,
+    port: Optional[int] = None,
+    timeout_sec: Optional[float] = None,
+    machine_id: Optional[int] = None,
+    pipelined: bool = False,
+    max_age_sec: Optional[float] = None,
+    stale_while_revalidate: bool = False,
+    discovery: str = DISCOVERY_EAGER,
+    transport: Optional[UdpTransport] = None,
+    coalesce_window_sec: Optional[float] = None
+  ) -> MediaSwitchProtocol:
+  if timeout_sec is None:
+    # Let `UdpEndpoint` manage timeout
+    endpoint = UdpEndpoint(host, port)
+  else:
+    endpoint = UdpEndpoint(host, port, timeout_sec)
+  # Devices without their own transport share a single socket
+  udp_device = UdpDevice(endpoint, transport, pipelined = pipelined)
+  return MediaSwitch(
+    udp_device,
+    machine_id,
+    max_age_sec = max_age_sec,
+    stale_while_revalidate = stale_while_revalidate,
+    discovery = discovery,
+    coalesce_window_sec = coalesce_window_sec
+  )
+
+def get_serial_media_switch(
+    path: str,
+    baud_rate: Optional[int] = None,
+    timeout_sec: Optional[float] = None,
+    machine_id: Optional[int] = None,
+    pipelined: bool = False,
+    max_age_sec: Optional[float] = None,
+    stale_while_revalidate: bool = False,
+    discovery: str = DISCOVERY_EAGER,
+    coalesce_window_sec: Optional[float] = None
   ) -> MediaSwitchProtocol:
+  # Serial ports rely on POSIX-only modules, so are only loaded when used
+  from .serial_bus import SerialDevice, SerialEndpoint
+  if baud_rate is None:
+    baud_rate = SerialEndpoint.DEFAULT_BAUD_RATE
+  if timeout_sec is None:
+    # Let `SerialEndpoint` manage timeout
+    endpoint = SerialEndpoint(path, baud_rate)
+  else:
+    endpoint = SerialEndpoint(path, baud_rate, timeout_sec)
+  # Switches on a shared bus must be addressed individually, so the "all
+  # machines" override does not apply
+  if machine_id is None:
+    machine_id = SerialDevice.DEFAULT_MACHINE_ID
+  serial_device = SerialDevice(endpoint, machine_id, pipelined = pipelined)
+  return MediaSwitch(
+    serial_device,
+    machine_id,
+    max_age_sec = max_age_sec,
+    stale_while_revalidate = stale_while_revalidate,
+    discovery = discovery,
+    coalesce_window_sec = coalesce_window_sec
+  )
+
+def get_tcp_matrix_switch(
+    host: str,
+    port: Optional[int] = None,
+    timeout_sec: Optional[float] = None,
+    machine_id: Optional[int] = None
+  ) -> MatrixSwitchProtocol:
   if timeout_sec is None:
     # Let `TcpEndpoint` manage timeout
     endpoint = TcpEndpoint(host, port)
   else:
     endpoint = TcpEndpoint(host, port, timeout_sec)
   tcp_device = TcpDevice(endpoint)
-  return MediaSwitch(tcp_device, machine_id)
\ No newline at end of file
+  return MatrixSwitch(tcp_device, machine_id)
+
+async def get_async_tcp_media_switch(
+    host: str,
+    port: Optional[int] = None,
+    timeout_sec: Optional[float] = None,
+    machine_id: Optional[int] = None,
+    pipelined: bool = False
+  ) -> AsyncMediaSwitchProtocol:
+  if timeout_sec is None:
+    # Let `TcpEndpoint` manage timeout
+    endpoint = TcpEndpoint(host, port)
+  else:
+    endpoint = TcpEndpoint(host, port, timeout_sec)
+  tcp_device = AsyncTcpDevice(endpoint, pipelined = pipelined)
+  media_switch = AsyncMediaSwitch(tcp_device, machine_id)
+  await media_switch.update()
+  return media_switch
@@ -0,0 +1,228 @@
+import asyncio
+import time
+
+from ..constants import LOGGER
+from typing import Optional
+
+from .io import \
+  Codec, FrameDecoder, Instruction, ResponseCorrelator, TcpDevice, TcpEndpoint
+
+class AsyncTcpConnection:
+  """
+  Long-lived asyncio stream connection to a Protocol 2000 device
+  """
+
+  def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    self._reader = reader
+    self._writer = writer
+    self._decoder = FrameDecoder(TcpDevice.BUFFER_SIZE_BYTES)
+    self._created_at = time.monotonic()
+    self._last_used_at = self._created_at
+
+  @property
+  def reader(self) -> asyncio.StreamReader:
+    return self._reader
+
+  @property
+  def writer(self) -> asyncio.StreamWriter:
+    return self._writer
+
+  @property
+  def decoder(self) -> FrameDecoder:
+    return self._decoder
+
+  def touch(self) -> None:
+    self._last_used_at = time.monotonic()
+
+  def is_expired(
+      self,
+      idle_timeout_sec: Optional[float],
+      max_lifetime_sec: Optional[float]
+    ) -> bool:
+    now = time.monotonic()
+    if idle_timeout_sec is not None and now - self._last_used_at >= idle_timeout_sec:
+      return True
+    if max_lifetime_sec is not None and now - self._created_at >= max_lifetime_sec:
+      return True
+    return False
+
+  async def close(self) -> None:
+    self._writer.close()
+    try:
+      await self._writer.wait_closed()
+    except (ConnectionError, OSError) as ex:
+      LOGGER.debug('Failed closing device connection: %s', ex)
+
+class AsyncTcpDevice:
+  """
+  Manages asyncio TCP I/O for a specific Protocol 2000-based device
+
+  Mirrors `TcpDevice`: a single connection is kept open between calls and
+  recycled on failure or expiry, and `pipelined` batches are written at once
+  and share a single timeout.
+  """
+
+  def __init__(
+      self,
+      endpoint: TcpEndpoint,
+      keep_alive: bool = True,
+      idle_timeout_sec: Optional[float] = TcpDevice.DEFAULT_IDLE_TIMEOUT_SEC,
+      max_lifetime_sec: Optional[float] = TcpDevice.DEFAULT_MAX_LIFETIME_SEC,
+      pipelined: bool = False
+    ):
+    self._endpoint = endpoint
+    self._keep_alive = keep_alive
+    self._idle_timeout_sec = idle_timeout_sec
+    self._max_lifetime_sec = max_lifetime_sec
+    self._pipelined = pipelined
+    self._connection: Optional[AsyncTcpConnection] = None
+    # Created lazily, so the device can be constructed outside the event loop
+    self._lock: Optional[asyncio.Lock] = None
+
+    self._connections_opened = 0
+    self._connections_reused = 0
+    self._last_connection_reused = False
+
+  @property
+  def pipelined(self) -> bool:
+    return self._pipelined
+
+  @property
+  def connections_opened(self) -> int:
+    return self._connections_opened
+
+  @property
+  def connections_reused(self) -> int:
+    return self._connections_reused
+
+  @property
+  def last_connection_reused(self) -> bool:
+    return self._last_connection_reused
+
+  async def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      pipelined: Optional[bool] = None
+    ) -> list[Instruction]:
+    """
+    Sends the instructions to the device, returning all instructions received
+    in response, in the order they were received.
+    """
+    if pipelined is None:
+      pipelined = self._pipelined
+    if isinstance(instructions, Instruction):
+      instructions = [instructions]
+    results: list[Instruction] = []
+
+    async with self._get_lock():
+      try:
+        await self._process_instructions(list(instructions), results, pipelined)
+      except Exception as ex:
+        LOGGER.error('Failed communicating with device: %s', ex)
+        await self._close_connection()
+      finally:
+        if not self._keep_alive:
+          await self._close_connection()
+
+    return results
+
+  async def close(self) -> None:
+    """
+    Closes the connection to the device, if one is open
+    """
+    async with self._get_lock():
+      await self._close_connection()
+
+  def _get_lock(self) -> asyncio.Lock:
+    if self._lock is None:
+      self._lock = asyncio.Lock()
+    return self._lock
+
+  async def _process_instructions(
+      self,
+      instructions: list[Instruction],
+      results: list[Instruction],
+      pipelined: bool
+    ) -> None:
+    index = 0
+    while index < len(instructions):
+      connection, reused = await self._acquire_connection()
+      try:
+        while index < len(instructions):
+          if pipelined:
+            batch = instructions[index:]
+          else:
+            batch = instructions[index:index + 1]
+          results.extend(await self._exchange(batch, connection))
+          index += len(batch)
+      except (ConnectionError, OSError) as ex:
+        await self._close_connection()
+        if not reused:
+          raise
+        LOGGER.info('Connection to device lost, reconnecting: %s', ex)
+
+  async def _acquire_connection(self) -> tuple[AsyncTcpConnection, bool]:
+    connection = self._connection
+    if connection is not None and connection.is_expired(
+        self._idle_timeout_sec,
+        self._max_lifetime_sec
+      ):
+      LOGGER.debug('Recycling expired device connection')
+      await self._close_connection()
+      connection = None
+
+    reused = connection is not None
+    if connection is None:
+      connection = await self._create_connection()
+      self._connection = connection
+      self._connections_opened += 1
+    else:
+      self._connections_reused += 1
+
+    connection.touch()
+    self._last_connection_reused = reused
+    return (connection, reused)
+
+  async def _create_connection(self) -> AsyncTcpConnection:
+    async with asyncio.timeout(self._endpoint.timeout_sec):
+      (reader, writer) = await asyncio.open_connection(
+        self._endpoint.host,
+        self._endpoint.port
+      )
+    return AsyncTcpConnection(reader, writer)
+
+  async def _close_connection(self) -> None:
+    connection = self._connection
+    self._connection = None
+    if connection is not None:
+      await connection.close()
+
+  async def _exchange(
+      self,
+      instructions: list[Instruction],
+      connection: AsyncTcpConnection
+    ) -> list[Instruction]:
+    connection.writer.write(Codec.encode_many(instructions))
+    await connection.writer.drain()
+
+    correlator = ResponseCorrelator(instructions)
+    result: list[Instruction] = []
+    try:
+      async with asyncio.timeout(self._endpoint.timeout_sec):
+        while not correlator.is_complete:
+          data = await connection.reader.read(TcpDevice.BUFFER_SIZE_BYTES)
+          if not data:
+            raise ConnectionResetError('Connection closed by device')
+          for instruction in connection.decoder.feed(data):
+            result.append(instruction)
+            if correlator.accept(instruction) is None:
+              LOGGER.debug('Received unsolicited instruction: %s', instruction)
+    except TimeoutError:
+      LOGGER.info(
+        'Timed out waiting for %d of %d responses. Ignoring, since another '
+        'task may have processed the responses already.',
+        len(correlator.pending),
+        len(instructions)
+      )
+
+    return result
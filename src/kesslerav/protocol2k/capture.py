@@ -0,0 +1,259 @@
+"""
+Binary capture of the frames exchanged with a device.
+
+A capture file is a 16-byte header followed by fixed-size 16-byte records, one
+per 4-byte frame:
+
+  Header: magic (8 bytes), format version (uint32), record size (uint32)
+  Record: timestamp in nanoseconds since the epoch (uint64), direction (uint8),
+          3 bytes of padding, frame exactly as sent or received (4 bytes)
+
+All integers are little-endian. Fixed-size records keep files seekable, so
+captures can be memory-mapped and read at any offset (see `replay`.)
+"""
+import os
+import socket
+import struct
+import threading
+import time
+
+from enum import IntEnum, unique
+from pathlib import Path
+from typing import Optional
+
+from ..constants import LOGGER
+from .io import Instruction
+
+CAPTURE_MAGIC: bytes = b'KAVCAP\x00\x00'
+CAPTURE_VERSION: int = 1
+
+HEADER_FORMAT = struct.Struct('<8sII')
+RECORD_FORMAT = struct.Struct('<QB3x4s')
+# Offsets of fields within a record
+RECORD_DIRECTION_OFFSET: int = 8
+RECORD_FRAME_OFFSET: int = 12
+
+@unique
+class Direction(IntEnum):
+  """
+  Which way a captured frame travelled
+  """
+  SENT = 0
+  RECEIVED = 1
+
+class WireCapture:
+  """
+  Appends timestamped, direction-tagged frames to a capture file.
+
+  Once the file would grow beyond `max_bytes`, it is rotated in the manner of
+  `logging.handlers.RotatingFileHandler`: `capture.bin` is renamed to
+  `capture.bin.1`, `capture.bin.1` to `capture.bin.2` and so on, keeping at most
+  `backup_count` old files.
+  """
+  DEFAULT_MAX_BYTES: int = 64 * 1024 * 1024
+  DEFAULT_BACKUP_COUNT: int = 4
+  # Records buffered in memory before being written out
+  BUFFER_SIZE_BYTES: int = RECORD_FORMAT.size * 1024
+
+  def __init__(
+      self,
+      path: str | os.PathLike,
+      max_bytes: int = DEFAULT_MAX_BYTES,
+      backup_count: int = DEFAULT_BACKUP_COUNT
+    ):
+    if max_bytes < HEADER_FORMAT.size + RECORD_FORMAT.size:
+      raise ValueError(
+        f'max_bytes must fit the header and at least one record. Received: {max_bytes}'
+      )
+    if backup_count < 0:
+      raise ValueError(f'backup_count must not be negative. Received: {backup_count}')
+    self._path = Path(path)
+    self._max_bytes = max_bytes
+    self._backup_count = backup_count
+    self._lock = threading.Lock()
+    self._file = None
+    self._file_size = 0
+    self._records_written = 0
+    self._rotations = 0
+    self._open()
+
+  @property
+  def path(self) -> Path:
+    return self._path
+
+  @property
+  def records_written(self) -> int:
+    return self._records_written
+
+  @property
+  def rotations(self) -> int:
+    return self._rotations
+
+  @property
+  def is_closed(self) -> bool:
+    return self._file is None
+
+  def write(
+      self,
+      direction: Direction,
+      data: bytes | bytearray | memoryview,
+      timestamp_ns: Optional[int] = None
+    ) -> None:
+    """
+    Records whole frames from the data, which must be a multiple of the frame
+    size, all with the same timestamp
+    """
+    if len(data) % Instruction.SIZE_BYTES != 0:
+      raise ValueError(
+        f'Data must contain whole {Instruction.SIZE_BYTES}-byte frames. '
+        f'Received: {len(data)} bytes'
+      )
+    if timestamp_ns is None:
+      timestamp_ns = time.time_ns()
+    frame_size = Instruction.SIZE_BYTES
+    count = len(data) // frame_size
+    records = bytearray(RECORD_FORMAT.size * count)
+    for index in range(count):
+      RECORD_FORMAT.pack_into(
+        records,
+        index * RECORD_FORMAT.size,
+        timestamp_ns,
+        direction,
+        bytes(data[index * frame_size:(index + 1) * frame_size])
+      )
+
+    with self._lock:
+      if self._file is None:
+        return
+      view = memoryview(records)
+      while len(view) > 0:
+        available = (self._max_bytes - self._file_size) // RECORD_FORMAT.size * RECORD_FORMAT.size
+        if available == 0:
+          self._rotate()
+          continue
+        chunk = view[:available]
+        self._file.write(chunk)
+        self._file_size += len(chunk)
+        view = view[len(chunk):]
+      self._records_written += count
+
+  def wrap(self, conn: socket.socket) -> 'CapturedSocket':
+    """
+    Returns a socket that records every frame sent or received through `conn`
+    """
+    return CapturedSocket(conn, self)
+
+  def flush(self) -> None:
+    with self._lock:
+      if self._file is not None:
+        self._file.flush()
+
+  def close(self) -> None:
+    with self._lock:
+      if self._file is not None:
+        self._file.close()
+        self._file = None
+
+  def __enter__(self) -> 'WireCapture':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def _open(self) -> None:
+    self._file = open(self._path, 'ab', buffering = WireCapture.BUFFER_SIZE_BYTES)
+    self._file_size = self._file.tell()
+    if self._file_size == 0:
+      self._file.write(HEADER_FORMAT.pack(CAPTURE_MAGIC, CAPTURE_VERSION, RECORD_FORMAT.size))
+      self._file_size = HEADER_FORMAT.size
+    elif self._file_size < HEADER_FORMAT.size:
+      raise ValueError(f'Not a capture file: {self._path}')
+
+  def _rotate(self) -> None:
+    self._file.close()
+    if self._backup_count > 0:
+      for index in range(self._backup_count - 1, 0, -1):
+        source = _backup_path(self._path, index)
+        if source.exists():
+          source.replace(_backup_path(self._path, index + 1))
+      self._path.replace(_backup_path(self._path, 1))
+    else:
+      self._path.unlink()
+    self._rotations += 1
+    LOGGER.debug('Rotated capture file %s', self._path)
+    self._open()
+
+class CapturedSocket:
+  """
+  Socket wrapper that records the frames passing through it.
+
+  Reads that end part way through a frame are held back until the rest of the
+  frame arrives, so only whole frames are recorded. All other socket methods
+  are passed through, so the wrapper can be selected on and reconfigured like
+  the socket itself.
+  """
+
+  def __init__(self, conn: socket.socket, capture: WireCapture):
+    self._socket = conn
+    self._capture = capture
+    self._partial_sent = b''
+    self._partial_received = b''
+
+  @property
+  def socket(self) -> socket.socket:
+    return self._socket
+
+  def sendall(self, data: bytes) -> None:
+    self._socket.sendall(data)
+    self._partial_sent = self._record(Direction.SENT, self._partial_sent, data)
+
+  def send(self, data: bytes) -> int:
+    count = self._socket.send(data)
+    self._partial_sent = self._record(Direction.SENT, self._partial_sent, data[:count])
+    return count
+
+  def recv(self, bufsize: int, *args) -> bytes:
+    data = self._socket.recv(bufsize, *args)
+    self._partial_received = self._record(Direction.RECEIVED, self._partial_received, data)
+    return data
+
+  def recv_into(self, buffer, nbytes: int = 0, *args) -> int:
+    count = self._socket.recv_into(buffer, nbytes, *args)
+    data = memoryview(buffer)[:count]
+    self._partial_received = self._record(Direction.RECEIVED, self._partial_received, data)
+    return count
+
+  def fileno(self) -> int:
+    return self._socket.fileno()
+
+  def close(self) -> None:
+    self._socket.close()
+
+  def __getattr__(self, name: str):
+    return getattr(self._socket, name)
+
+  def _record(self, direction: Direction, partial: bytes, data) -> bytes:
+    if len(partial) > 0:
+      data = partial + bytes(data)
+    whole = len(data) // Instruction.SIZE_BYTES * Instruction.SIZE_BYTES
+    if whole > 0:
+      self._capture.write(direction, data[:whole])
+    return bytes(data[whole:])
+
+def _backup_path(path: Path, index: int) -> Path:
+  return path.with_name(f'{path.name}.{index}')
+
+def capture_paths(path: str | os.PathLike) -> list[Path]:
+  """
+  Returns the capture file and its rotated backups that exist, oldest first
+  """
+  path = Path(path)
+  backups = []
+  index = 1
+  while _backup_path(path, index).exists():
+    backups.append(_backup_path(path, index))
+    index += 1
+  paths = list(reversed(backups))
+  if path.exists():
+    paths.append(path)
+  return paths
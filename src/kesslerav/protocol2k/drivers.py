@@ -0,0 +1,102 @@
+"""
+Protocol 2000 drivers for `kesslerav.drivers.DRIVERS`
+"""
+from typing import Optional
+
+from ..constants import DISCOVERY_EAGER
+from ..url_parser import Endpoint
+from . import \
+  get_async_tcp_media_switch, get_serial_media_switch, get_tcp_matrix_switch, \
+  get_tcp_media_switch, get_udp_media_switch
+
+class TcpDriver:
+  def media_switch(
+      self,
+      endpoint: Endpoint,
+      timeout_sec: Optional[float] = None,
+      machine_id: Optional[int] = None,
+      discovery: str = DISCOVERY_EAGER
+    ):
+    return get_tcp_media_switch(
+      host = endpoint.host,
+      port = endpoint.port,
+      timeout_sec = timeout_sec,
+      machine_id = machine_id,
+      discovery = discovery
+    )
+
+  def matrix_switch(
+      self,
+      endpoint: Endpoint,
+      timeout_sec: Optional[float] = None,
+      machine_id: Optional[int] = None
+    ):
+    return get_tcp_matrix_switch(
+      host = endpoint.host,
+      port = endpoint.port,
+      timeout_sec = timeout_sec,
+      machine_id = machine_id
+    )
+
+  async def async_media_switch(
+      self,
+      endpoint: Endpoint,
+      timeout_sec: Optional[float] = None,
+      machine_id: Optional[int] = None
+    ):
+    return await get_async_tcp_media_switch(
+      host = endpoint.host,
+      port = endpoint.port,
+      timeout_sec = timeout_sec,
+      machine_id = machine_id
+    )
+
+class UdpDriver:
+  def media_switch(
+      self,
+      endpoint: Endpoint,
+      timeout_sec: Optional[float] = None,
+      machine_id: Optional[int] = None,
+      discovery: str = DISCOVERY_EAGER
+    ):
+    return get_udp_media_switch(
+      host = endpoint.host,
+      port = endpoint.port,
+      timeout_sec = timeout_sec,
+      machine_id = machine_id,
+      discovery = discovery
+    )
+
+class SerialDriver:
+  def media_switch(
+      self,
+      endpoint: Endpoint,
+      timeout_sec: Optional[float] = None,
+      machine_id: Optional[int] = None,
+      discovery: str = DISCOVERY_EAGER
+    ):
+    if endpoint.path is None:
+      raise ValueError('No serial port path specified in url')
+    options = endpoint.options
+    if machine_id is None and 'machine_id' in options:
+      machine_id = _int_option(options, 'machine_id')
+    return get_serial_media_switch(
+      path = endpoint.path,
+      baud_rate = _int_option(options, 'baud'),
+      timeout_sec = timeout_sec,
+      machine_id = machine_id,
+      discovery = discovery
+    )
+
+def _int_option(options: dict[str, str], name: str) -> Optional[int]:
+  value = options.get(name)
+  if value is None:
+    return None
+  try:
+    return int(value)
+  except ValueError:
+    raise ValueError(f'Invalid {name} specified in url: {value}') from None
+
+TCP_DRIVER = TcpDriver()
+UDP_DRIVER = UdpDriver()
+SERIAL_DRIVER = SerialDriver()
@@ -0,0 +1,463 @@
+"""
+Protocol 2000 TCP emulator, hosting virtual switches on local ports.
+
+Intended as a target for benchmarks and soak tests. Each virtual switch listens
+on its own port and can inject latency and jitter, fragment its writes, send
+unsolicited front panel events and limit concurrent connections.
+
+Usage:
+  python -m kesslerav.protocol2k.emulator [--switches N] [--port PORT] ...
+"""
+import argparse
+import asyncio
+import random
+import threading
+
+from ..constants import LOGGER
+from typing import Optional
+
+from .io import Codec, Command, FrameDecoder, Instruction
+
+# Replies and front panel events set this bit on the command ID
+_REPLY_BIT = 0b01000000
+
+def _reply_bytes(instructions: list[Instruction]) -> bytes:
+  data = bytearray(Codec.encode_many(instructions))
+  for index in range(0, len(data), Instruction.SIZE_BYTES):
+    data[index] |= _REPLY_BIT
+  return bytes(data)
+
+class VirtualSwitch:
+  """
+  State and command handling of an emulated Protocol 2000 matrix switch
+
+  A media switch is a matrix with a single output.
+  """
+  MAX_COUNT: int = 127
+  # Reported by `IDENTIFY_MACHINE`, for the machine name and firmware version
+  MACHINE_NAME: int = 16
+  FIRMWARE_VERSION: int = 1
+
+  def __init__(self, input_count: int = 16, output_count: int = 1, machine_id: int = 1):
+    for (name, count) in (('input_count', input_count), ('output_count', output_count)):
+      if count < 1 or count > VirtualSwitch.MAX_COUNT:
+        raise ValueError(
+          f'{name} must be between 1 and {VirtualSwitch.MAX_COUNT}. Received: {count}'
+        )
+    self._input_count = input_count
+    self._output_count = output_count
+    self._machine_id = machine_id
+    self._routes = [1] * output_count
+    self._is_locked = False
+    self._lock = threading.Lock()
+
+  @property
+  def input_count(self) -> int:
+    return self._input_count
+
+  @property
+  def output_count(self) -> int:
+    return self._output_count
+
+  @property
+  def machine_id(self) -> int:
+    return self._machine_id
+
+  @property
+  def routes(self) -> dict[int, int]:
+    """
+    Input routed to each output, as `{output: input}`
+    """
+    with self._lock:
+      return {output: input for (output, input) in enumerate(self._routes, 1)}
+
+  @property
+  def is_locked(self) -> bool:
+    return self._is_locked
+
+  def handle(self, request: Instruction) -> Optional[Instruction]:
+    """
+    Applies the request, returning the reply, or `None` when the request is
+    addressed to a different machine.
+    """
+    if request.machine_id not in (self._machine_id, Instruction.DEFAULT_MACHINE_ID):
+      return None
+
+    (cmd_id, input_value, output_value, _) = request.frame_tuple
+    with self._lock:
+      match cmd_id:
+        case Command.SWITCH_VIDEO:
+          if not self._route(output_value, input_value):
+            return self._error()
+          return self._reply(cmd_id, input_value, output_value)
+        case Command.RECALL_VIDEO_STATUS:
+          return self._reply(cmd_id, input_value, output_value)
+        case Command.QUERY_OUTPUT_STATUS:
+          if output_value < 1 or output_value > self._output_count:
+            return self._error()
+          return self._reply(cmd_id, input_value, self._routes[output_value - 1])
+        case Command.PANEL_LOCK:
+          self._is_locked = (input_value == 1)
+          return self._reply(cmd_id, input_value, output_value)
+        case Command.QUERY_PANEL_LOCK:
+          return self._reply(cmd_id, input_value, int(self._is_locked))
+        case Command.IDENTIFY_MACHINE:
+          if input_value == 1:
+            return self._reply(cmd_id, input_value, VirtualSwitch.MACHINE_NAME)
+          return self._reply(cmd_id, input_value, VirtualSwitch.FIRMWARE_VERSION)
+        case Command.DEFINE_MACHINE:
+          if input_value == 1:
+            return self._reply(cmd_id, input_value, self._input_count)
+          elif input_value == 2:
+            return self._reply(cmd_id, input_value, self._output_count)
+          return self._reply(cmd_id, input_value, 0)
+        case _:
+          return self._error()
+
+  def press_input(self, input: int, output: int = 0) -> Optional[Instruction]:
+    """
+    Selects an input from the front panel, returning the event the switch
+    reports, or `None` when the panel is locked or the selection is invalid.
+    """
+    with self._lock:
+      if self._is_locked or not self._route(output, input):
+        return None
+      return self._reply(Command.SWITCH_VIDEO, input, output)
+
+  def press_lock(self, is_locked: bool) -> Instruction:
+    """
+    Locks or unlocks the front panel, returning the event the switch reports
+    """
+    with self._lock:
+      self._is_locked = is_locked
+      return self._reply(Command.PANEL_LOCK, int(is_locked), 0)
+
+  def _route(self, output: int, input: int) -> bool:
+    if input > self._input_count or output > self._output_count:
+      return False
+    if output == 0:
+      # Output 0 addresses every output
+      self._routes = [input] * self._output_count
+    else:
+      self._routes[output - 1] = input
+    return True
+
+  def _reply(self, cmd_id: int, input_value: int, output_value: int) -> Instruction:
+    return Instruction(cmd_id, input_value, output_value, self._machine_id)
+
+  def _error(self) -> Instruction:
+    return Instruction(Command.ERROR, 0, 0, self._machine_id)
+
+class EmulatedSwitch:
+  """
+  A virtual switch served on a local TCP port
+
+  `latency_sec` delays the reply to each read, with up to `jitter_sec` added or
+  removed at random. With `fragment_size_bytes`, replies are written in chunks
+  of that size, `fragment_interval_sec` apart. With `event_interval_sec`, the
+  front panel is used at random about that often. Connections beyond
+  `max_connections` are accepted and closed immediately.
+  """
+
+  def __init__(
+      self,
+      switch: VirtualSwitch,
+      host: str,
+      port: int,
+      latency_sec: float = 0.0,
+      jitter_sec: float = 0.0,
+      fragment_size_bytes: Optional[int] = None,
+      fragment_interval_sec: float = 0.0,
+      event_interval_sec: Optional[float] = None,
+      max_connections: Optional[int] = None,
+      rng: Optional[random.Random] = None
+    ):
+    if fragment_size_bytes is not None and fragment_size_bytes < 1:
+      raise ValueError(
+        f'fragment_size_bytes must be at least 1. Received: {fragment_size_bytes}'
+      )
+    self._switch = switch
+    self._host = host
+    self._port = port
+    self._latency_sec = latency_sec
+    self._jitter_sec = jitter_sec
+    self._fragment_size_bytes = fragment_size_bytes
+    self._fragment_interval_sec = fragment_interval_sec
+    self._event_interval_sec = event_interval_sec
+    self._max_connections = max_connections
+    self._rng = rng if rng is not None else random.Random()
+
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._server: Optional[asyncio.Server] = None
+    self._events_task: Optional[asyncio.Task] = None
+    self._writers: dict[asyncio.StreamWriter, asyncio.Lock] = {}
+    self._connections_accepted = 0
+    self._connections_rejected = 0
+    self._requests_handled = 0
+
+  @property
+  def switch(self) -> VirtualSwitch:
+    return self._switch
+
+  @property
+  def host(self) -> str:
+    return self._host
+
+  @property
+  def port(self) -> int:
+    """
+    The port being served, once started
+    """
+    return self._port
+
+  @property
+  def url(self) -> str:
+    return f'tcp://{self._host}:{self._port}'
+
+  @property
+  def connection_count(self) -> int:
+    return len(self._writers)
+
+  @property
+  def connections_accepted(self) -> int:
+    return self._connections_accepted
+
+  @property
+  def connections_rejected(self) -> int:
+    return self._connections_rejected
+
+  @property
+  def requests_handled(self) -> int:
+    return self._requests_handled
+
+  def press_input(self, input: int, output: int = 0) -> None:
+    """
+    Selects an input from the front panel, reporting it to every connection
+    """
+    self._broadcast(self._switch.press_input(input, output))
+
+  def press_lock(self, is_locked: bool) -> None:
+    """
+    Locks or unlocks the front panel, reporting it to every connection
+    """
+    self._broadcast(self._switch.press_lock(is_locked))
+
+  async def start(self) -> None:
+    self._loop = asyncio.get_running_loop()
+    self._server = await asyncio.start_server(self._serve, self._host, self._port)
+    self._port = self._server.sockets[0].getsockname()[1]
+    if self._event_interval_sec is not None:
+      self._events_task = asyncio.create_task(self._generate_events())
+
+  async def stop(self) -> None:
+    if self._events_task is not None:
+      self._events_task.cancel()
+      self._events_task = None
+    if self._server is not None:
+      self._server.close()
+    for writer in list(self._writers):
+      writer.close()
+    if self._server is not None:
+      await self._server.wait_closed()
+      self._server = None
+    self._loop = None
+
+  def _broadcast(self, event: Optional[Instruction]) -> None:
+    loop = self._loop
+    if event is None or loop is None:
+      return
+    data = _reply_bytes([event])
+    def send_all() -> None:
+      for writer in list(self._writers):
+        asyncio.ensure_future(self._write(writer, data))
+    loop.call_soon_threadsafe(send_all)
+
+  async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    if self._max_connections is not None and len(self._writers) >= self._max_connections:
+      self._connections_rejected += 1
+      writer.close()
+      return
+
+    self._connections_accepted += 1
+    self._writers[writer] = asyncio.Lock()
+    decoder = FrameDecoder()
+    try:
+      while True:
+        data = await reader.read(4096)
+        if not data:
+          break
+        requests = list(decoder.feed(data))
+        replies = [
+          reply for reply in map(self._switch.handle, requests)
+          if reply is not None
+        ]
+        self._requests_handled += len(requests)
+        if len(replies) == 0:
+          continue
+        delay = self._latency_sec + self._rng.uniform(-self._jitter_sec, self._jitter_sec)
+        if delay > 0:
+          await asyncio.sleep(delay)
+        await self._write(writer, _reply_bytes(replies))
+    except (ConnectionError, OSError) as ex:
+      LOGGER.debug('Emulated switch connection failed: %s', ex)
+    finally:
+      self._writers.pop(writer, None)
+      writer.close()
+
+  async def _write(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+    lock = self._writers.get(writer)
+    if lock is None:
+      return
+    # Serialize writes, so events never land inside a fragmented reply
+    async with lock:
+      size = self._fragment_size_bytes or len(data)
+      try:
+        for index in range(0, len(data), size):
+          if index > 0 and self._fragment_interval_sec > 0:
+            await asyncio.sleep(self._fragment_interval_sec)
+          writer.write(data[index:index + size])
+          await writer.drain()
+      except (ConnectionError, OSError) as ex:
+        LOGGER.debug('Failed writing to emulated switch connection: %s', ex)
+
+  async def _generate_events(self) -> None:
+    while True:
+      await asyncio.sleep(self._rng.expovariate(1 / self._event_interval_sec))
+      if self._rng.random() < 0.9:
+        event = self._switch.press_input(self._rng.randint(1, self._switch.input_count))
+      else:
+        event = self._switch.press_lock(not self._switch.is_locked)
+      if event is not None:
+        data = _reply_bytes([event])
+        for writer in list(self._writers):
+          await self._write(writer, data)
+
+class Emulator:
+  """
+  Hosts emulated switches on an event loop running in a background thread
+
+  Switches may be added before or after `start()`. Use as a context manager to
+  start and stop the emulator.
+  """
+
+  def __init__(self, host: str = '127.0.0.1', seed: Optional[int] = None):
+    self._host = host
+    self._rng = random.Random(seed)
+    self._switches: list[EmulatedSwitch] = []
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._thread: Optional[threading.Thread] = None
+
+  @property
+  def switches(self) -> list[EmulatedSwitch]:
+    return list(self._switches)
+
+  @property
+  def urls(self) -> list[str]:
+    return [switch.url for switch in self._switches]
+
+  @property
+  def is_running(self) -> bool:
+    return self._loop is not None
+
+  def add_switch(
+      self,
+      input_count: int = 16,
+      output_count: int = 1,
+      machine_id: int = 1,
+      port: int = 0,
+      **options
+    ) -> EmulatedSwitch:
+    """
+    Adds a virtual switch served on `port`, or on a free port when 0. See
+    `EmulatedSwitch` for the remaining options.
+    """
+    switch = EmulatedSwitch(
+      VirtualSwitch(input_count, output_count, machine_id),
+      self._host,
+      port,
+      rng = random.Random(self._rng.random()),
+      **options
+    )
+    if self._loop is not None:
+      self._call(switch.start())
+    self._switches.append(switch)
+    return switch
+
+  def start(self) -> None:
+    if self._loop is not None:
+      raise RuntimeError('Emulator is already running')
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(
+      target = self._loop.run_forever,
+      name = 'kesslerav-emulator',
+      daemon = True
+    )
+    self._thread.start()
+    for switch in self._switches:
+      self._call(switch.start())
+
+  def stop(self) -> None:
+    loop = self._loop
+    if loop is None:
+      return
+    for switch in self._switches:
+      self._call(switch.stop())
+    loop.call_soon_threadsafe(loop.stop)
+    self._thread.join()
+    loop.close()
+    self._loop = None
+    self._thread = None
+
+  def __enter__(self) -> 'Emulator':
+    self.start()
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.stop()
+
+  def _call(self, coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+  parser.add_argument('--host', default = '127.0.0.1')
+  parser.add_argument('--port', type = int, default = 5000,
+    help = 'port of the first switch; the rest use consecutive ports (0: any free port)')
+  parser.add_argument('--switches', type = int, default = 1)
+  parser.add_argument('--inputs', type = int, default = 16)
+  parser.add_argument('--outputs', type = int, default = 1)
+  parser.add_argument('--machine-id', type = int, default = 1)
+  parser.add_argument('--latency-ms', type = float, default = 0.0)
+  parser.add_argument('--jitter-ms', type = float, default = 0.0)
+  parser.add_argument('--fragment-bytes', type = int, default = None)
+  parser.add_argument('--fragment-interval-ms', type = float, default = 0.0)
+  parser.add_argument('--event-interval-sec', type = float, default = None)
+  parser.add_argument('--max-connections', type = int, default = None)
+  parser.add_argument('--seed', type = int, default = None)
+  args = parser.parse_args()
+
+  emulator = Emulator(args.host, args.seed)
+  for index in range(args.switches):
+    emulator.add_switch(
+      input_count = args.inputs,
+      output_count = args.outputs,
+      machine_id = args.machine_id,
+      port = args.port + index if args.port != 0 else 0,
+      latency_sec = args.latency_ms / 1000,
+      jitter_sec = args.jitter_ms / 1000,
+      fragment_size_bytes = args.fragment_bytes,
+      fragment_interval_sec = args.fragment_interval_ms / 1000,
+      event_interval_sec = args.event_interval_sec,
+      max_connections = args.max_connections
+    )
+
+  with emulator:
+    for url in emulator.urls:
+      print(url, flush = True)
+    try:
+      threading.Event().wait()
+    except KeyboardInterrupt:
+      pass
+
+if __name__ == '__main__':
+  main()
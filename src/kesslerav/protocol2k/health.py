@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+
+from enum import IntEnum, unique
+from typing import Callable
+
+from ..constants import LOGGER
+
+@unique
+class CircuitState(IntEnum):
+  # Requests reach the device
+  CLOSED = 0
+  # Device is presumed unreachable; requests fail without touching the network
+  OPEN = 1
+  # Backoff has elapsed; the next request probes whether the device recovered
+  HALF_OPEN = 2
+
+class CircuitOpenError(ConnectionError):
+  """
+  Raised instead of contacting a device whose circuit is open
+  """
+
+  def __init__(self, retry_in_sec: float):
+    super().__init__(f'Device unavailable, retrying in {retry_in_sec:.2f}s')
+    self.retry_in_sec = retry_in_sec
+
+class CircuitBreaker:
+  """
+  Tracks the health of a device, so that requests to a device that is down fail
+  fast rather than each waiting out a connection timeout.
+
+  After `failure_threshold` consecutive failures the circuit opens. Once a
+  backoff delay has elapsed, a single request is let through as a probe: if it
+  succeeds the circuit closes, otherwise it reopens with the delay doubled, up to
+  `max_delay_sec`. Each delay is shortened by a random fraction of up to
+  `jitter`, so that devices that went down together are not all probed at once.
+  """
+  DEFAULT_FAILURE_THRESHOLD: int = 3
+  DEFAULT_BASE_DELAY_SEC: float = 1.0
+  DEFAULT_MAX_DELAY_SEC: float = 60.0
+  DEFAULT_JITTER: float = 0.5
+
+  def __init__(
+      self,
+      failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+      base_delay_sec: float = DEFAULT_BASE_DELAY_SEC,
+      max_delay_sec: float = DEFAULT_MAX_DELAY_SEC,
+      jitter: float = DEFAULT_JITTER,
+      clock: Callable[[], float] = time.monotonic,
+      rng: Callable[[], float] = random.random
+    ):
+    if failure_threshold < 1:
+      raise ValueError(f'Invalid failure threshold: {failure_threshold}')
+    if base_delay_sec <= 0 or max_delay_sec < base_delay_sec:
+      raise ValueError(f'Invalid backoff delays: {base_delay_sec}, {max_delay_sec}')
+    if not 0 <= jitter <= 1:
+      raise ValueError(f'Invalid jitter: {jitter}')
+    self._failure_threshold = failure_threshold
+    self._base_delay_sec = base_delay_sec
+    self._max_delay_sec = max_delay_sec
+    self._jitter = jitter
+    self._clock = clock
+    self._rng = rng
+    self._lock = threading.Lock()
+
+    self._state = CircuitState.CLOSED
+    self._consecutive_failures = 0
+    # Number of times the circuit has opened since the device last succeeded
+    self._backoff_attempts = 0
+    self._retry_at = 0.0
+    self._probe_in_flight = False
+    self._times_opened = 0
+    self._rejections = 0
+
+  @property
+  def state(self) -> CircuitState:
+    """
+    Current state. An open circuit whose backoff has elapsed is reported as
+    half-open, since the next request will be let through.
+    """
+    with self._lock:
+      if self._state == CircuitState.OPEN and self._clock() >= self._retry_at:
+        return CircuitState.HALF_OPEN
+      return self._state
+
+  @property
+  def is_available(self) -> bool:
+    """
+    Returns `True` when a request would be let through to the device
+    """
+    with self._lock:
+      return self._is_available()
+
+  @property
+  def retry_in_sec(self) -> float:
+    """
+    Time until the device will next be probed, or 0 while it is available
+    """
+    with self._lock:
+      if self._state != CircuitState.OPEN:
+        return 0.0
+      return max(0.0, self._retry_at - self._clock())
+
+  @property
+  def consecutive_failures(self) -> int:
+    return self._consecutive_failures
+
+  @property
+  def times_opened(self) -> int:
+    return self._times_opened
+
+  @property
+  def rejections(self) -> int:
+    """
+    Number of requests refused while the circuit was open
+    """
+    return self._rejections
+
+  def allow_request(self) -> bool:
+    """
+    Returns whether a request may contact the device. When the backoff has
+    elapsed, the caller is let through as the probe and must report its outcome
+    with `record_success` or `record_failure`.
+    """
+    with self._lock:
+      if not self._is_available():
+        self._rejections += 1
+        return False
+      if self._state == CircuitState.OPEN:
+        self._state = CircuitState.HALF_OPEN
+        self._probe_in_flight = True
+        LOGGER.debug('Probing unavailable device')
+      return True
+
+  def record_success(self) -> None:
+    with self._lock:
+      if self._state != CircuitState.CLOSED:
+        LOGGER.info('Device recovered after %d failures', self._consecutive_failures)
+      self._state = CircuitState.CLOSED
+      self._consecutive_failures = 0
+      self._backoff_attempts = 0
+      self._probe_in_flight = False
+
+  def record_failure(self) -> None:
+    with self._lock:
+      self._consecutive_failures += 1
+      self._probe_in_flight = False
+      if self._state == CircuitState.HALF_OPEN \
+          or self._consecutive_failures >= self._failure_threshold:
+        self._open()
+
+  def reset(self) -> None:
+    """
+    Closes the circuit, e.g., once the device is known to be back
+    """
+    self.record_success()
+
+  def snapshot(self) -> dict:
+    """
+    Returns breaker state as plain data, e.g., for schedulers or diagnostics
+    """
+    state = self.state
+    return {
+      'state': state.name.lower(),
+      'consecutive_failures': self._consecutive_failures,
+      'retry_in_sec': self.retry_in_sec,
+      'times_opened': self._times_opened,
+      'rejections': self._rejections,
+    }
+
+  def _is_available(self) -> bool:
+    if self._state == CircuitState.CLOSED:
+      return True
+    if self._state == CircuitState.HALF_OPEN:
+      # Only one probe at a time
+      return not self._probe_in_flight
+    return self._clock() >= self._retry_at
+
+  def _open(self) -> None:
+    delay_sec = self._base_delay_sec * 2 ** self._backoff_attempts
+    if delay_sec < self._max_delay_sec:
+      # Stop counting once capped, so the exponent stays bounded
+      self._backoff_attempts += 1
+    delay_sec = min(self._max_delay_sec, delay_sec) * (1 - self._jitter * self._rng())
+    self._retry_at = self._clock() + delay_sec
+    if self._state == CircuitState.CLOSED:
+      LOGGER.warning(
+        'Device unavailable after %d consecutive failures, retrying in %.2fs',
+        self._consecutive_failures,
+        delay_sec
+      )
+      self._times_opened += 1
+    else:
+      LOGGER.debug('Device still unavailable, retrying in %.2fs', delay_sec)
+    self._state = CircuitState.OPEN
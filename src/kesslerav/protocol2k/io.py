@@ -1,10 +1,23 @@
+import heapq
 import itertools
+import select
 import socket
-import struct
+import threading
+import time
 
 from ..constants import LOGGER
+from array import array
+from collections import Counter
+from contextlib import contextmanager
 from enum import IntEnum, unique
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional
+
+from .health import CircuitBreaker, CircuitOpenError
+from .metrics import METRICS, DeviceMetrics, MetricsRegistry
+
+if TYPE_CHECKING:
+  # `capture` builds on this module, so only import it for annotations
+  from .capture import WireCapture
 
 
 @unique
@@ -23,12 +36,55 @@ class Command(IntEnum):
 
   @classmethod
   def is_supported(cls, cmd_id: int) -> bool:
-    return cmd_id in iter(Command)
+    return cmd_id in _COMMANDS_BY_ID
+
+  @classmethod
+  def lookup(cls, cmd_id: int) -> Optional['Command']:
+    """
+    Returns the command with the specified ID, or `None` when unsupported
+    """
+    return _COMMANDS_BY_ID.get(cmd_id)
+
+_COMMANDS_BY_ID: dict[int, Command] = {cmd.value: cmd for cmd in Command}
+
+@unique
+class Priority(IntEnum):
+  """
+  Order in which queued requests are sent to a device; lower values go first
+  """
+  # User-initiated commands (e.g., source selection)
+  INTERACTIVE = 0
+  # State refreshes and other polling
+  BACKGROUND = 1
+
+  @classmethod
+  def for_instructions(cls, instructions: Iterable['Instruction']) -> 'Priority':
+    """
+    Classifies a request: batches made up only of queries are background
+    refreshes, while anything that changes device state is interactive.
+    """
+    if isinstance(instructions, InstructionBatch):
+      other_commands = instructions.commands.tobytes().translate(None, _QUERY_COMMAND_BYTES)
+      return cls.INTERACTIVE if len(other_commands) > 0 else cls.BACKGROUND
+    for instruction in instructions:
+      if instruction.id not in _QUERY_COMMAND_IDS:
+        return cls.INTERACTIVE
+    return cls.BACKGROUND
+
+# Commands that read device state without changing it
+_QUERY_COMMAND_IDS: frozenset[int] = frozenset((
+  Command.QUERY_OUTPUT_STATUS,
+  Command.QUERY_PANEL_LOCK,
+  Command.IDENTIFY_MACHINE,
+  Command.DEFINE_MACHINE,
+))
+_QUERY_COMMAND_BYTES: bytes = bytes(sorted(_QUERY_COMMAND_IDS))
 
 # Validation rules: limit I/O values to one byte
 _VALUE_MIN = 0
 _VALUE_MAX = 128 # Only 7 bits available for data transport
 _VALID_RANGE: range = range(_VALUE_MIN, _VALUE_MAX)
+_VALID_VALUE_BYTES: bytes = bytes(_VALID_RANGE)
   
 def _validated_value(maybe_value: Optional[int], default_value: int = 0) -> int:
   if maybe_value is None:
@@ -44,7 +100,15 @@ def _validated_value(maybe_value: Optional[int], default_value: int = 0) -> int:
 class Instruction:
   """
   Encapsulates a fully-formed Protocol 2000 instruction
+
+  Instructions are immutable values. Constructing an instruction that matches
+  one built before returns the existing instance, and its encoded bytes are
+  cached after the first encode, so recurring instructions (e.g., state queries)
+  cost neither validation nor allocation after first use. Decoded instructions
+  reuse those instances, but are not retained themselves, so that a stream of
+  varied replies cannot crowd the cache.
   """
+  __slots__ = ('_command', '_frame', '_hash', '_wire')
 
   # Defaults to the override value, meaning ALL machines receiving the instruction
   # will respond, regardless of machine ID setting.
@@ -57,33 +121,73 @@ class Instruction:
   SIZE_BYTES: int = 4
   FORMAT: str = '!I' # 4-bytes
 
-  def __init__(
-    self,
+  # Maximum number of distinct instructions retained for reuse; the oldest is
+  # evicted to make room for new ones
+  INTERN_CACHE_SIZE: int = 4096
+
+  def __new__(
+    cls,
     cmd: int,
     input_value: Optional[int] = None,
     output_value: Optional[int] = None,
     maybe_machine_id: Optional[int] = None
   ):
-    if Command.is_supported(cmd):
-      self._command = Command(cmd)
-      self._unsupported_command_id = None
-    else:
-      self._command = None
-      self._unsupported_command_id = cmd
-
-    self._input_value = _validated_value(input_value)
-    self._output_value = _validated_value(output_value)
-    self._machine_id = _validated_value(
-      maybe_machine_id,
-      Instruction.DEFAULT_MACHINE_ID
+    return cls._create(cmd, input_value, output_value, maybe_machine_id, True)
+
+  @classmethod
+  def _decoded(cls, cmd: int, input_value: int, output_value: int, machine_id: int) -> 'Instruction':
+    """
+    Builds an instruction decoded from the wire, without retaining it for reuse
+    """
+    return cls._create(cmd, input_value, output_value, machine_id, False)
+
+  @classmethod
+  def _create(
+      cls,
+      cmd: int,
+      input_value: Optional[int],
+      output_value: Optional[int],
+      maybe_machine_id: Optional[int],
+      intern: bool
+    ) -> 'Instruction':
+    key = (cmd, input_value, output_value, maybe_machine_id)
+    try:
+      interned = _INTERNED_INSTRUCTIONS.get(key)
+    except TypeError:
+      # Unhashable argument; validation below will reject it
+      key = None
+      interned = None
+    if interned is not None:
+      return interned
+
+    command = Command.lookup(cmd)
+    frame = (
+      cmd if command is None else command.value,
+      _validated_value(input_value),
+      _validated_value(output_value),
+      _validated_value(maybe_machine_id, Instruction.DEFAULT_MACHINE_ID)
     )
-    
+
+    instance = object.__new__(cls)
+    _set = object.__setattr__
+    _set(instance, '_command', command)
+    _set(instance, '_frame', frame)
+    _set(instance, '_hash', hash(frame))
+    _set(instance, '_wire', None)
+
+    if intern and key is not None:
+      if len(_INTERNED_INSTRUCTIONS) >= Instruction.INTERN_CACHE_SIZE:
+        try:
+          del _INTERNED_INSTRUCTIONS[next(iter(_INTERNED_INSTRUCTIONS))]
+        except (KeyError, RuntimeError, StopIteration):
+          # Evicted by another thread in the meantime
+          pass
+      _INTERNED_INSTRUCTIONS[key] = instance
+    return instance
+
   @property
   def id(self) -> int:
-    if self._command is not None:
-      return self._command.value
-    else:
-      return self._unsupported_command_id
+    return self._frame[0]
 
   @property
   def name(self) -> str:
@@ -94,15 +198,15 @@ class Instruction:
 
   @property
   def input_value(self) -> int:
-    return self._input_value
+    return self._frame[1]
 
   @property
   def output_value(self) -> int:
-    return self._output_value
+    return self._frame[2]
 
   @property
   def machine_id(self) -> int:
-    return self._machine_id
+    return self._frame[3]
 
   @property
   def is_supported(self) -> bool:
@@ -110,12 +214,24 @@ class Instruction:
 
   @property
   def frame(self) -> list[int]:
-    return [
-      self.id,
-      self.input_value,
-      self.output_value,
-      self.machine_id
-    ]
+    return list(self._frame)
+
+  @property
+  def frame_tuple(self) -> tuple[int, int, int, int]:
+    """
+    The frame as an immutable `(id, input, output, machine_id)` tuple, which
+    unlike `frame` is not copied on access
+    """
+    return self._frame
+
+  def __setattr__(self, name, value):
+    raise AttributeError(f'{type(self).__name__} is immutable')
+
+  def __delattr__(self, name):
+    raise AttributeError(f'{type(self).__name__} is immutable')
+
+  def __reduce__(self):
+    return (Instruction, self._frame)
 
   def __str__(self) -> str:
     return (
@@ -130,9 +246,183 @@ class Instruction:
     )
 
   def __eq__(self, other):
+    if self is other:
+      return True
     if not isinstance(other, Instruction):
       return NotImplemented
-    return self.frame == other.frame
+    return self._frame == other._frame
+
+  def __hash__(self) -> int:
+    return self._hash
+
+_INTERNED_INSTRUCTIONS: dict[tuple, Instruction] = {}
+
+class InstructionBatch:
+  """
+  Columnar sequence of Protocol 2000 instructions
+
+  Command IDs, input values, output values and machine IDs are stored as four
+  parallel `array('B')` columns rather than as `Instruction` objects, so large
+  batches (e.g., matrix sweeps or replays) are validated, encoded and decoded a
+  column at a time. `Codec` and `TcpDevice.process` accept and return batches
+  without building an instruction per frame; indexing or iterating a batch
+  builds instructions on demand.
+
+  Columns default the same way as `Instruction` arguments: values to 0 and
+  machine IDs to `Instruction.DEFAULT_MACHINE_ID`.
+  """
+  __slots__ = ('_commands', '_inputs', '_outputs', '_machine_ids')
+
+  def __init__(
+      self,
+      commands: Iterable[int] = (),
+      inputs: Optional[Iterable[int]] = None,
+      outputs: Optional[Iterable[int]] = None,
+      machine_ids: Optional[Iterable[int]] = None
+    ):
+    self._commands = _byte_column(commands, 'commands')
+    size = len(self._commands)
+    self._inputs = _value_column(inputs, size, 0, 'inputs')
+    self._outputs = _value_column(outputs, size, 0, 'outputs')
+    self._machine_ids = _value_column(machine_ids, size, Instruction.DEFAULT_MACHINE_ID, 'machine_ids')
+
+  @classmethod
+  def from_instructions(cls, instructions: Iterable[Instruction]) -> 'InstructionBatch':
+    frames = [instruction.frame_tuple for instruction in instructions]
+    if len(frames) == 0:
+      return cls()
+    return cls._from_columns(*(array('B', column) for column in zip(*frames)))
+
+  @classmethod
+  def concat(cls, batches: Iterable['InstructionBatch']) -> 'InstructionBatch':
+    """
+    Joins batches end to end into a new batch
+    """
+    columns = (array('B'), array('B'), array('B'), array('B'))
+    for batch in batches:
+      for (column, source) in zip(columns, batch._columns()):
+        column.extend(source)
+    return cls._from_columns(*columns)
+
+  @classmethod
+  def _from_columns(
+      cls,
+      commands: array,
+      inputs: array,
+      outputs: array,
+      machine_ids: array
+    ) -> 'InstructionBatch':
+    # Adopts already validated columns without copying them
+    batch = cls.__new__(cls)
+    batch._commands = commands
+    batch._inputs = inputs
+    batch._outputs = outputs
+    batch._machine_ids = machine_ids
+    return batch
+
+  @property
+  def commands(self) -> memoryview:
+    """
+    Read-only view of the command IDs
+    """
+    return memoryview(self._commands).toreadonly()
+
+  @property
+  def inputs(self) -> memoryview:
+    """
+    Read-only view of the input values
+    """
+    return memoryview(self._inputs).toreadonly()
+
+  @property
+  def outputs(self) -> memoryview:
+    """
+    Read-only view of the output values
+    """
+    return memoryview(self._outputs).toreadonly()
+
+  @property
+  def machine_ids(self) -> memoryview:
+    """
+    Read-only view of the machine IDs
+    """
+    return memoryview(self._machine_ids).toreadonly()
+
+  def as_numpy(self) -> tuple:
+    """
+    Returns read-only NumPy `uint8` views of the command, input, output and
+    machine ID columns, sharing memory with the batch. Requires NumPy.
+    """
+    try:
+      import numpy
+    except ImportError as ex:
+      raise ImportError('NumPy is required for InstructionBatch.as_numpy()') from ex
+    return tuple(numpy.frombuffer(column, dtype = numpy.uint8) for column in self._views())
+
+  def to_instructions(self) -> list[Instruction]:
+    return list(self)
+
+  def _columns(self) -> tuple[array, array, array, array]:
+    return (self._commands, self._inputs, self._outputs, self._machine_ids)
+
+  def _views(self) -> tuple[memoryview, ...]:
+    return (self.commands, self.inputs, self.outputs, self.machine_ids)
+
+  def __len__(self) -> int:
+    return len(self._commands)
+
+  def __iter__(self) -> Iterator[Instruction]:
+    for frame in zip(*self._columns()):
+      yield Instruction._decoded(*frame)
+
+  def __getitem__(self, index: int | slice) -> 'Instruction | InstructionBatch':
+    if isinstance(index, slice):
+      return InstructionBatch._from_columns(*(column[index] for column in self._columns()))
+    return Instruction._decoded(*(column[index] for column in self._columns()))
+
+  def __eq__(self, other):
+    if not isinstance(other, InstructionBatch):
+      return NotImplemented
+    return self._columns() == other._columns()
+
+  __hash__ = None
+
+  def __repr__(self) -> str:
+    return f'InstructionBatch<{len(self)} instructions>'
+
+def _byte_column(values: Iterable[int], name: str) -> array:
+  try:
+    view = memoryview(values)
+  except TypeError:
+    view = None
+  if view is not None and view.format in ('B', 'b', 'c') and view.ndim <= 1:
+    return array('B', view.tobytes())
+  try:
+    return array('B', values)
+  except OverflowError as ex:
+    raise ValueError(f'Column {name} must contain values between 0 and 255') from ex
+
+def _value_column(
+    values: Optional[Iterable[int]],
+    size: int,
+    default_value: int,
+    name: str
+  ) -> array:
+  if values is None:
+    return array('B', (default_value,)) * size
+  column = _byte_column(values, name)
+  if len(column) != size:
+    raise ValueError(
+      f'Column {name} must have one value per command. '
+      f'Expected: {size}, received: {len(column)}'
+    )
+  invalid = column.tobytes().translate(None, _VALID_VALUE_BYTES)
+  if len(invalid) > 0:
+    raise ValueError(
+      f'Valid values are between {_VALUE_MIN} and {_VALUE_MAX - 1}, '
+      f'inclusive. Received: {invalid[0]} in {name}'
+    )
+  return column
 
 class Codec:
   """
@@ -141,30 +431,97 @@ class Codec:
 
   @classmethod
   def encode(cls, instruction: Instruction) -> bytes:
-    msg = cls._encode_message(instruction)
-    data = bytes(msg)
+    data = instruction._wire
+    if data is None:
+      data = cls._encode_message(instruction)
+      object.__setattr__(instruction, '_wire', data)
     return data
   
   @classmethod
   def decode(cls, data: bytes) -> Instruction:
     frame = cls._decode_message(data)
-    cmd = Instruction(*frame)
-    return cmd
+    return Instruction._decoded(*frame)
 
   @classmethod
-  def _encode_message(cls, instruction: Instruction) -> list[int]:
-    cmd_id, *values = instruction.frame
-    encoded_values = list(map(cls._encode_value, values))
-    return [cmd_id] + encoded_values
-  
+  def encode_many(cls, instructions: Iterable[Instruction] | InstructionBatch) -> bytes:
+    """
+    Encodes the instructions into a single contiguous buffer of frames
+    """
+    if isinstance(instructions, InstructionBatch):
+      return cls.encode_batch(instructions)
+    return b''.join(map(cls.encode, instructions))
+
   @classmethod
-  def _decode_message(cls, data: bytes) -> list[int]:
-    cmd_id, *encoded_values = [byte for byte in data]
-    if not Command.is_supported(cmd_id):
-      # Command ID is likely a response-encoded ID; decode it
-      cmd_id = cls._decode_command_id(cmd_id)
-    values = list(map(cls._decode_value, encoded_values))
-    return [cmd_id] + values 
+  def encode_batch(cls, batch: InstructionBatch) -> bytes:
+    """
+    Encodes the batch into a single contiguous buffer of frames, a column at a
+    time
+    """
+    data = bytearray(len(batch) * Instruction.SIZE_BYTES)
+    (commands, inputs, outputs, machine_ids) = batch._columns()
+    data[0::4] = commands
+    data[1::4] = inputs.tobytes().translate(_VALUE_ENCODE_TABLE)
+    data[2::4] = outputs.tobytes().translate(_VALUE_ENCODE_TABLE)
+    data[3::4] = machine_ids.tobytes().translate(_VALUE_ENCODE_TABLE)
+    return bytes(data)
+
+  @classmethod
+  def decode_batch(cls, data: bytes | bytearray | memoryview) -> InstructionBatch:
+    """
+    Decodes a buffer of whole frames into a batch, a column at a time
+    """
+    if isinstance(data, memoryview):
+      data = data.tobytes()
+    if len(data) % Instruction.SIZE_BYTES != 0:
+      raise ValueError(
+        f'Data must contain whole {Instruction.SIZE_BYTES}-byte frames. '
+        f'Received: {len(data)} bytes'
+      )
+    values = data.translate(_VALUE_DECODE_TABLE)
+    return InstructionBatch(
+      data[0::4].translate(_COMMAND_DECODE_TABLE),
+      values[1::4],
+      values[2::4],
+      values[3::4]
+    )
+
+  @classmethod
+  def decode_many(
+      cls,
+      data: bytes | bytearray | memoryview,
+      raw: bool = False
+    ) -> list[Instruction] | list[tuple[int, int, int, int]]:
+    """
+    Decodes a buffer of whole frames in a single pass.
+
+    When `raw` is set, decoded `(command_id, input, output, machine_id)` tuples
+    are returned instead of instructions.
+    """
+    frames = zip(*cls.decode_batch(data)._columns())
+    if raw:
+      return list(frames)
+    return [Instruction._decoded(*frame) for frame in frames]
+
+  @classmethod
+  def _encode_message(cls, instruction: Instruction) -> bytes:
+    (cmd_id, input_value, output_value, machine_id) = instruction.frame_tuple
+    table = _VALUE_ENCODE_TABLE
+    return bytes((
+      cmd_id,
+      table[input_value],
+      table[output_value],
+      table[machine_id]
+    ))
+
+  @classmethod
+  def _decode_message(cls, data: bytes) -> tuple[int, int, int, int]:
+    table = _VALUE_DECODE_TABLE
+    return (
+      _COMMAND_DECODE_TABLE[data[0]],
+      table[data[1]],
+      table[data[2]],
+      table[data[3]]
+    )
 
   # Per protocol, the first bit for all I/O values must be 1
   @classmethod
@@ -183,6 +540,124 @@ class Codec:
   def _decode_command_id(cls, command_id: int) -> int:
     return command_id ^ 0b01000000
 
+# Lookup tables covering every possible byte, so that encoding and decoding are
+# a single index per byte (or a single `bytes.translate` per buffer.)
+_VALUE_ENCODE_TABLE: bytes = bytes(Codec._encode_value(b) & 0xFF for b in range(256))
+_VALUE_DECODE_TABLE: bytes = bytes(Codec._decode_value(b) for b in range(256))
+# Command IDs that aren't supported are likely response-encoded; decode them
+_COMMAND_DECODE_TABLE: bytes = bytes(
+  b if Command.is_supported(b) else Codec._decode_command_id(b)
+  for b in range(256)
+)
+
+class FrameDecoder:
+  """
+  Incrementally reassembles Protocol 2000 frames from a byte stream.
+
+  Bytes are read directly into a reusable buffer, and partial frames are carried
+  over until the rest of their bytes arrive, so frames split or coalesced across
+  reads decode the same as frames that arrive whole.
+
+  Decoded instructions are produced lazily. Frames that are not consumed before
+  the next read are retained and produced by the next read instead.
+  """
+  DEFAULT_CAPACITY_BYTES: int = Instruction.SIZE_BYTES * 32
+
+  def __init__(self, capacity_bytes: int = DEFAULT_CAPACITY_BYTES):
+    self._buffer = bytearray(max(capacity_bytes, Instruction.SIZE_BYTES))
+    self._view = memoryview(self._buffer)
+    # Unconsumed bytes live in `_buffer[_start:_end]`
+    self._start = 0
+    self._end = 0
+    self._bytes_read = 0
+
+  @property
+  def bytes_read(self) -> int:
+    """
+    Total number of bytes read or fed into the decoder
+    """
+    return self._bytes_read
+
+  @property
+  def pending_bytes(self) -> int:
+    """
+    Number of buffered bytes not yet produced as instructions, including any
+    partial frame.
+    """
+    return self._end - self._start
+
+  def read_from(self, conn: socket.socket) -> Iterator[Instruction]:
+    """
+    Performs a single read from the connection, returning the instructions that
+    can be decoded from everything buffered so far.
+    """
+    self._read(conn)
+    return self._frames()
+
+  def read_frames_from(self, conn: socket.socket) -> bytes:
+    """
+    Performs a single read from the connection, returning the still-encoded
+    bytes of every whole frame buffered so far, for callers that decode frames
+    in bulk (see `Codec.decode_batch`.)
+    """
+    self._read(conn)
+    size = (self._end - self._start) // Instruction.SIZE_BYTES * Instruction.SIZE_BYTES
+    start = self._start
+    self._start = start + size
+    return self._view[start:start + size].tobytes()
+
+  def feed(self, data: bytes) -> Iterator[Instruction]:
+    """
+    Buffers the provided bytes, returning the instructions that can be decoded
+    from everything buffered so far.
+    """
+    size = len(data)
+    self._reserve(size)
+    self._view[self._end:self._end + size] = data
+    self._end += size
+    self._bytes_read += size
+    return self._frames()
+
+  def reset(self) -> None:
+    """
+    Discards all buffered bytes
+    """
+    self._start = 0
+    self._end = 0
+
+  def _read(self, conn: socket.socket) -> None:
+    self._reserve(Instruction.SIZE_BYTES)
+    count = conn.recv_into(self._view[self._end:])
+    if count == 0:
+      raise ConnectionResetError('Connection closed by device')
+    self._end += count
+    self._bytes_read += count
+
+  def _frames(self) -> Iterator[Instruction]:
+    frame_size = Instruction.SIZE_BYTES
+    while self._end - self._start >= frame_size:
+      start = self._start
+      self._start = start + frame_size
+      yield Codec.decode(self._view[start:start + frame_size])
+
+  def _reserve(self, size: int) -> None:
+    # Shift leftover bytes to the front, so reads land in a contiguous region
+    pending = self._end - self._start
+    if self._start > 0:
+      self._view[:pending] = self._view[self._start:self._end]
+      self._start = 0
+      self._end = pending
+
+    required = pending + size
+    if required > len(self._buffer):
+      capacity = len(self._buffer)
+      while capacity < required:
+        capacity *= 2
+      buffer = bytearray(capacity)
+      buffer[:pending] = self._view[:pending]
+      self._buffer = buffer
+      self._view = memoryview(buffer)
+
 class TcpEndpoint:
   """
   Protocol 2000 TCP endpoint location details
@@ -215,74 +690,776 @@ class TcpEndpoint:
   def timeout_sec(self) -> Optional[float]:
     return self._timeout_sec
 
+class TcpConnection:
+  """
+  Long-lived TCP connection to a Protocol 2000 device, along with the
+  bookkeeping needed to decide when it should be recycled
+  """
+
+  def __init__(self, sock: socket.socket):
+    self._socket = sock
+    self._decoder = FrameDecoder(TcpDevice.BUFFER_SIZE_BYTES)
+    self._created_at = time.monotonic()
+    self._last_used_at = self._created_at
+    self._use_count = 0
+
+  @property
+  def socket(self) -> socket.socket:
+    return self._socket
+
+  @property
+  def decoder(self) -> FrameDecoder:
+    return self._decoder
+
+  @property
+  def use_count(self) -> int:
+    return self._use_count
+
+  def touch(self, new_use: bool = True) -> None:
+    self._last_used_at = time.monotonic()
+    if new_use:
+      self._use_count += 1
+
+  def is_expired(
+      self,
+      idle_timeout_sec: Optional[float],
+      max_lifetime_sec: Optional[float]
+    ) -> bool:
+    now = time.monotonic()
+    if idle_timeout_sec is not None and now - self._last_used_at >= idle_timeout_sec:
+      return True
+    if max_lifetime_sec is not None and now - self._created_at >= max_lifetime_sec:
+      return True
+    return False
+
+  def close(self) -> None:
+    self._socket.close()
+
+class CommandQueue:
+  """
+  Grants exclusive use of a device to one request at a time, in priority order.
+
+  Waiting requests are served lowest `Priority` first, and in arrival order
+  within a priority. Used as a context manager, it acquires at interactive
+  priority.
+  """
+
+  def __init__(self):
+    self._condition = threading.Condition()
+    self._waiting: list[tuple[int, int]] = []
+    self._sequence = itertools.count()
+    self._is_held = False
+    # Sequence number of the request holding the device
+    self._held_sequence = 0
+    self._max_depth = 0
+    self._preemptions = 0
+    self._waits = {priority: [0, 0.0, 0.0] for priority in Priority}
+
+  @property
+  def depth(self) -> int:
+    """
+    Number of requests waiting for the device
+    """
+    with self._condition:
+      return len(self._waiting)
+
+  def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+    start = time.monotonic()
+    with self._condition:
+      self._wait_for_turn((int(priority), next(self._sequence)))
+      waited_sec = time.monotonic() - start
+      waits = self._waits[priority]
+      waits[0] += 1
+      waits[1] += waited_sec
+      waits[2] = max(waits[2], waited_sec)
+
+  def release(self) -> None:
+    with self._condition:
+      self._is_held = False
+      self._condition.notify_all()
+
+  def is_wanted_by(self, priority: Priority) -> bool:
+    """
+    Returns `true` when a request of higher priority than `priority` is waiting
+    """
+    with self._condition:
+      return len(self._waiting) > 0 and self._waiting[0][0] < priority
+
+  def yield_to(self, priority: Priority) -> None:
+    """
+    Lets waiting requests of higher priority than `priority` go first, then
+    re-acquires at `priority`. The request keeps its place ahead of those that
+    arrived after it, and is not counted as a new request in `stats`.
+    """
+    with self._condition:
+      self._preemptions += 1
+      self._is_held = False
+      self._condition.notify_all()
+      self._wait_for_turn((int(priority), self._held_sequence))
+
+  def stats(self) -> dict:
+    """
+    Returns the current and maximum queue depth, the number of preemptions and,
+    per priority, how many requests were granted and how long they waited.
+    """
+    with self._condition:
+      return {
+        'depth': len(self._waiting),
+        'max_depth': self._max_depth,
+        'preemptions': self._preemptions,
+        'waits': {
+          priority.name.lower(): {
+            'count': count,
+            'mean_sec': total_sec / count if count > 0 else 0.0,
+            'max_sec': max_sec,
+          }
+          for (priority, (count, total_sec, max_sec)) in self._waits.items()
+        },
+      }
+
+  def _wait_for_turn(self, entry: tuple[int, int]) -> None:
+    # Called with the condition held
+    heapq.heappush(self._waiting, entry)
+    self._max_depth = max(self._max_depth, len(self._waiting))
+    while self._is_held or self._waiting[0] != entry:
+      self._condition.wait()
+    heapq.heappop(self._waiting)
+    self._is_held = True
+    self._held_sequence = entry[1]
+
+  @contextmanager
+  def holding(self, priority: Priority) -> Iterator['CommandQueue']:
+    """
+    Holds the device at `priority` for the duration of a `with` block
+    """
+    self.acquire(priority)
+    try:
+      yield self
+    finally:
+      self.release()
+
+  def __enter__(self) -> 'CommandQueue':
+    self.acquire()
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.release()
+
 class TcpDevice:
   """
   Manages TCP I/O for a specific Protocol 2000-based device
+
+  A single connection is kept open between calls to `process` and is
+  transparently re-established when it fails, sits idle for longer than
+  `idle_timeout_sec`, or has been open for longer than `max_lifetime_sec`.
+
+  When `pipelined` is enabled, multi-instruction calls are written to the device
+  in a single send and their replies are read back as a stream, so that a batch
+  costs roughly one round trip and shares a single timeout.
+
+  `start_listening` opts in to push-based updates: a background thread keeps the
+  connection open and hands instructions the device sends unprompted (e.g., when
+  its front panel is used) to a callback.
+
+  Requests wait their turn in a `CommandQueue`, which serves interactive
+  commands ahead of background refreshes. A background request that is not
+  pipelined yields to waiting interactive commands between instructions, so a
+  refresh stuck on an unresponsive device delays user commands by at most one
+  instruction's timeout.
+
+  Latencies, byte counts, timeouts and errors are recorded in `metrics` (by
+  default, the shared `METRICS` registry) under `label`, while it is enabled.
+
+  Given a `capture` (see `capture.WireCapture`), every frame sent to or
+  received from the device is appended to a binary capture file.
+
+  Device health is tracked by a `CircuitBreaker`. Requests that fail, or whose
+  instructions all go unanswered, count as failures; once enough happen in a
+  row, requests return no instructions without contacting the device until a
+  backed-off probe finds it responding again. See `circuit_breaker` and
+  `is_available`.
   """
   # Maximum number of response instructions to read
   PAGE_SIZE: int = 32
   # Size of the buffer used to read responses
   BUFFER_SIZE_BYTES: int = Instruction.SIZE_BYTES * PAGE_SIZE
+  # Devices drop connections that sit idle, so recycle well before that happens
+  DEFAULT_IDLE_TIMEOUT_SEC: float = 30.0
+  DEFAULT_MAX_LIFETIME_SEC: float = 300.0
+  # How long the listener waits for data before re-checking whether to stop
+  LISTEN_POLL_INTERVAL_SEC: float = 0.5
+  # How long the listener waits before reconnecting after a failure
+  LISTEN_RETRY_INTERVAL_SEC: float = 5.0
 
   def __init__(
       self,
       endpoint: TcpEndpoint,
+      keep_alive: bool = True,
+      idle_timeout_sec: Optional[float] = DEFAULT_IDLE_TIMEOUT_SEC,
+      max_lifetime_sec: Optional[float] = DEFAULT_MAX_LIFETIME_SEC,
+      pipelined: bool = False,
+      metrics: Optional[MetricsRegistry] = None,
+      capture: Optional['WireCapture'] = None,
+      circuit_breaker: Optional[CircuitBreaker] = None
     ):
     self._endpoint = endpoint
+    self._keep_alive = keep_alive
+    self._pipelined = pipelined
+    self._metrics = metrics if metrics is not None else METRICS
+    self._capture = capture
+    self._circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+    self._label = f'{endpoint.host}:{endpoint.port}'
+    # Metrics being recorded for the request in progress, if enabled
+    self._request_metrics: Optional[DeviceMetrics] = None
+    self._idle_timeout_sec = idle_timeout_sec
+    self._max_lifetime_sec = max_lifetime_sec
+    self._connection: Optional[TcpConnection] = None
+    self._lock = CommandQueue()
 
-  def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
-    try:
-      _ = iter(instructions)
-    except TypeError:
-      # Single instruction provided; wrap it.
-      instructions = [instructions]
+    self._connections_opened = 0
+    self._connections_reused = 0
+    self._last_connection_reused = False
+
+    self._listener: Optional[threading.Thread] = None
+    self._listener_stop = threading.Event()
+
+  @property
+  def connections_opened(self) -> int:
+    """
+    Number of connections opened to the device
+    """
+    return self._connections_opened
+
+  @property
+  def connections_reused(self) -> int:
+    """
+    Number of requests that were served by an already-open connection
+    """
+    return self._connections_reused
+
+  @property
+  def last_connection_reused(self) -> bool:
+    """
+    Returns `true` when the most recent request reused an open connection,
+    `false` when a new connection had to be opened for it.
+    """
+    return self._last_connection_reused
+
+  @property
+  def pipelined(self) -> bool:
+    return self._pipelined
+
+  @property
+  def label(self) -> str:
+    """
+    Identifies the device in recorded metrics
+    """
+    return self._label
+
+  @property
+  def queue_stats(self) -> dict:
+    """
+    Depth and wait-time statistics of the device's command queue. See
+    `CommandQueue.stats`.
+    """
+    return self._lock.stats()
+
+  @property
+  def metrics(self) -> MetricsRegistry:
+    return self._metrics
+
+  @property
+  def capture(self) -> Optional['WireCapture']:
+    return self._capture
+
+  @property
+  def circuit_breaker(self) -> CircuitBreaker:
+    return self._circuit_breaker
+
+  @property
+  def is_available(self) -> bool:
+    """
+    Returns `false` while the device is presumed unreachable, so that requests
+    would fail without contacting it. Schedulers can use this to skip the
+    device until it is next due to be probed.
+    """
+    return self._circuit_breaker.is_available
+
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction | InstructionBatch,
+      pipelined: Optional[bool] = None,
+      priority: Optional[Priority] = None
+    ) -> list[Instruction] | InstructionBatch:
+    """
+    Sends the instructions to the device, returning all instructions received
+    in response, in the order they were received.
+
+    `pipelined` overrides the device-level setting for this call. `priority`
+    defaults to background for batches of queries and interactive otherwise.
+
+    When given an `InstructionBatch`, the responses are returned as a batch
+    too, and no instruction objects are built for either.
+    """
+    if pipelined is None:
+      pipelined = self._pipelined
+    is_batch = isinstance(instructions, InstructionBatch)
+    if not is_batch:
+      try:
+        _ = iter(instructions)
+      except TypeError:
+        # Single instruction provided; wrap it.
+        instructions = [instructions]
+      instructions = list(instructions)
+    if priority is None:
+      priority = Priority.for_instructions(instructions)
     results = []
 
-    conn = self._create_connection()
+    self._lock.acquire(priority)
     try:
-      for instruction in instructions:
-        result = self._execute_instruction(instruction, conn)
-        results.append(result)
-    except Exception as ex:
-      LOGGER.error('Failed communicating with device: %s', ex)
+      if self._metrics.enabled:
+        self._request_metrics = self._metrics.device(self._label)
+      try:
+        if len(instructions) > 0 and not self._circuit_breaker.allow_request():
+          raise CircuitOpenError(self._circuit_breaker.retry_in_sec)
+        self._process_instructions(instructions, results, pipelined, priority)
+      except CircuitOpenError as ex:
+        LOGGER.debug('Skipped request: %s', ex)
+        if self._request_metrics is not None:
+          self._request_metrics.increment('circuit_rejections')
+      except Exception as ex:
+        LOGGER.error('Failed communicating with device: %s', ex)
+        if self._request_metrics is not None:
+          self._request_metrics.increment('errors')
+        self._close_connection()
+        self._circuit_breaker.record_failure()
+      else:
+        if len(instructions) > 0:
+          # A device that answers nothing is as good as unreachable
+          if any(len(result) > 0 for result in results):
+            self._circuit_breaker.record_success()
+          else:
+            self._circuit_breaker.record_failure()
+      finally:
+        self._request_metrics = None
+        if not self._keep_alive:
+          self._close_connection()
     finally:
-      conn.close()
+      self._lock.release()
 
+    if is_batch:
+      # Results hold the encoded replies to each exchange
+      return Codec.decode_batch(b''.join(results))
     # Results is a list of lists, so flatten before returning
     flat_results = list(itertools.chain.from_iterable(results))
     return flat_results
-  
+
+  @property
+  def is_listening(self) -> bool:
+    return self._listener is not None
+
+  def start_listening(
+      self,
+      on_instructions: Callable[[list[Instruction]], None]
+    ) -> None:
+    """
+    Starts a background thread that reads instructions the device sends outside
+    of a request and passes them to `on_instructions`.
+
+    Instructions that arrive while a request is in progress are returned by
+    `process` instead.
+    """
+    if self._listener is not None:
+      raise RuntimeError('Device is already listening')
+    self._listener_stop.clear()
+    self._listener = threading.Thread(
+      target = self._listen,
+      args = (on_instructions,),
+      name = f'kesslerav-listener-{self._endpoint.host}:{self._endpoint.port}',
+      daemon = True
+    )
+    self._listener.start()
+
+  def stop_listening(self) -> None:
+    """
+    Stops the background listener, if running
+    """
+    listener = self._listener
+    if listener is None:
+      return
+    self._listener_stop.set()
+    if listener is not threading.current_thread():
+      listener.join()
+    self._listener = None
+
+  def close(self) -> None:
+    """
+    Stops listening and closes the connection to the device, if one is open
+    """
+    self.stop_listening()
+    with self._lock:
+      self._close_connection()
+
+  def _listen(self, on_instructions: Callable[[list[Instruction]], None]) -> None:
+    while not self._listener_stop.is_set():
+      try:
+        instructions = self._read_unsolicited()
+      except CircuitOpenError as ex:
+        self._listener_stop.wait(max(ex.retry_in_sec, TcpDevice.LISTEN_POLL_INTERVAL_SEC))
+        continue
+      except Exception as ex:
+        LOGGER.error('Listener failed communicating with device: %s', ex)
+        with self._lock.holding(Priority.BACKGROUND):
+          self._close_connection()
+        self._listener_stop.wait(TcpDevice.LISTEN_RETRY_INTERVAL_SEC)
+        continue
+
+      if len(instructions) > 0:
+        if self._metrics.enabled:
+          self._metrics.device(self._label).increment('unsolicited_frames', len(instructions))
+        try:
+          on_instructions(instructions)
+        except Exception:
+          LOGGER.exception('Listener callback failed')
+
+  def _read_unsolicited(self) -> list[Instruction]:
+    connection = self._connection
+    if connection is None:
+      with self._lock.holding(Priority.BACKGROUND):
+        if not self._circuit_breaker.allow_request():
+          raise CircuitOpenError(self._circuit_breaker.retry_in_sec)
+        try:
+          (connection, _) = self._acquire_connection()
+        except Exception:
+          self._circuit_breaker.record_failure()
+          raise
+        self._circuit_breaker.record_success()
+
+    conn = connection.socket
+    try:
+      (readable, _, _) = select.select([conn], [], [], TcpDevice.LISTEN_POLL_INTERVAL_SEC)
+    except (OSError, ValueError):
+      if connection is not self._connection:
+        # Closed by a request (e.g., recycled) while we waited on it
+        return []
+      raise
+    if len(readable) == 0:
+      return []
+
+    # Draining is housekeeping, so it waits behind interactive commands like
+    # any other background work
+    with self._lock.holding(Priority.BACKGROUND):
+      if connection is not self._connection:
+        # Replaced while waiting; pick up the new connection on the next pass
+        return []
+      # A request may have consumed the data while we waited for the lock, so
+      # only take what is already available.
+      conn.setblocking(False)
+      try:
+        return list(connection.decoder.read_from(conn))
+      except BlockingIOError:
+        return []
+      finally:
+        conn.settimeout(self._endpoint.timeout_sec)
+
+  def _process_instructions(
+      self,
+      instructions: list[Instruction] | InstructionBatch,
+      results: list[list[Instruction]] | list[bytes],
+      pipelined: bool = False,
+      priority: Priority = Priority.INTERACTIVE
+    ) -> None:
+    index = 0
+    starting = True
+    while index < len(instructions):
+      # Resuming after a yield or reconnect is not a new use of the connection
+      connection, reused = self._acquire_connection(starting)
+      starting = False
+      try:
+        while index < len(instructions):
+          if pipelined:
+            batch = instructions[index:]
+          else:
+            batch = instructions[index:index + 1]
+          results.append(self._exchange(batch, connection))
+          index += len(batch)
+          if index < len(instructions) and self._lock.is_wanted_by(priority):
+            self._yield_to_waiting(priority)
+            # The connection may have been replaced while yielded
+            break
+      except (ConnectionError, OSError) as ex:
+        self._close_connection()
+        if not reused:
+          raise
+        # Device dropped a connection we were holding onto; retry the remaining
+        # instructions once on a fresh connection.
+        LOGGER.info('Connection to device lost, reconnecting: %s', ex)
+        if self._request_metrics is not None:
+          self._request_metrics.increment('reconnects')
+
+  def _yield_to_waiting(self, priority: Priority) -> None:
+    LOGGER.debug('Deferring remaining %s instructions to waiting requests', priority.name)
+    metrics = self._request_metrics
+    self._lock.yield_to(priority)
+    self._request_metrics = metrics
+
+  def _acquire_connection(self, new_request: bool = True) -> tuple[TcpConnection, bool]:
+    connection = self._connection
+    if connection is not None and connection.is_expired(
+        self._idle_timeout_sec,
+        self._max_lifetime_sec
+      ):
+      LOGGER.debug('Recycling expired device connection')
+      self._close_connection()
+      connection = None
+
+    reused = connection is not None
+    if connection is None:
+      connection = TcpConnection(self._create_connection())
+      self._connection = connection
+      self._connections_opened += 1
+    connection.touch(new_request)
+    if new_request:
+      if reused:
+        self._connections_reused += 1
+      self._last_connection_reused = reused
+    return (connection, reused)
+
+  def _close_connection(self) -> None:
+    connection = self._connection
+    self._connection = None
+    if connection is not None:
+      try:
+        connection.close()
+      except OSError as ex:
+        LOGGER.debug('Failed closing device connection: %s', ex)
+
   def _create_connection(self) -> socket.socket:
+    metrics = self._request_metrics
+    if metrics is None:
+      conn = self._connect()
+    else:
+      start = time.perf_counter()
+      conn = self._connect()
+      metrics.observe('connect_seconds', time.perf_counter() - start)
+      metrics.increment('connections')
+    if self._capture is not None:
+      conn = self._capture.wrap(conn)
+    return conn
+
+  def _connect(self) -> socket.socket:
     return socket.create_connection(
       (self._endpoint.host, self._endpoint.port),
       self._endpoint.timeout_sec
     )
   
-  def _execute_instruction(
+  def _exchange(
       self,
-      instruction: Instruction,
-      conn: socket.socket
-    ) -> list[Instruction]:
-    req_bytes = Codec.encode(instruction)
-    conn.send(req_bytes)
+      instructions: list[Instruction] | InstructionBatch,
+      connection: TcpConnection
+    ) -> list[Instruction] | bytes:
+    if isinstance(instructions, InstructionBatch):
+      return self._exchange_frames(instructions, connection)
+    conn = connection.socket
+    data = Codec.encode_many(instructions)
+    conn.sendall(data)
+    metrics = self._request_metrics
+    if metrics is not None:
+      sent_at = time.perf_counter()
+      bytes_read = connection.decoder.bytes_read
 
     # Device can return multiple instructions when its physical controls are
-    # used. To capture them all (to reconstruct device state) we read using a
-    # buffer that can hold multiple instructions and then return them all in
-    # chronological event order.
+    # used. To capture them all (to reconstruct device state) replies are read
+    # as a stream and returned in chronological event order, finishing as soon
+    # as every request has been answered. A single deadline covers the whole
+    # exchange, so a device that never responds costs one timeout.
+    timeout_sec = self._endpoint.timeout_sec
+    deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+    correlator = ResponseCorrelator(instructions)
     result: list[Instruction] = []
     try:
-      while len(result) < 1:
-        data = conn.recv(TcpDevice.BUFFER_SIZE_BYTES)
-        responses = struct.iter_unpack(Instruction.FORMAT, data)
-        for response in responses:
-          resp_bytes = response[0].to_bytes(Instruction.SIZE_BYTES)
-          instruction = Codec.decode(resp_bytes)
+      while not correlator.is_complete:
+        if deadline is not None:
+          remaining = deadline - time.monotonic()
+          if remaining <= 0:
+            raise TimeoutError
+          conn.settimeout(remaining)
+        for instruction in connection.decoder.read_from(conn):
           result.append(instruction)
+          request = correlator.accept(instruction)
+          if request is None:
+            LOGGER.debug('Received unsolicited instruction: %s', instruction)
+            if metrics is not None:
+              metrics.increment('unsolicited_frames')
+          elif metrics is not None:
+            metrics.observe('command_latency_seconds', time.perf_counter() - sent_at, request.name)
     except TimeoutError:
       LOGGER.info(
-        'Timed out waiting for response. Ignoring, since another thread may '
-        'have processed the response already.'
+        'Timed out waiting for %d of %d responses. Ignoring, since another '
+        'thread may have processed the responses already.',
+        len(correlator.pending),
+        len(instructions)
       )
+      if metrics is not None:
+        metrics.increment('timeouts', len(correlator.pending))
+    finally:
+      conn.settimeout(timeout_sec)
+      if metrics is not None:
+        metrics.increment('bytes_sent', len(data))
+        metrics.increment('bytes_received', connection.decoder.bytes_read - bytes_read)
 
     return result
+
+  def _exchange_frames(self, batch: InstructionBatch, connection: TcpConnection) -> bytes:
+    """
+    Counterpart of `_exchange` for batches, returning the encoded replies
+    """
+    conn = connection.socket
+    data = Codec.encode_batch(batch)
+    conn.sendall(data)
+    metrics = self._request_metrics
+    if metrics is not None:
+      sent_at = time.perf_counter()
+      bytes_read = connection.decoder.bytes_read
+
+    timeout_sec = self._endpoint.timeout_sec
+    deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+    correlator = FrameCorrelator(batch)
+    received = bytearray()
+    try:
+      while not correlator.is_complete:
+        if deadline is not None:
+          remaining = deadline - time.monotonic()
+          if remaining <= 0:
+            raise TimeoutError
+          conn.settimeout(remaining)
+        frames = connection.decoder.read_frames_from(conn)
+        received += frames
+        commands = frames[0::4].translate(_COMMAND_DECODE_TABLE)
+        inputs = frames[1::4].translate(_VALUE_DECODE_TABLE)
+        for (command, input_value) in zip(commands, inputs):
+          answered = correlator.accept(command, input_value)
+          if metrics is None:
+            continue
+          if answered is None:
+            metrics.increment('unsolicited_frames')
+          else:
+            request = Command.lookup(answered)
+            name = Instruction.UNSUPPORTED_COMMAND_NAME if request is None else request.name
+            metrics.observe('command_latency_seconds', time.perf_counter() - sent_at, name)
+    except TimeoutError:
+      LOGGER.info(
+        'Timed out waiting for %d of %d responses',
+        correlator.pending_count,
+        len(batch)
+      )
+      if metrics is not None:
+        metrics.increment('timeouts', correlator.pending_count)
+    finally:
+      conn.settimeout(timeout_sec)
+      if metrics is not None:
+        metrics.increment('bytes_sent', len(data))
+        metrics.increment('bytes_received', connection.decoder.bytes_read - bytes_read)
+
+    return bytes(received)
+
+class ResponseCorrelator:
+  """
+  Matches replies received from a device to the requests awaiting them.
+
+  A request is answered by a reply with the same command ID. `Codec` flips the
+  response bit devices set on reply command IDs, so replies and echoes of the
+  request decode to the same ID. Define-machine queries share a command ID and
+  are additionally matched on their input value. An error reply answers the
+  oldest outstanding request.
+
+  Replies that answer no outstanding request are unsolicited (e.g., front panel
+  changes, or late replies to earlier requests.)
+  """
+
+  def __init__(self, requests: Iterable[Instruction]):
+    self._pending: list[Instruction] = list(requests)
+
+  @property
+  def pending(self) -> list[Instruction]:
+    """
+    Requests not yet answered, in the order they were sent
+    """
+    return list(self._pending)
+
+  @property
+  def is_complete(self) -> bool:
+    return len(self._pending) == 0
+
+  def accept(self, reply: Instruction) -> Optional[Instruction]:
+    """
+    Marks the request answered by the reply as complete, returning it, or
+    `None` when the reply is unsolicited.
+    """
+    pending = self._pending
+    for index, request in enumerate(pending):
+      if ResponseCorrelator.is_response_to(request, reply):
+        del pending[index]
+        return request
+    if reply.id == Command.ERROR and len(pending) > 0:
+      return pending.pop(0)
+    return None
+
+  @staticmethod
+  def is_response_to(request: Instruction, reply: Instruction) -> bool:
+    if request.id != reply.id:
+      return False
+    if request.id == Command.DEFINE_MACHINE:
+      # Input and output count queries share a command ID; the input value
+      # distinguishes them.
+      return request.input_value == reply.input_value
+    return True
+
+class FrameCorrelator:
+  """
+  Matches replies to the requests of an `InstructionBatch`, following the same
+  rules as `ResponseCorrelator`.
+
+  Requests are tracked as counts of outstanding `(command ID, input value)`
+  pairs rather than as instructions, so correlating a large batch builds no
+  per-request objects. The input value only distinguishes define-machine
+  queries.
+  """
+
+  def __init__(self, batch: InstructionBatch):
+    self._pending: dict[tuple[int, int], int] = {}
+    for ((command, input_value), count) in Counter(zip(batch.commands, batch.inputs)).items():
+      key = FrameCorrelator._key(command, input_value)
+      self._pending[key] = self._pending.get(key, 0) + count
+    self._pending_count = len(batch)
+
+  @property
+  def pending_count(self) -> int:
+    return self._pending_count
+
+  @property
+  def is_complete(self) -> bool:
+    return self._pending_count == 0
+
+  def accept(self, command: int, input_value: int) -> Optional[int]:
+    """
+    Marks a request answered by the reply as complete, returning its command
+    ID, or `None` when the reply is unsolicited.
+    """
+    key = FrameCorrelator._key(command, input_value)
+    if key not in self._pending:
+      if command != Command.ERROR or self._pending_count == 0:
+        return None
+      # Error replies answer the earliest outstanding kind of request
+      key = next(iter(self._pending))
+    count = self._pending[key] - 1
+    if count == 0:
+      del self._pending[key]
+    else:
+      self._pending[key] = count
+    self._pending_count -= 1
+    return key[0]
+
+  @staticmethod
+  def _key(command: int, input_value: int) -> tuple[int, int]:
+    return (command, input_value if command == Command.DEFINE_MACHINE else 0)
@@ -0,0 +1,207 @@
+from array import array
+from typing import Iterator, Mapping, Optional
+
+from ..constants import LOGGER
+from ..matrix_switch import MatrixSwitch as MatrixSwitchProtocol
+from .io import Command, Instruction, TcpDevice
+from .switch_state import SwitchState
+
+class MatrixSwitch(SwitchState, MatrixSwitchProtocol):
+  """
+  Protocol 2000 matrix switch.
+
+  The routing table is held in a compact array indexed by output. Refreshes
+  query every output in a single pipelined batch, and route changes are sent
+  in a single write.
+  """
+  def __init__(self, device: TcpDevice, machine_id: Optional[int] = None):
+    super().__init__()
+    self._device = device
+    self._machine_id = machine_id
+    # Input routed to each output; index 0 holds output 1
+    self._routes = array('B')
+    self.update()
+
+  def route(self, output: int, input: int) -> None:
+    """
+    Route the specified input to the specified output
+    """
+    self.route_many({output: input})
+
+  def route_many(self, routes: Mapping[int, int]) -> None:
+    """
+    Apply several routes at once, given as a mapping of output to input. Only
+    routes that differ from the current routing are sent to the device.
+
+    The routing table changes as the device confirms each route, so routes the
+    device rejects or never answers are left as they were.
+    """
+    # Validate every route up front, so that an invalid one changes nothing
+    for (output, input) in routes.items():
+      self._validate_route(output, input)
+
+    instructions = [
+      Instruction(Command.SWITCH_VIDEO, input, output, self._machine_id)
+      for (output, input) in routes.items()
+      if self._routes[output - 1] != input
+    ]
+
+    if len(instructions) > 0:
+      self._process(instructions)
+
+  def source_for(self, output: int) -> int:
+    """
+    Returns the input number routed to the specified output
+    """
+    if output < 1 or output > self._output_count:
+      raise ValueError(
+        f'Valid outputs are between 1 and {self._output_count}, inclusive. '
+        f'Received: {output}'
+      )
+    return self._routes[output - 1]
+
+  def lock(self) -> None:
+    """
+    Lock panel
+    """
+    self._is_locked = True
+    self._process(Instruction(Command.PANEL_LOCK, 1, None, self._machine_id))
+
+  def unlock(self) -> None:
+    """
+    Unlock panel
+    """
+    self._is_locked = False
+    self._process(Instruction(Command.PANEL_LOCK, 0, None, self._machine_id))
+
+  def update(self) -> None:
+    if self._output_count == 0:
+      # Output count is needed to know which outputs to query
+      self._process(self._definition_instructions())
+      if self._output_count > 0:
+        self._process(self._status_instructions())
+    else:
+      self._process(self._definition_instructions() + self._status_instructions())
+
+  def close(self) -> None:
+    self._device.close()
+
+  @property
+  def routes(self) -> dict[int, int]:
+    """
+    Returns the routing table as a mapping of output to input
+    """
+    return {output: input for (output, input) in enumerate(self._routes, start = 1)}
+
+  @property
+  def is_locked(self) -> bool:
+    """
+    Returns `true` when panel is locked, `false` otherwise.
+    """
+    return self._is_locked
+
+  @property
+  def input_count(self) -> int:
+    """
+    The number of inputs the switch has
+    """
+    return self._input_count
+
+  @property
+  def output_count(self) -> int:
+    """
+    The number of outputs the switch has
+    """
+    return self._output_count
+
+  @property
+  def machine_id(self) -> int | None :
+    return self._machine_id
+
+  def _validate_route(self, output: int, input: int) -> None:
+    if output < 1 or output > self._output_count:
+      raise ValueError(
+        f'Valid outputs are between 1 and {self._output_count}, inclusive. '
+        f'Received: {output}'
+      )
+    if input < 0 or input > self._input_count:
+      raise ValueError(
+        f'Valid inputs are between 0 and {self._input_count}, inclusive. '
+        f'Received: {input}'
+      )
+
+  def _process(self, instructions: list[Instruction] | Instruction) -> None:
+    if isinstance(instructions, Instruction):
+      instructions = [instructions]
+    results = self._device.process(instructions, pipelined = True)
+    # Status replies don't identify their output, but are answered in order,
+    # so pair them with the outputs that were queried.
+    queried_outputs = [
+      instruction.output_value
+      for instruction in instructions
+      if instruction.id == Command.QUERY_OUTPUT_STATUS
+    ]
+    status_count = sum(1 for result in results if result.id == Command.QUERY_OUTPUT_STATUS)
+    if status_count != len(queried_outputs):
+      # A missing (e.g., errored or timed out) or extra reply would shift every
+      # route after it onto the wrong output, so keep the current routes instead
+      LOGGER.warning(
+        'Discarded %d status replies to %d output queries',
+        status_count,
+        len(queried_outputs)
+      )
+      queried_outputs = []
+    self._update_from_instructions(results, iter(queried_outputs))
+
+  def _update_from_instructions(
+      self,
+      instructions: list[Instruction],
+      queried_outputs: Optional[Iterator[int]] = None
+    ) -> None:
+    if queried_outputs is None:
+      queried_outputs = iter(())
+    for instruction in instructions:
+      match instruction.id:
+        case Command.SWITCH_VIDEO:
+          self._apply_route(instruction.output_value, instruction.input_value)
+        case Command.QUERY_OUTPUT_STATUS:
+          output = next(queried_outputs, None)
+          if output is not None:
+            self._apply_route(output, instruction.output_value)
+        case _:
+          if not self._apply_switch_instruction(instruction):
+            LOGGER.info('Discarded instruction: %s', instruction)
+
+  def _apply_route(self, output: int, input: int) -> None:
+    if output == 0:
+      # Output 0 addresses every output
+      for index in range(len(self._routes)):
+        self._routes[index] = input
+    elif output <= len(self._routes):
+      self._routes[output - 1] = input
+
+  def _set_output_count(self, output_count: int) -> None:
+    # The routing table holds one entry per output
+    super()._set_output_count(output_count)
+    current = len(self._routes)
+    if output_count > current:
+      self._routes.extend(bytes(output_count - current))
+    elif output_count < current:
+      del self._routes[output_count:]
+
+  def _definition_instructions(self) -> list[Instruction]:
+    return [
+      # Queries the number of inputs
+      Instruction(Command.DEFINE_MACHINE, 1, 1, self._machine_id),
+      # Queries the number of outputs
+      Instruction(Command.DEFINE_MACHINE, 2, 1, self._machine_id),
+      # Queries the panel lock status
+      Instruction(Command.QUERY_PANEL_LOCK, None, None, self._machine_id),
+    ]
+
+  def _status_instructions(self) -> list[Instruction]:
+    # Queries which input is routed to each output
+    return [
+      Instruction(Command.QUERY_OUTPUT_STATUS, 0, output, self._machine_id)
+      for output in range(1, self._output_count + 1)
+    ]
@@ -1,57 +1,53 @@
-from typing import Optional
+import threading
+import time
 
-from ..constants import LOGGER
-from ..media_switch import MediaSwitch as MediaSwitchProtocol
+from typing import Callable, Optional
+
+from ..constants import LOGGER, \
+  DISCOVERY_BACKGROUND, DISCOVERY_EAGER, DISCOVERY_LAZY, DISCOVERY_MODES
+from ..media_switch import \
+  AsyncMediaSwitch as AsyncMediaSwitchProtocol, \
+  MediaSwitch as MediaSwitchProtocol
+from .async_io import AsyncTcpDevice
 from .io import Command, Instruction, TcpDevice
+from .metrics import METRICS, MetricsRegistry
+from .switch_state import SwitchState
 
-class MediaSwitch(MediaSwitchProtocol):
-  def __init__(self, device: TcpDevice, machine_id: Optional[int] = None):
-    self._device = device 
+class _MediaSwitchState(SwitchState):
+  """
+  Device state and instruction handling shared by the blocking and asyncio
+  media switch implementations.
+
+  State is only changed while holding `_state_lock`, so that threads sharing a
+  switch never observe a partially applied update.
+  """
+  def __init__(self, machine_id: Optional[int] = None):
+    super().__init__()
     self._machine_id = machine_id
-    self._is_locked = False
+    self._state_lock = threading.RLock()
     self._selected_source = 0
-    self._input_count = 0
-    self._output_count = 0
-    self.update()
+    self._listeners: list[Callable] = []
+    self._notified_state = self._state()
 
-  def select_source(self, input: int) -> None:
+  def add_listener(self, callback: Callable) -> None:
     """
-    Select the specified video input
+    Registers a callback that is invoked with the media switch whenever its
+    state changes.
     """
-    normalized_input = input
-    if normalized_input < 0:
-      normalized_input = 0
-    elif normalized_input > self._input_count:
-      normalized_input = self._input_count
-
-    instruction = Instruction(Command.SWITCH_VIDEO, normalized_input, None, self._machine_id)
-    self._selected_source = normalized_input
-    self._process(instruction)
+    self._listeners.append(callback)
 
-  def lock(self):
+  def remove_listener(self, callback: Callable) -> None:
     """
-    Lock panel
+    Unregisters a callback added with `add_listener`
     """
-    instruction = Instruction(Command.PANEL_LOCK, 1, None, self._machine_id)
-    self._is_locked = True
-    self._process(instruction)
-
-  def unlock(self):
-    """
-    Unlock panel
-    """
-    instruction = Instruction(Command.PANEL_LOCK, 0, None, self._machine_id)
-    self._is_locked = False
-    self._process(instruction)
-  
-  def update(self) -> None:
-    self._process(self._update_instructions())
+    self._listeners.remove(callback)
 
   @property
   def selected_source(self) -> int:
     """
     Returns the input number of the selected source
     """
+    self._before_read()
     return self._selected_source
 
   @property
@@ -59,6 +55,7 @@ class MediaSwitch(MediaSwitchProtocol):
     """
     The number of inputs the switch has
     """
+    self._before_read()
     return self._input_count
 
   @property
@@ -66,6 +63,7 @@ class MediaSwitch(MediaSwitchProtocol):
     """
     The number of outputs the switch has
     """
+    self._before_read()
     return self._output_count
 
   @property
@@ -73,35 +71,70 @@ class MediaSwitch(MediaSwitchProtocol):
     """
     Returns `true` when panel is locked, `false` otherwise.
     """
+    self._before_read()
     return self._is_locked
 
   @property
   def machine_id(self) -> int | None :
     return self._machine_id
 
-  def _process(self, instructions: list[Instruction] | Instruction) -> None:
-    results = self._device.process(instructions)
-    self._update_from_instructions(results)
+  def _select_source_instruction(self, input: int) -> Instruction:
+    with self._state_lock:
+      normalized_input = input
+      if normalized_input < 0:
+        normalized_input = 0
+      elif normalized_input > self._input_count:
+        normalized_input = self._input_count
+
+      instruction = Instruction(Command.SWITCH_VIDEO, normalized_input, None, self._machine_id)
+      self._selected_source = normalized_input
+    return instruction
+
+  def _panel_lock_instruction(self, is_locked: bool) -> Instruction:
+    instruction = Instruction(Command.PANEL_LOCK, int(is_locked), None, self._machine_id)
+    with self._state_lock:
+      self._is_locked = is_locked
+    return instruction
+
+  def _before_read(self) -> None:
+    """
+    Hook invoked before state is read through a property
+    """
+
+  def _state(self) -> tuple:
+    with self._state_lock:
+      return (
+        self._selected_source,
+        self._is_locked,
+        self._input_count,
+        self._output_count
+      )
+
+  def _notify_if_changed(self) -> None:
+    # Listeners are invoked outside the lock, so that they may read the switch
+    with self._state_lock:
+      state = self._state()
+      if state == self._notified_state:
+        return
+      self._notified_state = state
+    for callback in list(self._listeners):
+      try:
+        callback(self)
+      except Exception:
+        LOGGER.exception('Media switch listener failed')
 
   def _update_from_instructions(self, instructions: list[Instruction]) -> None:
-    for instruction in instructions:
-      match instruction.id:
-        case Command.DEFINE_MACHINE:
-          if instruction.input_value == 1:
-            self._input_count = instruction.output_value
-          elif instruction.input_value == 2:
-            self._output_count = instruction.output_value
-        case Command.PANEL_LOCK:
-          self._is_locked = (instruction.input_value == 1)
-        case Command.SWITCH_VIDEO:
-          self._selected_source = instruction.input_value
-        case Command.QUERY_OUTPUT_STATUS:
-          self._selected_source = instruction.output_value
-        case Command.QUERY_PANEL_LOCK:
-          self._is_locked = (instruction.output_value == 1)
-        case _:
-          LOGGER.info('Discarded instruction: %s', instruction)
-  
+    with self._state_lock:
+      for instruction in instructions:
+        match instruction.id:
+          case Command.SWITCH_VIDEO:
+            self._selected_source = instruction.input_value
+          case Command.QUERY_OUTPUT_STATUS:
+            self._selected_source = instruction.output_value
+          case _:
+            if not self._apply_switch_instruction(instruction):
+              LOGGER.info('Discarded instruction: %s', instruction)
+
   def _update_instructions(self) -> list[Instruction]:
     return [
       # Queries the number of inputs
@@ -114,4 +147,349 @@ class MediaSwitch(MediaSwitchProtocol):
       Instruction(Command.QUERY_PANEL_LOCK, None, None, self._machine_id),
     ]
 
+class MediaSwitch(_MediaSwitchState, MediaSwitchProtocol):
+  """
+  Protocol 2000 media switch.
+
+  Concurrent calls to `update()` share a single in-flight refresh. When
+  `max_age_sec` is set, `update()` is skipped while state is newer than that.
+  With `stale_while_revalidate` also set, reading stale state returns
+  immediately and starts a refresh in the background.
+
+  `discovery` controls when initial state is loaded:
+    + eager (default): during construction
+    + lazy: on first state read or source selection
+    + background: in a background thread started during construction
+
+  With lazy or background discovery, construction performs no I/O and state is
+  unknown (see `is_ready`) until discovery completes.
+
+  With `coalesce_window_sec` set, commands issued within that many seconds of
+  each other, or while an earlier one is in flight, are sent together, and a
+  command that would be fully replaced by a later one is dropped: source
+  selections collapse to the most recent, and repeated identical panel lock
+  commands to one. A lock followed by an unlock is sent as both, in order. The
+  caller of a dropped command returns once its replacement has completed. A
+  window of 0 coalesces only while a command is in flight.
 
+  Refresh latency and skipped or shared updates are recorded in `metrics`
+  (by default, the device's registry) under the device's label, while enabled.
+  """
+  def __init__(
+      self,
+      device: TcpDevice,
+      machine_id: Optional[int] = None,
+      max_age_sec: Optional[float] = None,
+      stale_while_revalidate: bool = False,
+      discovery: str = DISCOVERY_EAGER,
+      metrics: Optional[MetricsRegistry] = None,
+      coalesce_window_sec: Optional[float] = None
+    ):
+    if discovery not in DISCOVERY_MODES:
+      raise ValueError(
+        f'Discovery mode must be one of {", ".join(DISCOVERY_MODES)}. '
+        f'Received: {discovery}'
+      )
+    if stale_while_revalidate and max_age_sec is None:
+      # Without a maximum age, state never goes stale
+      raise ValueError('stale_while_revalidate requires max_age_sec')
+    super().__init__(machine_id)
+    self._device = device 
+    self._max_age_sec = max_age_sec
+    self._stale_while_revalidate = stale_while_revalidate
+    self._discovery = discovery
+    self._updated_at: Optional[float] = None
+    self._is_responsive = False
+    self._ready = threading.Event()
+    self._refresh_lock = threading.Lock()
+    self._refresh_done: Optional[threading.Event] = None
+    if metrics is None:
+      metrics = getattr(device, 'metrics', None) or METRICS
+    self._metrics = metrics
+    self._metrics_label = getattr(device, 'label', None) or type(device).__name__
+    self._coalesce_window_sec = coalesce_window_sec
+    # Most recent pending command of each kind, keyed by command ID
+    # Pending commands, in the order to send them, keyed by `_coalesce_key`
+    self._pending_writes: dict[tuple, tuple[Instruction, threading.Event]] = {}
+    self._writes_lock = threading.Lock()
+    self._is_flushing_writes = False
+
+    if discovery == DISCOVERY_EAGER:
+      self.update()
+    elif discovery == DISCOVERY_BACKGROUND:
+      self._refresh(background = True)
+
+  @property
+  def is_ready(self) -> bool:
+    """
+    Returns `true` once initial discovery of device state has been attempted.
+    Until then, state is unknown and reads return defaults.
+    """
+    return self._ready.is_set()
+
+  def wait_ready(self, timeout_sec: Optional[float] = None) -> bool:
+    """
+    Blocks until initial discovery has been attempted, starting it if lazy.
+    Returns `true` if discovery completed within the timeout.
+    """
+    if self._discovery == DISCOVERY_LAZY and not self._ready.is_set():
+      self._refresh(background = True)
+    return self._ready.wait(timeout_sec)
+
+  @property
+  def is_responsive(self) -> bool:
+    """
+    Returns `true` when the most recent refresh received a response from the
+    device, `false` otherwise.
+    """
+    return self._is_responsive
+
+  @property
+  def is_available(self) -> bool:
+    """
+    Returns `false` while the device is presumed unreachable (see
+    `TcpDevice.is_available`), in which case requests fail without contacting it.
+    """
+    return getattr(self._device, 'is_available', True)
+
+  @property
+  def is_stale(self) -> bool:
+    """
+    Returns `true` when state has never been loaded, or is older than
+    `max_age_sec`.
+    """
+    if self._updated_at is None:
+      return True
+    if self._max_age_sec is None:
+      return False
+    return time.monotonic() - self._updated_at >= self._max_age_sec
+
+  def select_source(self, input: int) -> None:
+    """
+    Select the specified video input
+    """
+    # Input count is needed to validate the input
+    self._ensure_discovered()
+    self._write(self._select_source_instruction(input))
+
+  def lock(self):
+    """
+    Lock panel
+    """
+    self._write(self._panel_lock_instruction(True))
+
+  def unlock(self):
+    """
+    Unlock panel
+    """
+    self._write(self._panel_lock_instruction(False))
+  
+  def update(self, force: bool = False) -> None:
+    """
+    Refresh device state, unless it is newer than `max_age_sec`.
+
+    If a refresh is already in progress, waits for it to complete rather than
+    starting another. `force` refreshes regardless of state age.
+    """
+    if not force and self._max_age_sec is not None and not self.is_stale:
+      if self._metrics.enabled:
+        self._metrics.device(self._metrics_label).increment('updates_skipped')
+      return
+    self._refresh().wait()
+
+  def start_listening(self) -> None:
+    """
+    Keeps the device connection open and applies state changes the device
+    reports on its own (e.g., front panel use) as they happen, notifying
+    listeners. This allows `update()` to be called rarely, if at all.
+    """
+    self._device.start_listening(self._on_unsolicited_instructions)
+
+  def stop_listening(self) -> None:
+    self._device.stop_listening()
+
+  def close(self) -> None:
+    """
+    Stops listening and releases the connection to the device
+    """
+    self._device.close()
+
+  def _process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+    results = self._send(instructions)
+    self._notify_if_changed()
+    return results
+
+  def _send(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+    """
+    Counterpart of `_process` that leaves notifying listeners to the caller
+    """
+    results = self._device.process(instructions)
+    self._update_from_instructions(results)
+    return results
+
+  def _write(self, instruction: Instruction) -> None:
+    if self._coalesce_window_sec is None:
+      self._process(instruction)
+      return
+
+    key = self._coalesce_key(instruction)
+    with self._writes_lock:
+      # Removed and re-added, so that the replacement is sent after commands
+      # issued in between
+      pending = self._pending_writes.pop(key, None)
+      if pending is not None:
+        # Supersede the pending command, completing along with its replacement
+        done = pending[1]
+        if self._metrics.enabled:
+          self._metrics.device(self._metrics_label).increment('writes_coalesced')
+      else:
+        done = threading.Event()
+      self._pending_writes[key] = (instruction, done)
+      start_flushing = not self._is_flushing_writes
+      self._is_flushing_writes = True
+
+    if start_flushing:
+      threading.Thread(
+        target = self._flush_writes,
+        name = 'kesslerav-writes',
+        daemon = True
+      ).start()
+    done.wait()
+
+  @staticmethod
+  def _coalesce_key(instruction: Instruction) -> tuple:
+    # Selecting a source for an output fully replaces an earlier selection, but
+    # panel lock commands only replace identical ones, since each of a lock and
+    # an unlock is observable
+    if instruction.id == Command.SWITCH_VIDEO:
+      return (instruction.id, instruction.output_value)
+    return instruction.frame_tuple
+
+  def _flush_writes(self) -> None:
+    while True:
+      if self._coalesce_window_sec > 0:
+        time.sleep(self._coalesce_window_sec)
+      with self._writes_lock:
+        writes = list(self._pending_writes.values())
+        self._pending_writes.clear()
+        if len(writes) == 0:
+          self._is_flushing_writes = False
+          break
+      try:
+        self._send([instruction for (instruction, _) in writes])
+      except Exception:
+        LOGGER.exception('Failed sending commands to device')
+      finally:
+        for (_, done) in writes:
+          done.set()
+    # Listeners run once this thread has stopped flushing, so that commands they
+    # issue are flushed by a thread of their own rather than waiting on this one
+    self._notify_if_changed()
+
+  def _refresh(self, background: bool = False) -> threading.Event:
+    """
+    Starts a refresh, or joins the one in progress, returning an event that is
+    set when it completes.
+    """
+    with self._refresh_lock:
+      done = self._refresh_done
+      if done is not None:
+        if self._metrics.enabled:
+          self._metrics.device(self._metrics_label).increment('updates_shared')
+        return done
+      done = threading.Event()
+      self._refresh_done = done
+
+    if background:
+      threading.Thread(
+        target = self._run_refresh,
+        args = (done,),
+        name = 'kesslerav-refresh',
+        daemon = True
+      ).start()
+    else:
+      self._run_refresh(done)
+    return done
+
+  def _run_refresh(self, done: threading.Event) -> None:
+    started_at = time.perf_counter() if self._metrics.enabled else None
+    try:
+      results = self._send(self._update_instructions())
+      self._is_responsive = len(results) > 0
+      if self._is_responsive:
+        self._updated_at = time.monotonic()
+    except Exception:
+      self._is_responsive = False
+      LOGGER.exception('Failed refreshing device state')
+    finally:
+      if started_at is not None:
+        self._metrics.device(self._metrics_label).observe(
+          'update_seconds',
+          time.perf_counter() - started_at
+        )
+      with self._refresh_lock:
+        self._refresh_done = None
+      self._ready.set()
+      done.set()
+    # Listeners run once the refresh is complete, so that reading the switch
+    # from a listener does not wait on the refresh notifying it
+    self._notify_if_changed()
+
+  def _ensure_discovered(self) -> None:
+    if self._ready.is_set():
+      return
+    if self._discovery == DISCOVERY_LAZY:
+      self._refresh().wait()
+    else:
+      self._ready.wait()
+
+  def _before_read(self) -> None:
+    if not self._ready.is_set():
+      if self._discovery == DISCOVERY_LAZY:
+        self._refresh().wait()
+      return
+    if self._stale_while_revalidate and self.is_stale:
+      self._refresh(background = True)
+
+  def _on_unsolicited_instructions(self, instructions: list[Instruction]) -> None:
+    self._update_from_instructions(instructions)
+    self._notify_if_changed()
+
+class AsyncMediaSwitch(_MediaSwitchState, AsyncMediaSwitchProtocol):
+  """
+  asyncio counterpart to `MediaSwitch`.
+
+  Construction performs no I/O; await `update()` to load device state.
+  """
+  def __init__(self, device: AsyncTcpDevice, machine_id: Optional[int] = None):
+    super().__init__(machine_id)
+    self._device = device
+
+  async def select_source(self, input: int) -> None:
+    """
+    Select the specified video input
+    """
+    await self._process(self._select_source_instruction(input))
+
+  async def lock(self) -> None:
+    """
+    Lock panel
+    """
+    await self._process(self._panel_lock_instruction(True))
+
+  async def unlock(self) -> None:
+    """
+    Unlock panel
+    """
+    await self._process(self._panel_lock_instruction(False))
+
+  async def update(self) -> None:
+    await self._process(self._update_instructions())
+
+  async def close(self) -> None:
+    await self._device.close()
+
+  async def _process(self, instructions: list[Instruction] | Instruction) -> None:
+    results = await self._device.process(instructions)
+    self._update_from_instructions(results)
+    self._notify_if_changed()
@@ -0,0 +1,213 @@
+import bisect
+import threading
+
+from typing import Optional
+
+# Upper bounds, in seconds, of latency histogram buckets
+DEFAULT_BUCKETS_SEC: tuple[float, ...] = (
+  0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+_PROMETHEUS_PREFIX = 'kesslerav'
+
+# Descriptions of the metrics recorded by the library, for Prometheus export
+_HELP: dict[str, str] = {
+  'command_latency_seconds': 'Time from sending a command to receiving its reply',
+  'connect_seconds': 'Time taken to open a connection to the device',
+  'update_seconds': 'Time taken to refresh media switch state',
+  'bytes_sent': 'Bytes written to the device',
+  'bytes_received': 'Bytes read from the device',
+  'circuit_rejections': 'Requests refused without contacting the device while it was unavailable',
+  'connections': 'Connections opened to the device',
+  'errors': 'Requests that failed with an error',
+  'reconnects': 'Connections re-established after the device dropped them',
+  'timeouts': 'Commands that received no reply before timing out',
+  'unsolicited_frames': 'Frames received that answered no request',
+  'updates_shared': 'Updates that joined a refresh already in flight',
+  'updates_skipped': 'Updates skipped because state was fresh enough',
+  'writes_coalesced': 'Commands superseded by a later command of the same kind',
+}
+
+class Histogram:
+  """
+  Cumulative latency histogram with fixed bucket bounds
+  """
+  __slots__ = ('_bounds', '_counts', '_sum', '_count')
+
+  def __init__(self, bounds: tuple[float, ...] = DEFAULT_BUCKETS_SEC):
+    self._bounds = bounds
+    # Final count holds observations above the largest bound
+    self._counts = [0] * (len(bounds) + 1)
+    self._sum = 0.0
+    self._count = 0
+
+  @property
+  def count(self) -> int:
+    return self._count
+
+  @property
+  def sum(self) -> float:
+    return self._sum
+
+  def observe(self, value: float) -> None:
+    self._counts[bisect.bisect_left(self._bounds, value)] += 1
+    self._sum += value
+    self._count += 1
+
+  def snapshot(self) -> dict:
+    """
+    Returns the histogram with cumulative bucket counts keyed by upper bound
+    """
+    buckets = {}
+    running = 0
+    for (bound, count) in zip(self._bounds, self._counts):
+      running += count
+      buckets[bound] = running
+    buckets[float('inf')] = self._count
+    return {'count': self._count, 'sum': self._sum, 'buckets': buckets}
+
+class DeviceMetrics:
+  """
+  Latency histograms and counters recorded for a single device
+  """
+
+  def __init__(self, device: str, bounds: tuple[float, ...] = DEFAULT_BUCKETS_SEC):
+    self._device = device
+    self._bounds = bounds
+    self._histograms: dict[tuple[str, Optional[str]], Histogram] = {}
+    self._counters: dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  @property
+  def device(self) -> str:
+    return self._device
+
+  def observe(self, metric: str, seconds: float, command: Optional[str] = None) -> None:
+    """
+    Records a latency observation, optionally for a specific command
+    """
+    key = (metric, command)
+    with self._lock:
+      histogram = self._histograms.get(key)
+      if histogram is None:
+        histogram = self._histograms[key] = Histogram(self._bounds)
+      histogram.observe(seconds)
+
+  def increment(self, counter: str, amount: int = 1) -> None:
+    with self._lock:
+      self._counters[counter] = self._counters.get(counter, 0) + amount
+
+  def counter(self, counter: str) -> int:
+    with self._lock:
+      return self._counters.get(counter, 0)
+
+  def histogram(self, metric: str, command: Optional[str] = None) -> Optional[Histogram]:
+    with self._lock:
+      return self._histograms.get((metric, command))
+
+  def snapshot(self) -> dict:
+    """
+    Returns the device's metrics as plain data:
+    `{'counters': {name: value}, 'histograms': {metric: {command: histogram}}}`,
+    with `None` as the command of histograms not recorded per command.
+    """
+    with self._lock:
+      histograms: dict[str, dict] = {}
+      for ((metric, command), histogram) in sorted(
+          self._histograms.items(),
+          key = lambda item: (item[0][0], item[0][1] or '')
+        ):
+        histograms.setdefault(metric, {})[command] = histogram.snapshot()
+      return {'counters': dict(sorted(self._counters.items())), 'histograms': histograms}
+
+class MetricsRegistry:
+  """
+  Collects metrics for every instrumented device.
+
+  Recording is off until `enable()` is called. While disabled, instrumented code
+  skips all measurement, so the cost is a single attribute check per operation.
+  """
+
+  def __init__(self, enabled: bool = False, bounds: tuple[float, ...] = DEFAULT_BUCKETS_SEC):
+    self.enabled = enabled
+    self._bounds = bounds
+    self._devices: dict[str, DeviceMetrics] = {}
+    self._lock = threading.Lock()
+
+  def enable(self) -> None:
+    self.enabled = True
+
+  def disable(self) -> None:
+    self.enabled = False
+
+  def device(self, device: str) -> DeviceMetrics:
+    """
+    Returns the metrics recorded for the device, creating them on first use
+    """
+    metrics = self._devices.get(device)
+    if metrics is None:
+      with self._lock:
+        metrics = self._devices.setdefault(device, DeviceMetrics(device, self._bounds))
+    return metrics
+
+  def reset(self) -> None:
+    with self._lock:
+      self._devices.clear()
+
+  def snapshot(self) -> dict[str, dict]:
+    """
+    Returns the metrics of every device, keyed by device
+    """
+    with self._lock:
+      devices = sorted(self._devices.items())
+    return {device: metrics.snapshot() for (device, metrics) in devices}
+
+  def to_prometheus(self) -> str:
+    """
+    Renders every metric in the Prometheus text exposition format
+    """
+    # Group samples by metric, since each metric's samples must be contiguous
+    counters: dict[str, list[str]] = {}
+    histograms: dict[str, list[str]] = {}
+    for (device, snapshot) in self.snapshot().items():
+      for (counter, value) in snapshot['counters'].items():
+        labels = _labels(device = device)
+        counters.setdefault(counter, []).append(
+          f'{_PROMETHEUS_PREFIX}_{counter}_total{labels} {value}'
+        )
+      for (metric, by_command) in snapshot['histograms'].items():
+        samples = histograms.setdefault(metric, [])
+        for (command, histogram) in by_command.items():
+          name = f'{_PROMETHEUS_PREFIX}_{metric}'
+          for (bound, count) in histogram['buckets'].items():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append(f'{name}_bucket{_labels(device = device, command = command, le = le)} {count}')
+          labels = _labels(device = device, command = command)
+          samples.append(f'{name}_sum{labels} {histogram["sum"]!r}')
+          samples.append(f'{name}_count{labels} {histogram["count"]}')
+
+    lines = []
+    for (metric, samples) in sorted(histograms.items()):
+      name = f'{_PROMETHEUS_PREFIX}_{metric}'
+      lines.append(f'# HELP {name} {_HELP.get(metric, metric)}')
+      lines.append(f'# TYPE {name} histogram')
+      lines.extend(samples)
+    for (counter, samples) in sorted(counters.items()):
+      name = f'{_PROMETHEUS_PREFIX}_{counter}_total'
+      lines.append(f'# HELP {name} {_HELP.get(counter, counter)}')
+      lines.append(f'# TYPE {name} counter')
+      lines.extend(samples)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+def _labels(**labels: Optional[str]) -> str:
+  rendered = ','.join(
+    f'{name}="{_escape(value)}"'
+    for (name, value) in labels.items() if value is not None
+  )
+  return f'{{{rendered}}}'
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Registry used by devices and media switches not given their own
+METRICS = MetricsRegistry()
@@ -0,0 +1,339 @@
+"""
+Reads and replays binary captures recorded with `capture.WireCapture`.
+
+Capture files are memory-mapped and decoded a chunk of records at a time, so
+captures far larger than memory can be summarized, decoded or replayed.
+
+Usage:
+  python -m kesslerav.protocol2k.replay summary CAPTURE [CAPTURE ...]
+  python -m kesslerav.protocol2k.replay dump CAPTURE [--direction sent|received]
+  python -m kesslerav.protocol2k.replay serve CAPTURE [--port PORT] [--speed N]
+"""
+import argparse
+import itertools
+import mmap
+import os
+import socket
+import time
+
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .capture import \
+  CAPTURE_MAGIC, CAPTURE_VERSION, HEADER_FORMAT, RECORD_DIRECTION_OFFSET, \
+  RECORD_FORMAT, RECORD_FRAME_OFFSET, Direction, capture_paths
+from .io import \
+  _VALUE_DECODE_TABLE, _VALID_VALUE_BYTES, Codec, Command, Instruction, InstructionBatch
+
+# Encoded value bytes that decode to a valid value
+_VALID_ENCODED_VALUE_BYTES: bytes = bytes(
+  b for b in range(256) if _VALUE_DECODE_TABLE[b] in _VALID_VALUE_BYTES
+)
+
+class CaptureReader:
+  """
+  Memory-mapped, read-only view of a capture file
+  """
+  # Records decoded at a time when iterating in bulk
+  DEFAULT_CHUNK_RECORDS: int = 4096
+
+  def __init__(self, path: str | os.PathLike):
+    self._path = Path(path)
+    with open(self._path, 'rb') as file:
+      size = os.fstat(file.fileno()).st_size
+      if size < HEADER_FORMAT.size:
+        raise ValueError(f'Not a capture file: {self._path}')
+      self._map = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+    (magic, version, record_size) = HEADER_FORMAT.unpack_from(self._map)
+    if magic != CAPTURE_MAGIC:
+      self._map.close()
+      raise ValueError(f'Not a capture file: {self._path}')
+    if version != CAPTURE_VERSION or record_size != RECORD_FORMAT.size:
+      self._map.close()
+      raise ValueError(f'Unsupported capture format version {version}: {self._path}')
+    # A record cut short (e.g., by a crash mid-write) is ignored
+    self._count = (size - HEADER_FORMAT.size) // RECORD_FORMAT.size
+    self._view = memoryview(self._map)[
+      HEADER_FORMAT.size:HEADER_FORMAT.size + self._count * RECORD_FORMAT.size
+    ]
+
+  @property
+  def path(self) -> Path:
+    return self._path
+
+  @property
+  def start_ns(self) -> Optional[int]:
+    """
+    Timestamp of the first record, or `None` when the capture is empty
+    """
+    return self.record(0)[0] if self._count > 0 else None
+
+  @property
+  def end_ns(self) -> Optional[int]:
+    """
+    Timestamp of the last record, or `None` when the capture is empty
+    """
+    return self.record(self._count - 1)[0] if self._count > 0 else None
+
+  def __len__(self) -> int:
+    return self._count
+
+  def record(self, index: int) -> tuple[int, Direction, bytes]:
+    """
+    Returns the `(timestamp_ns, direction, frame)` of the record at the index
+    """
+    if index < 0:
+      index += self._count
+    if not 0 <= index < self._count:
+      raise IndexError('Record index out of range')
+    (timestamp_ns, direction, frame) = RECORD_FORMAT.unpack_from(
+      self._view,
+      index * RECORD_FORMAT.size
+    )
+    return (timestamp_ns, Direction(direction), frame)
+
+  def records(self, direction: Optional[Direction] = None) -> Iterator[tuple[int, Direction, bytes]]:
+    """
+    Yields the `(timestamp_ns, direction, frame)` of each record, in order,
+    optionally limited to one direction
+    """
+    for (timestamp_ns, record_direction, frame) in RECORD_FORMAT.iter_unpack(self._view):
+      if direction is None or record_direction == direction:
+        yield (timestamp_ns, Direction(record_direction), frame)
+
+  def instructions(self, direction: Optional[Direction] = None) -> Iterator[Instruction]:
+    for batch in self.batches(direction):
+      yield from batch
+
+  def batches(
+      self,
+      direction: Optional[Direction] = None,
+      chunk_records: int = DEFAULT_CHUNK_RECORDS
+    ) -> Iterator[InstructionBatch]:
+    """
+    Yields the captured frames decoded as batches of at most `chunk_records`
+    instructions, optionally limited to one direction. Frames that do not
+    decode (e.g., garbled by a misbehaving device) are skipped; `summary`
+    counts them.
+    """
+    for data in self._frame_chunks(direction, chunk_records):
+      (data, _) = _valid_frames(data)
+      if len(data) > 0:
+        yield Codec.decode_batch(data)
+
+  def summary(self) -> dict:
+    """
+    Returns the record count, time span, per-direction frame counts by command
+    name, and per-direction counts of frames that do not decode
+    """
+    commands: dict[Direction, Counter] = {direction: Counter() for direction in Direction}
+    invalid = {direction: 0 for direction in Direction}
+    for direction in Direction:
+      for data in self._frame_chunks(direction, CaptureReader.DEFAULT_CHUNK_RECORDS):
+        (data, invalid_count) = _valid_frames(data)
+        invalid[direction] += invalid_count
+        commands[direction].update(Codec.decode_batch(data).commands)
+    return {
+      'path': str(self._path),
+      'records': self._count,
+      'start_ns': self.start_ns,
+      'end_ns': self.end_ns,
+      'commands': {
+        direction.name.lower(): {
+          _command_name(command): count for (command, count) in sorted(counts.items())
+        }
+        for (direction, counts) in commands.items()
+      },
+      'invalid_frames': {direction.name.lower(): count for (direction, count) in invalid.items()},
+    }
+
+  def close(self) -> None:
+    self._view.release()
+    self._map.close()
+
+  def __enter__(self) -> 'CaptureReader':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def _frame_chunks(self, direction: Optional[Direction], chunk_records: int) -> Iterator[bytes]:
+    # Yields the encoded frames of each chunk of records, by slicing the fields
+    # out of the mapped records a column at a time
+    record_size = RECORD_FORMAT.size
+    chunk_bytes = chunk_records * record_size
+    for start in range(0, len(self._view), chunk_bytes):
+      chunk = self._view[start:start + chunk_bytes].tobytes()
+      columns = [
+        chunk[RECORD_FRAME_OFFSET + offset::record_size]
+        for offset in range(Instruction.SIZE_BYTES)
+      ]
+      if direction is not None:
+        selected = [
+          record_direction == direction
+          for record_direction in chunk[RECORD_DIRECTION_OFFSET::record_size]
+        ]
+        if not any(selected):
+          continue
+        if not all(selected):
+          columns = [bytes(itertools.compress(column, selected)) for column in columns]
+      data = bytearray(len(columns[0]) * Instruction.SIZE_BYTES)
+      for (offset, column) in enumerate(columns):
+        data[offset::Instruction.SIZE_BYTES] = column
+      yield bytes(data)
+
+def _valid_frames(data: bytes) -> tuple[bytes, int]:
+  """
+  Returns the frames whose values decode, along with the number dropped
+  """
+  size = Instruction.SIZE_BYTES
+  values = b''.join(data[offset::size] for offset in range(1, size))
+  if len(values.translate(None, _VALID_ENCODED_VALUE_BYTES)) == 0:
+    return (data, 0)
+  frames = [data[start:start + size] for start in range(0, len(data), size)]
+  valid = [frame for frame in frames if len(frame[1:].translate(None, _VALID_ENCODED_VALUE_BYTES)) == 0]
+  return (b''.join(valid), len(frames) - len(valid))
+
+def _describe_frame(frame: bytes) -> str:
+  try:
+    return repr(Codec.decode(frame))
+  except ValueError:
+    return '<invalid frame>'
+
+def _command_name(command_id: int) -> str:
+  command = Command.lookup(command_id)
+  return Instruction.UNSUPPORTED_COMMAND_NAME if command is None else command.name
+
+def open_captures(path: str | os.PathLike) -> list[CaptureReader]:
+  """
+  Opens the capture file and its rotated backups, oldest first
+  """
+  return [CaptureReader(capture_path) for capture_path in capture_paths(path)]
+
+def apply_to_switch(reader: CaptureReader, media_switch) -> int:
+  """
+  Applies every instruction received in the capture to the media switch's
+  state, as if the switch had processed them, returning the number applied.
+  Frames that do not decode are skipped. Listeners are notified once, after
+  the whole capture is applied.
+  """
+  count = 0
+  for batch in reader.batches(Direction.RECEIVED):
+    media_switch._update_from_instructions(batch)
+    count += len(batch)
+  media_switch._notify_if_changed()
+  return count
+
+_MAX_PENDING_BYTES = 64 * 1024
+
+def play(
+    reader: CaptureReader,
+    conn: socket.socket,
+    speed: Optional[float] = 1.0,
+    direction: Direction = Direction.RECEIVED
+  ) -> int:
+  """
+  Writes the captured frames travelling in `direction` to the socket, returning
+  the number written.
+
+  Frames are paced by their recorded timestamps, sped up by a factor of
+  `speed`. With `speed` of `None`, frames are written as fast as possible.
+  """
+  if speed is not None and speed <= 0:
+    raise ValueError(f'speed must be positive. Received: {speed}')
+  count = 0
+  started_at = time.monotonic()
+  first_ns = None
+  # Frames due at the same time are sent together
+  pending = bytearray()
+  for (timestamp_ns, _, frame) in reader.records(direction):
+    if speed is not None:
+      if first_ns is None:
+        first_ns = timestamp_ns
+      delay = started_at + (timestamp_ns - first_ns) / 1e9 / speed - time.monotonic()
+      if delay > 0:
+        if len(pending) > 0:
+          conn.sendall(pending)
+          pending.clear()
+        time.sleep(delay)
+    pending += frame
+    count += 1
+    if len(pending) >= _MAX_PENDING_BYTES:
+      conn.sendall(pending)
+      pending.clear()
+  if len(pending) > 0:
+    conn.sendall(pending)
+  return count
+
+def serve(
+    reader: CaptureReader,
+    host: str = '127.0.0.1',
+    port: int = 0,
+    speed: Optional[float] = 1.0,
+    on_listening = None
+  ) -> int:
+  """
+  Accepts a single connection and plays the frames the device sent to it,
+  returning the number written. `on_listening` is called with the bound
+  address once the server is ready.
+  """
+  with socket.create_server((host, port)) as server:
+    if on_listening is not None:
+      on_listening(server.getsockname())
+    (conn, _) = server.accept()
+    with conn:
+      return play(reader, conn, speed)
+
+def _format_ns(timestamp_ns: Optional[int]) -> str:
+  if timestamp_ns is None:
+    return '-'
+  return datetime.fromtimestamp(timestamp_ns / 1e9, timezone.utc).isoformat()
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+  commands = parser.add_subparsers(dest = 'command', required = True)
+  summary_parser = commands.add_parser('summary', help = 'count records by direction and command')
+  summary_parser.add_argument('paths', nargs = '+', type = Path, metavar = 'CAPTURE')
+  dump_parser = commands.add_parser('dump', help = 'print each record')
+  dump_parser.add_argument('path', type = Path, metavar = 'CAPTURE')
+  dump_parser.add_argument('--direction', choices = ['sent', 'received'])
+  serve_parser = commands.add_parser('serve', help = 'play received frames to one TCP client')
+  serve_parser.add_argument('path', type = Path, metavar = 'CAPTURE')
+  serve_parser.add_argument('--host', default = '127.0.0.1')
+  serve_parser.add_argument('--port', type = int, default = 0)
+  serve_parser.add_argument('--speed', type = float, default = 1.0,
+    help = 'playback speed multiplier (0: as fast as possible)')
+  args = parser.parse_args()
+
+  if args.command == 'summary':
+    for path in args.paths:
+      with CaptureReader(path) as reader:
+        summary = reader.summary()
+      print(f'{path}: {summary["records"]} records, '
+        f'{_format_ns(summary["start_ns"])} to {_format_ns(summary["end_ns"])}')
+      for (direction, counts) in summary['commands'].items():
+        for (name, count) in counts.items():
+          print(f'  {direction:<8} {name:<20} {count}')
+        invalid_count = summary['invalid_frames'][direction]
+        if invalid_count > 0:
+          print(f'  {direction:<8} {"(invalid)":<20} {invalid_count}')
+  elif args.command == 'dump':
+    direction = None if args.direction is None else Direction[args.direction.upper()]
+    with CaptureReader(args.path) as reader:
+      for (timestamp_ns, record_direction, frame) in reader.records(direction):
+        print(f'{_format_ns(timestamp_ns)} {record_direction.name.lower():<8} '
+          f'{frame.hex()} {_describe_frame(frame)}')
+  else:
+    with CaptureReader(args.path) as reader:
+      serve(
+        reader,
+        args.host,
+        args.port,
+        speed = args.speed or None,
+        on_listening = lambda address: print(f'tcp://{address[0]}:{address[1]}', flush = True)
+      )
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,446 @@
+import os
+import select
+import threading
+import time
+
+from collections import deque
+from ..constants import LOGGER
+from typing import Callable, Optional
+
+from .io import Codec, FrameDecoder, Instruction, ResponseCorrelator
+
+class SerialEndpoint:
+  """
+  Protocol 2000 serial port location and line settings
+  """
+  DEFAULT_BAUD_RATE: int = 9600
+  DEFAULT_TIMEOUT_SEC: float = 0.5
+  # 8N1 framing: a start bit, 8 data bits and a stop bit per byte
+  BITS_PER_BYTE: int = 10
+
+  def __init__(
+      self,
+      path: str,
+      baud_rate: int = DEFAULT_BAUD_RATE,
+      timeout_sec: Optional[float] = DEFAULT_TIMEOUT_SEC
+    ):
+    # POSIX only, so imported here rather than with the rest of the package
+    import termios
+    if not hasattr(termios, f'B{baud_rate}'):
+      raise ValueError(f'Unsupported baud rate: {baud_rate}')
+    self._path = path
+    self._baud_rate = baud_rate
+    self._timeout_sec = timeout_sec
+
+  @property
+  def path(self) -> str:
+    return self._path
+
+  @property
+  def baud_rate(self) -> int:
+    return self._baud_rate
+
+  @property
+  def timeout_sec(self) -> Optional[float]:
+    return self._timeout_sec
+
+  def transmit_time_sec(self, byte_count: int) -> float:
+    """
+    How long the line takes to transmit `byte_count` bytes
+    """
+    return byte_count * SerialEndpoint.BITS_PER_BYTE / self._baud_rate
+
+class _BusRequest:
+  def __init__(self, machine_id: int, instructions: list[Instruction], pipelined: bool):
+    self.machine_id = machine_id
+    self.instructions = instructions
+    self.pipelined = pipelined
+    self.results: list[Instruction] = []
+    self.done = threading.Event()
+
+class SerialBus:
+  """
+  Schedules the Protocol 2000 traffic of every device on one serial port.
+
+  RS-485 buses are half duplex, so one exchange is on the line at a time. Each
+  device's requests queue by machine ID, and the scheduler serves the queues
+  round robin, one request per turn, so a chatty device cannot starve the rest.
+  Replies are routed to devices by their machine ID, and writes are paced to the
+  line's baud rate.
+
+  Use `SerialBus.acquire()` to share a single bus per port path.
+  """
+  # Largest single read from the port
+  READ_SIZE_BYTES: int = 4096
+  # How long to wait before reading again after the port fails
+  RETRY_INTERVAL_SEC: float = 1.0
+
+  _buses: dict[str, 'SerialBus'] = {}
+  _buses_lock = threading.Lock()
+
+  def __init__(self, endpoint: SerialEndpoint):
+    self._endpoint = endpoint
+    self._fd = self._open(endpoint)
+    (self._wake_reader, self._wake_writer) = os.pipe()
+    os.set_blocking(self._wake_reader, False)
+    os.set_blocking(self._wake_writer, False)
+    self._decoder = FrameDecoder()
+    self._lock = threading.Lock()
+    self._queues: dict[int, deque[_BusRequest]] = {}
+    self._rotation: deque[int] = deque()
+    self._devices: dict[int, Callable[[list[Instruction]], None]] = {}
+    self._line_free_at = 0.0
+    self._ref_count = 0
+    self._closed = False
+    self._scheduler = threading.Thread(
+      target = self._schedule,
+      name = f'kesslerav-serial-{endpoint.path}',
+      daemon = True
+    )
+    self._scheduler.start()
+
+  @classmethod
+  def acquire(cls, endpoint: SerialEndpoint) -> 'SerialBus':
+    """
+    Returns the bus for the endpoint's port, opening it on first use. Each call
+    must be paired with a `release()`.
+    """
+    with cls._buses_lock:
+      bus = cls._buses.get(endpoint.path)
+      if bus is None:
+        bus = SerialBus(endpoint)
+        cls._buses[endpoint.path] = bus
+      elif bus.endpoint.baud_rate != endpoint.baud_rate:
+        raise ValueError(
+          f'{endpoint.path} is already open at {bus.endpoint.baud_rate} baud. '
+          f'Received: {endpoint.baud_rate}'
+        )
+      bus._ref_count += 1
+      return bus
+
+  def release(self) -> None:
+    """
+    Releases a reference taken by `acquire()`, closing the bus with the last
+    """
+    with SerialBus._buses_lock:
+      self._ref_count -= 1
+      if self._ref_count > 0:
+        return
+      if SerialBus._buses.get(self._endpoint.path) is self:
+        del SerialBus._buses[self._endpoint.path]
+    self.close()
+
+  @property
+  def endpoint(self) -> SerialEndpoint:
+    return self._endpoint
+
+  @property
+  def pending_count(self) -> int:
+    """
+    Number of requests waiting for their turn on the line
+    """
+    with self._lock:
+      return sum(len(queue) for queue in self._queues.values())
+
+  def register(self, machine_id: int, on_instructions: Callable[[list[Instruction]], None]) -> None:
+    """
+    Routes replies and unsolicited instructions from `machine_id` that answer
+    no request to `on_instructions`
+    """
+    with self._lock:
+      if machine_id in self._devices:
+        raise ValueError(f'Machine ID {machine_id} is already in use on {self._endpoint.path}')
+      self._devices[machine_id] = on_instructions
+
+  def unregister(self, machine_id: int) -> None:
+    with self._lock:
+      self._devices.pop(machine_id, None)
+
+  def submit(
+      self,
+      machine_id: int,
+      instructions: list[Instruction],
+      pipelined: bool = False
+    ) -> _BusRequest:
+    """
+    Queues the instructions for `machine_id`'s next turn on the line. The
+    returned request's `done` event is set once its replies are in `results`.
+    """
+    request = _BusRequest(machine_id, instructions, pipelined)
+    with self._lock:
+      if self._closed:
+        request.done.set()
+        return request
+      queue = self._queues.setdefault(machine_id, deque())
+      if len(queue) == 0:
+        self._rotation.append(machine_id)
+      queue.append(request)
+    self._wake()
+    return request
+
+  def close(self) -> None:
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+    self._wake()
+    if self._scheduler is not threading.current_thread():
+      self._scheduler.join()
+    for fd in (self._fd, self._wake_reader, self._wake_writer):
+      os.close(fd)
+
+  def _wake(self) -> None:
+    try:
+      os.write(self._wake_writer, b'\0')
+    except (BlockingIOError, OSError):
+      # Already awake, or closing
+      pass
+
+  def _next_request(self) -> Optional[_BusRequest]:
+    with self._lock:
+      if len(self._rotation) == 0:
+        return None
+      machine_id = self._rotation.popleft()
+      queue = self._queues[machine_id]
+      request = queue.popleft()
+      if len(queue) > 0:
+        self._rotation.append(machine_id)
+      return request
+
+  def _schedule(self) -> None:
+    while True:
+      with self._lock:
+        if self._closed:
+          break
+      request = self._next_request()
+      if request is None:
+        # Idle: wait for work, routing anything the devices send meanwhile
+        (readable, _, _) = select.select([self._fd, self._wake_reader], [], [])
+        if self._wake_reader in readable:
+          self._drain_wake()
+        if self._fd in readable:
+          try:
+            self._route(self._read(), None, None)
+          except OSError as ex:
+            LOGGER.error('Failed reading from %s: %s', self._endpoint.path, ex)
+            select.select([self._wake_reader], [], [], SerialBus.RETRY_INTERVAL_SEC)
+        continue
+      try:
+        self._serve(request)
+      except Exception as ex:
+        LOGGER.error('Failed communicating on %s: %s', self._endpoint.path, ex)
+      finally:
+        request.done.set()
+
+    with self._lock:
+      abandoned = [request for queue in self._queues.values() for request in queue]
+      self._queues.clear()
+      self._rotation.clear()
+    for request in abandoned:
+      request.done.set()
+
+  def _drain_wake(self) -> None:
+    try:
+      while os.read(self._wake_reader, 64):
+        pass
+    except BlockingIOError:
+      pass
+
+  def _serve(self, request: _BusRequest) -> None:
+    instructions = request.instructions
+    step = len(instructions) if request.pipelined else 1
+    for index in range(0, len(instructions), step):
+      batch = instructions[index:index + step]
+      correlator = ResponseCorrelator(batch)
+      self._write(Codec.encode_many(batch))
+
+      timeout_sec = self._endpoint.timeout_sec
+      deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+      while not correlator.is_complete:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+          LOGGER.info(
+            'Timed out waiting for %d of %d responses from machine %d.',
+            len(correlator.pending),
+            len(batch),
+            request.machine_id
+          )
+          break
+        (readable, _, _) = select.select([self._fd], [], [], remaining)
+        if len(readable) > 0:
+          self._route(self._read(), request, correlator)
+
+  def _route(
+      self,
+      instructions: list[Instruction],
+      request: Optional[_BusRequest],
+      correlator: Optional[ResponseCorrelator]
+    ) -> None:
+    unsolicited: dict[int, list[Instruction]] = {}
+    for instruction in instructions:
+      if request is not None and (
+          instruction.machine_id == request.machine_id
+          or request.machine_id == Instruction.DEFAULT_MACHINE_ID
+        ):
+        request.results.append(instruction)
+        correlator.accept(instruction)
+      else:
+        unsolicited.setdefault(instruction.machine_id, []).append(instruction)
+
+    for (machine_id, routed) in unsolicited.items():
+      with self._lock:
+        on_instructions = self._devices.get(machine_id)
+      if on_instructions is None:
+        LOGGER.debug('Discarded instructions from unknown machine %d', machine_id)
+        continue
+      try:
+        on_instructions(routed)
+      except Exception:
+        LOGGER.exception('Serial device handler failed')
+
+  def _read(self) -> list[Instruction]:
+    try:
+      data = os.read(self._fd, SerialBus.READ_SIZE_BYTES)
+    except BlockingIOError:
+      return []
+    return list(self._decoder.feed(data))
+
+  def _write(self, data: bytes) -> None:
+    # Pace writes to the line rate, so queued frames never outrun the bus
+    delay = self._line_free_at - time.monotonic()
+    if delay > 0:
+      time.sleep(delay)
+    view = memoryview(data)
+    while len(view) > 0:
+      select.select([], [self._fd], [])
+      try:
+        written = os.write(self._fd, view)
+      except BlockingIOError:
+        continue
+      view = view[written:]
+    self._line_free_at = time.monotonic() + self._endpoint.transmit_time_sec(len(data))
+
+  @staticmethod
+  def _open(endpoint: SerialEndpoint) -> int:
+    import termios
+    import tty
+    fd = os.open(endpoint.path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+      tty.setraw(fd)
+      attributes = termios.tcgetattr(fd)
+      speed = getattr(termios, f'B{endpoint.baud_rate}')
+      # 8N1, receiver enabled, modem control lines ignored
+      attributes[2] = (attributes[2] & ~(termios.PARENB | termios.CSTOPB | termios.CSIZE)) \
+        | termios.CS8 | termios.CREAD | termios.CLOCAL
+      attributes[4] = speed
+      attributes[5] = speed
+      termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    except Exception:
+      os.close(fd)
+      raise
+    return fd
+
+class SerialDevice:
+  """
+  Manages Protocol 2000 I/O for the device with a specific machine ID on a
+  shared serial bus
+  """
+  DEFAULT_MACHINE_ID: int = 1
+
+  def __init__(
+      self,
+      endpoint: SerialEndpoint,
+      machine_id: int = DEFAULT_MACHINE_ID,
+      pipelined: bool = False
+    ):
+    self._machine_id = machine_id
+    self._pipelined = pipelined
+    self._inbox: list[Instruction] = []
+    self._inbox_lock = threading.Lock()
+    self._on_instructions: Optional[Callable[[list[Instruction]], None]] = None
+    self._bus = SerialBus.acquire(endpoint)
+    try:
+      self._bus.register(machine_id, self._on_bus_instructions)
+    except Exception:
+      self._bus.release()
+      raise
+    self._closed = False
+
+  @property
+  def bus(self) -> SerialBus:
+    return self._bus
+
+  @property
+  def machine_id(self) -> int:
+    return self._machine_id
+
+  @property
+  def label(self) -> str:
+    """
+    Identifies the device in recorded metrics
+    """
+    return f'serial://{self._bus.endpoint.path}?machine_id={self._machine_id}'
+
+  @property
+  def pipelined(self) -> bool:
+    return self._pipelined
+
+  @property
+  def is_listening(self) -> bool:
+    return self._on_instructions is not None
+
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      pipelined: Optional[bool] = None
+    ) -> list[Instruction]:
+    """
+    Sends the instructions to the device on its next turn on the bus, returning
+    all instructions received from it, in the order they were received.
+    """
+    if pipelined is None:
+      pipelined = self._pipelined
+    if isinstance(instructions, Instruction):
+      instructions = [instructions]
+    request = self._bus.submit(self._machine_id, list(instructions), pipelined)
+    request.done.wait()
+
+    with self._inbox_lock:
+      # Anything received since the last request is unsolicited state
+      results = self._inbox + request.results
+      self._inbox.clear()
+    return results
+
+  def start_listening(
+      self,
+      on_instructions: Callable[[list[Instruction]], None]
+    ) -> None:
+    """
+    Passes instructions the device sends outside of a request to
+    `on_instructions`, from the bus scheduler's thread.
+    """
+    if self._on_instructions is not None:
+      raise RuntimeError('Device is already listening')
+    self._on_instructions = on_instructions
+
+  def stop_listening(self) -> None:
+    self._on_instructions = None
+
+  def close(self) -> None:
+    """
+    Stops listening and releases the device's share of the bus
+    """
+    if self._closed:
+      return
+    self._closed = True
+    self.stop_listening()
+    self._bus.unregister(self._machine_id)
+    self._bus.release()
+
+  def _on_bus_instructions(self, instructions: list[Instruction]) -> None:
+    on_instructions = self._on_instructions
+    if on_instructions is not None:
+      on_instructions(instructions)
+      return
+    with self._inbox_lock:
+      self._inbox.extend(instructions)
@@ -0,0 +1,33 @@
+from .io import Command, Instruction
+
+class SwitchState:
+  """
+  Machine definition and front panel state common to Protocol 2000 switches,
+  along with the handling of the instructions that report it.
+  """
+  def __init__(self):
+    self._is_locked = False
+    self._input_count = 0
+    self._output_count = 0
+
+  def _apply_switch_instruction(self, instruction: Instruction) -> bool:
+    """
+    Applies an instruction reporting machine definition or panel lock state.
+    Returns `false` for any other instruction, leaving it to the caller.
+    """
+    match instruction.id:
+      case Command.DEFINE_MACHINE:
+        if instruction.input_value == 1:
+          self._input_count = instruction.output_value
+        elif instruction.input_value == 2:
+          self._set_output_count(instruction.output_value)
+      case Command.PANEL_LOCK:
+        self._is_locked = (instruction.input_value == 1)
+      case Command.QUERY_PANEL_LOCK:
+        self._is_locked = (instruction.output_value == 1)
+      case _:
+        return False
+    return True
+
+  def _set_output_count(self, output_count: int) -> None:
+    self._output_count = output_count
@@ -0,0 +1,426 @@
+import queue
+import socket
+import threading
+import time
+import weakref
+
+from ..constants import LOGGER
+from typing import Callable, Optional
+
+from .io import Codec, Instruction, ResponseCorrelator
+
+Address = tuple[str, int]
+DatagramHandler = Callable[[bytes], None]
+
+class UdpEndpoint:
+  """
+  Protocol 2000 UDP endpoint location details
+  """
+  DEFAULT_PORT: int = 50000
+  DEFAULT_TIMEOUT_SEC: float = 0.250
+  DEFAULT_RETRIES: int = 2
+
+  def __init__(
+      self,
+      host: str,
+      port: Optional[int] = None,
+      timeout_sec: Optional[float] = DEFAULT_TIMEOUT_SEC,
+      retries: int = DEFAULT_RETRIES
+    ):
+    self._host = host
+    if port is None:
+      self._port = UdpEndpoint.DEFAULT_PORT
+    else:
+      self._port = port
+    self._timeout_sec = timeout_sec
+    self._retries = retries
+
+  @property
+  def host(self) -> str:
+    return self._host
+
+  @property
+  def port(self) -> int:
+    return self._port
+
+  @property
+  def timeout_sec(self) -> Optional[float]:
+    """
+    How long to wait for replies before retransmitting unanswered requests
+    """
+    return self._timeout_sec
+
+  @property
+  def retries(self) -> int:
+    """
+    How many times unanswered requests are retransmitted before giving up
+    """
+    return self._retries
+
+class UdpTransport:
+  """
+  A single UDP socket shared by many devices.
+
+  A background thread receives every datagram and hands it to the handlers
+  registered for its source address, so devices cost no connection setup and
+  no socket of their own. Handlers that are bound methods are held weakly, so a
+  device that is dropped without being closed stops receiving datagrams.
+
+  The socket's address family follows `local_address`: IPv4 by default, or
+  IPv6 for an IPv6 address such as `('::', 0)`.
+  """
+  # Largest datagram read; far larger than any Protocol 2000 reply
+  MAX_DATAGRAM_BYTES: int = 4096
+  # How long the receiver waits for data before re-checking whether to stop
+  POLL_INTERVAL_SEC: float = 0.5
+
+  _shared: Optional['UdpTransport'] = None
+  _shared_lock = threading.Lock()
+
+  def __init__(self, local_address: Address = ('0.0.0.0', 0)):
+    family = socket.AF_INET6 if ':' in local_address[0] else socket.AF_INET
+    self._socket = socket.socket(family, socket.SOCK_DGRAM)
+    self._socket.bind(local_address)
+    self._socket.settimeout(UdpTransport.POLL_INTERVAL_SEC)
+    self._handlers: dict[Address, list[Callable[[], Optional[DatagramHandler]]]] = {}
+    self._handlers_lock = threading.Lock()
+    self._closed = threading.Event()
+    self._receiver = threading.Thread(
+      target = self._receive,
+      name = 'kesslerav-udp-receiver',
+      daemon = True
+    )
+    self._receiver.start()
+
+  @classmethod
+  def shared(cls) -> 'UdpTransport':
+    """
+    Returns the process-wide transport used by devices not given their own
+    """
+    with cls._shared_lock:
+      if cls._shared is None or cls._shared.is_closed:
+        cls._shared = UdpTransport()
+      return cls._shared
+
+  @property
+  def local_address(self) -> Address:
+    return self._socket.getsockname()
+
+  @property
+  def family(self) -> socket.AddressFamily:
+    return self._socket.family
+
+  @property
+  def is_closed(self) -> bool:
+    return self._closed.is_set()
+
+  def register(self, address: Address, handler: DatagramHandler) -> None:
+    """
+    Routes datagrams received from `address` to `handler`, along with any other
+    handlers registered for it
+    """
+    if hasattr(handler, '__self__'):
+      reference = weakref.WeakMethod(handler)
+    else:
+      reference = lambda: handler
+    with self._handlers_lock:
+      self._handlers.setdefault(address, []).append(reference)
+
+  def unregister(self, address: Address, handler: Optional[DatagramHandler] = None) -> None:
+    """
+    Stops routing datagrams from `address` to `handler`, or to any handler when
+    none is specified
+    """
+    with self._handlers_lock:
+      references = self._handlers.pop(address, [])
+      if handler is None:
+        return
+      remaining = [reference for reference in references if reference() not in (None, handler)]
+      if len(remaining) > 0:
+        self._handlers[address] = remaining
+
+  def send(self, data: bytes, address: Address) -> None:
+    self._socket.sendto(data, address)
+
+  def close(self) -> None:
+    self._closed.set()
+    if self._receiver is not threading.current_thread():
+      self._receiver.join()
+    self._socket.close()
+
+  def _receive(self) -> None:
+    while not self._closed.is_set():
+      try:
+        (data, address) = self._socket.recvfrom(UdpTransport.MAX_DATAGRAM_BYTES)
+      except TimeoutError:
+        continue
+      except OSError as ex:
+        if not self._closed.is_set():
+          LOGGER.error('Failed receiving datagram: %s', ex)
+        continue
+
+      handlers = self._handlers_for(address[:2])
+      if len(handlers) == 0:
+        LOGGER.debug('Discarded datagram from unknown address %s', address)
+        continue
+      for handler in handlers:
+        try:
+          handler(data)
+        except Exception:
+          LOGGER.exception('Datagram handler failed')
+
+  def _handlers_for(self, address: Address) -> list[DatagramHandler]:
+    with self._handlers_lock:
+      references = self._handlers.get(address)
+      if references is None:
+        return []
+      handlers = [reference() for reference in references]
+      if None in handlers:
+        # Forget handlers whose devices were dropped without being closed
+        live = [reference for (reference, handler) in zip(references, handlers) if handler is not None]
+        if len(live) > 0:
+          self._handlers[address] = live
+        else:
+          del self._handlers[address]
+      return [handler for handler in handlers if handler is not None]
+
+class UdpDevice:
+  """
+  Manages UDP I/O for a specific Protocol 2000-based device
+
+  Requests are sent over a shared `UdpTransport`. Unanswered requests are
+  retransmitted every `timeout_sec`, up to `retries` times. When `pipelined`
+  is enabled, a multi-instruction call is sent as a single datagram.
+
+  The endpoint's host is resolved once, when the device is created, which
+  blocks on DNS for hostnames. It must resolve to an address of the transport's
+  family; the shared transport is IPv4, so pass an IPv6 transport (see
+  `UdpTransport`) to reach IPv6 devices.
+
+  `start_listening` hands unsolicited instructions to a callback on a thread of
+  the device's own, so a slow callback holds up neither the transport's
+  receiver nor other devices sharing it.
+  """
+
+  def __init__(
+      self,
+      endpoint: UdpEndpoint,
+      transport: Optional[UdpTransport] = None,
+      pipelined: bool = False
+    ):
+    self._endpoint = endpoint
+    self._transport = transport if transport is not None else UdpTransport.shared()
+    self._pipelined = pipelined
+    self._address = self._resolve(endpoint, self._transport.family)
+    self._lock = threading.Lock()
+    self._received = threading.Condition()
+    self._inbox: list[Instruction] = []
+    self._in_flight = False
+    self._on_instructions: Optional[Callable[[list[Instruction]], None]] = None
+    # Unsolicited instructions waiting for the listener thread; `None` stops it
+    self._unsolicited: Optional[queue.SimpleQueue] = None
+    self._listener: Optional[threading.Thread] = None
+    self._retransmit_count = 0
+    self._transport.register(self._address, self._on_datagram)
+
+  @property
+  def address(self) -> Address:
+    return self._address
+
+  @property
+  def label(self) -> str:
+    """
+    Identifies the device in recorded metrics
+    """
+    return f'udp://{self._address[0]}:{self._address[1]}'
+
+  @property
+  def pipelined(self) -> bool:
+    return self._pipelined
+
+  @property
+  def retransmit_count(self) -> int:
+    """
+    Number of retransmissions sent because replies did not arrive in time
+    """
+    return self._retransmit_count
+
+  @property
+  def is_listening(self) -> bool:
+    return self._on_instructions is not None
+
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      pipelined: Optional[bool] = None
+    ) -> list[Instruction]:
+    """
+    Sends the instructions to the device, returning all instructions received
+    in response, in the order they were received.
+    """
+    if pipelined is None:
+      pipelined = self._pipelined
+    if isinstance(instructions, Instruction):
+      instructions = [instructions]
+    instructions = list(instructions)
+    results: list[Instruction] = []
+
+    with self._lock:
+      with self._received:
+        # Anything received since the last request is unsolicited state
+        results.extend(self._inbox)
+        self._inbox.clear()
+        self._in_flight = True
+      try:
+        step = len(instructions) if pipelined else 1
+        for index in range(0, len(instructions), step):
+          results.extend(self._exchange(instructions[index:index + step]))
+      except Exception as ex:
+        LOGGER.error('Failed communicating with device: %s', ex)
+      finally:
+        with self._received:
+          self._in_flight = False
+
+    return results
+
+  def start_listening(
+      self,
+      on_instructions: Callable[[list[Instruction]], None]
+    ) -> None:
+    """
+    Starts a background thread that passes instructions the device sends
+    outside of a request to `on_instructions`.
+    """
+    if self._on_instructions is not None:
+      raise RuntimeError('Device is already listening')
+    unsolicited = queue.SimpleQueue()
+    self._listener = threading.Thread(
+      target = self._listen,
+      args = (on_instructions, unsolicited),
+      name = f'kesslerav-listener-{self._address[0]}:{self._address[1]}',
+      daemon = True
+    )
+    self._listener.start()
+    with self._received:
+      self._unsolicited = unsolicited
+      self._on_instructions = on_instructions
+
+  def stop_listening(self) -> None:
+    """
+    Stops the background listener, if running
+    """
+    with self._received:
+      unsolicited = self._unsolicited
+      self._unsolicited = None
+      self._on_instructions = None
+    listener = self._listener
+    self._listener = None
+    if unsolicited is None:
+      return
+    unsolicited.put(None)
+    if listener is not threading.current_thread():
+      listener.join()
+
+  def close(self) -> None:
+    """
+    Stops listening and detaches the device from its transport
+    """
+    self.stop_listening()
+    self._transport.unregister(self._address, self._on_datagram)
+
+  def _exchange(self, instructions: list[Instruction]) -> list[Instruction]:
+    correlator = ResponseCorrelator(instructions)
+    result: list[Instruction] = []
+    timeout_sec = self._endpoint.timeout_sec
+    for attempt in range(self._endpoint.retries + 1):
+      if attempt > 0:
+        self._retransmit_count += 1
+        LOGGER.debug('Retransmitting %d unanswered requests', len(correlator.pending))
+      self._transport.send(Codec.encode_many(correlator.pending), self._address)
+
+      deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+      with self._received:
+        while not correlator.is_complete:
+          if len(self._inbox) == 0:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+              break
+            self._received.wait(remaining)
+            continue
+          for instruction in self._inbox:
+            result.append(instruction)
+            correlator.accept(instruction)
+          self._inbox.clear()
+      if correlator.is_complete:
+        return result
+
+    LOGGER.info(
+      'Timed out waiting for %d of %d responses after %d retries.',
+      len(correlator.pending),
+      len(instructions),
+      self._endpoint.retries
+    )
+    return result
+
+  def _on_datagram(self, data: bytes) -> None:
+    instructions = self._decode_datagram(data)
+    if len(instructions) == 0:
+      return
+    with self._received:
+      if self._in_flight or self._unsolicited is None:
+        self._inbox.extend(instructions)
+        self._received.notify_all()
+        return
+      self._unsolicited.put(instructions)
+
+  def _listen(
+      self,
+      on_instructions: Callable[[list[Instruction]], None],
+      unsolicited: queue.SimpleQueue
+    ) -> None:
+    while True:
+      instructions = unsolicited.get()
+      if instructions is None:
+        return
+      try:
+        on_instructions(instructions)
+      except Exception:
+        LOGGER.exception('Listener callback failed')
+
+  @staticmethod
+  def _decode_datagram(data: bytes) -> list[Instruction]:
+    # Datagrams keep their boundaries, so each is decoded on its own and a
+    # truncated or stray datagram cannot misalign the replies that follow it
+    size = Instruction.SIZE_BYTES
+    whole_bytes = len(data) - len(data) % size
+    if whole_bytes < len(data):
+      LOGGER.debug('Discarded %d trailing bytes of datagram', len(data) - whole_bytes)
+    try:
+      return Codec.decode_many(data[:whole_bytes])
+    except ValueError:
+      pass
+    instructions = []
+    for offset in range(0, whole_bytes, size):
+      frame = data[offset:offset + size]
+      try:
+        instructions.append(Codec.decode(frame))
+      except ValueError as ex:
+        LOGGER.debug('Discarded invalid frame %s: %s', frame.hex(), ex)
+    return instructions
+
+  @staticmethod
+  def _resolve(endpoint: UdpEndpoint, family: socket.AddressFamily) -> Address:
+    # Replies are routed by source address, so resolve hostnames up front
+    infos = socket.getaddrinfo(
+      endpoint.host,
+      endpoint.port,
+      socket.AF_UNSPEC,
+      socket.SOCK_DGRAM
+    )
+    for info in infos:
+      if info[0] == family:
+        return info[4][:2]
+    raise ValueError(
+      f'{endpoint.host} has no {family.name} address reachable over the UDP '
+      f'transport. Resolved: {sorted(set(info[4][0] for info in infos))}'
+    )
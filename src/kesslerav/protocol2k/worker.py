@@ -0,0 +1,209 @@
+import heapq
+import itertools
+import threading
+
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from ..constants import LOGGER
+from .io import Instruction, InstructionBatch, Priority, ResponseCorrelator, TcpDevice
+
+class _WorkerRequest:
+  __slots__ = ('instructions', 'pipelined', 'priority', 'future')
+
+  def __init__(self, instructions: list[Instruction] | InstructionBatch, pipelined: Optional[bool], priority: Priority):
+    self.instructions = instructions
+    self.pipelined = pipelined
+    self.priority = priority
+    self.future: Future = Future()
+
+class WorkerDevice:
+  """
+  Thread-safe front end to a blocking device, such as `TcpDevice`.
+
+  A single I/O worker thread owns the device, so any number of threads can share
+  it without contending for, or opening, connections. `submit` queues a request
+  and returns a future; `process` waits on it. Requests are served in `Priority`
+  order.
+
+  With `merge_requests` enabled, requests queued at the same priority are sent
+  together as one pipelined batch of up to `MAX_BATCH_INSTRUCTIONS`, and the
+  replies are handed back to the request each one answers. Under load, this
+  costs one round trip per batch rather than one per request.
+  """
+  MAX_BATCH_INSTRUCTIONS: int = TcpDevice.PAGE_SIZE
+
+  def __init__(self, device: TcpDevice, merge_requests: bool = True):
+    self._device = device
+    self._merge_requests = merge_requests
+    self._queue: list[tuple[int, int, _WorkerRequest]] = []
+    self._sequence = itertools.count()
+    self._condition = threading.Condition()
+    self._closed = False
+    self._batches_sent = 0
+    self._worker = threading.Thread(
+      target = self._work,
+      name = f'kesslerav-worker-{getattr(device, "label", type(device).__name__)}',
+      daemon = True
+    )
+    self._worker.start()
+
+  @property
+  def device(self) -> TcpDevice:
+    return self._device
+
+  @property
+  def label(self) -> Optional[str]:
+    return getattr(self._device, 'label', None)
+
+  @property
+  def metrics(self):
+    return getattr(self._device, 'metrics', None)
+
+  @property
+  def is_available(self) -> bool:
+    return getattr(self._device, 'is_available', True)
+
+  @property
+  def pending_count(self) -> int:
+    """
+    Number of requests waiting for the worker
+    """
+    with self._condition:
+      return len(self._queue)
+
+  @property
+  def batches_sent(self) -> int:
+    """
+    Number of times the worker has called the device
+    """
+    return self._batches_sent
+
+  @property
+  def is_listening(self) -> bool:
+    return self._device.is_listening
+
+  def submit(
+      self,
+      instructions: list[Instruction] | Instruction | InstructionBatch,
+      pipelined: Optional[bool] = None,
+      priority: Optional[Priority] = None
+    ) -> Future:
+    """
+    Queues the instructions for the worker, returning a future that resolves to
+    the instructions received in response.
+    """
+    if isinstance(instructions, Instruction):
+      instructions = [instructions]
+    elif not isinstance(instructions, InstructionBatch):
+      instructions = list(instructions)
+    if priority is None:
+      priority = Priority.for_instructions(instructions)
+    request = _WorkerRequest(instructions, pipelined, priority)
+    with self._condition:
+      if self._closed:
+        raise RuntimeError('Device is closed')
+      heapq.heappush(self._queue, (int(priority), next(self._sequence), request))
+      self._condition.notify()
+    return request.future
+
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction | InstructionBatch,
+      pipelined: Optional[bool] = None,
+      priority: Optional[Priority] = None
+    ) -> list[Instruction] | InstructionBatch:
+    """
+    Sends the instructions to the device, returning all instructions received
+    in response, in the order they were received.
+    """
+    return self.submit(instructions, pipelined, priority).result()
+
+  def start_listening(self, on_instructions: Callable[[list[Instruction]], None]) -> None:
+    self._device.start_listening(on_instructions)
+
+  def stop_listening(self) -> None:
+    self._device.stop_listening()
+
+  def close(self) -> None:
+    """
+    Completes queued requests, then stops the worker and closes the device
+    """
+    with self._condition:
+      if self._closed:
+        return
+      self._closed = True
+      self._condition.notify()
+    if self._worker is not threading.current_thread():
+      self._worker.join()
+    self._device.close()
+
+  def _work(self) -> None:
+    while True:
+      with self._condition:
+        while len(self._queue) == 0 and not self._closed:
+          self._condition.wait()
+        if len(self._queue) == 0:
+          return
+        requests = self._take_batch()
+      self._send(requests)
+
+  def _take_batch(self) -> list[_WorkerRequest]:
+    (_, _, first) = heapq.heappop(self._queue)
+    requests = [first]
+    # Batches are already bulk requests, so they are sent on their own
+    if not self._merge_requests or isinstance(first.instructions, InstructionBatch):
+      return requests
+    size = len(first.instructions)
+    while len(self._queue) > 0:
+      (priority, _, request) = self._queue[0]
+      if priority != first.priority or isinstance(request.instructions, InstructionBatch):
+        break
+      if size + len(request.instructions) > WorkerDevice.MAX_BATCH_INSTRUCTIONS:
+        break
+      heapq.heappop(self._queue)
+      requests.append(request)
+      size += len(request.instructions)
+    return requests
+
+  def _send(self, requests: list[_WorkerRequest]) -> None:
+    # Requests whose futures were cancelled while queued are dropped
+    requests = [request for request in requests if request.future.set_running_or_notify_cancel()]
+    if len(requests) == 0:
+      return
+
+    self._batches_sent += 1
+    try:
+      if len(requests) == 1:
+        request = requests[0]
+        request.future.set_result(self._device.process(request.instructions, request.pipelined))
+        return
+      instructions = [instruction for request in requests for instruction in request.instructions]
+      results = self._device.process(instructions, True)
+    except Exception as ex:
+      LOGGER.error('Device worker failed processing instructions: %s', ex)
+      for request in requests:
+        if not request.future.done():
+          request.future.set_exception(ex)
+      return
+
+    for (request, replies) in zip(requests, self._distribute(requests, results)):
+      request.future.set_result(replies)
+
+  @staticmethod
+  def _distribute(
+      requests: list[_WorkerRequest],
+      results: list[Instruction]
+    ) -> list[list[Instruction]]:
+    # Each reply goes to the earliest request awaiting it. Unsolicited replies
+    # go to the first request, so that the state they carry is still applied.
+    correlators = [ResponseCorrelator(request.instructions) for request in requests]
+    replies: list[list[Instruction]] = [[] for _ in requests]
+    for result in results:
+      for (index, correlator) in enumerate(correlators):
+        if correlator.accept(result) is not None:
+          replies[index].append(result)
+          break
+      else:
+        replies[0].append(result)
+    return replies
@@ -1,12 +1,17 @@
 from typing import Optional
-from urllib.parse import urlparse
+from urllib.parse import parse_qsl, urlencode, urlparse
 
-from .constants import PROTOCOL_2K, SCHEME_TCP
+from .constants import PROTOCOL_2K, SCHEME_TCP, SCHEME_UDP
 
 _PROTOCOL_2K_ALT = 'protocol2000'
 
 _DEFAULT_HOST = 'localhost'
 _DEFAULT_PORT_TCP = 5000
+_DEFAULT_PORT_UDP = 50000
+_DEFAULT_PORTS: dict[str, int] = {
+  SCHEME_TCP: _DEFAULT_PORT_TCP,
+  SCHEME_UDP: _DEFAULT_PORT_UDP,
+}
 _DEFAULT_PROTOCOL = PROTOCOL_2K
 _DEFAULT_SCHEME = SCHEME_TCP
 
@@ -20,27 +25,37 @@ class Endpoint:
       scheme: Optional[str] = None,
       host: Optional[str] = None,
       port:Optional[int] = None,
-      protocol: Optional[str] = None
+      protocol: Optional[str] = None,
+      path: Optional[str] = None,
+      options: Optional[dict[str, str]] = None
     ):
     if _is_empty(scheme):
       self._scheme = _DEFAULT_SCHEME
     else:
-      self._scheme = scheme
+      self._scheme = scheme.lower()
 
     if _is_empty(host):
       self._host = _DEFAULT_HOST
     else:
-      self._host = host
+      self._host = host.lower()
 
     if port is None:
       self._port = self._default_port(self._scheme)
     else:
       self._port = port
 
-    if _is_empty(protocol) or protocol == _PROTOCOL_2K_ALT:
+    if _is_empty(protocol) or protocol.lower() == _PROTOCOL_2K_ALT:
       self._protocol = _DEFAULT_PROTOCOL
     else:
-      self._protocol = protocol
+      self._protocol = protocol.lower()
+
+    if _is_empty(path) or (self._scheme in _DEFAULT_PORTS and path == '/'):
+      # Network endpoints have no device path, so a bare trailing slash is noise
+      self._path = None
+    else:
+      self._path = path
+
+    self._options = dict(options or {})
 
   @property
   def scheme(self):
@@ -58,10 +73,57 @@ class Endpoint:
   def protocol(self):
     return self._protocol
 
+  @property
+  def path(self) -> Optional[str]:
+    """
+    Device path, for schemes addressing local devices (e.g., serial ports)
+    """
+    return self._path
+
+  @property
+  def options(self) -> dict[str, str]:
+    """
+    Scheme-specific settings given as URL query parameters
+    """
+    return dict(self._options)
+
+  @property
+  def url(self) -> str:
+    """
+    The endpoint in normalized URL form, with every default filled in
+    """
+    url = f'{self._scheme}://{self._host}'
+    if self._port is not None:
+      url = f'{url}:{self._port}'
+    if self._path is not None:
+      url = f'{url}{self._path}'
+    if len(self._options) > 0:
+      url = f'{url}?{urlencode(sorted(self._options.items()))}'
+    return f'{url}#{self._protocol}'
+
+  def _key(self) -> tuple:
+    return (
+      self._scheme,
+      self._host,
+      self._port,
+      self._protocol,
+      self._path,
+      tuple(sorted(self._options.items()))
+    )
+
+  def __eq__(self, other):
+    if not isinstance(other, Endpoint):
+      return NotImplemented
+    return self._key() == other._key()
+
+  def __hash__(self) -> int:
+    return hash(self._key())
+
+  def __repr__(self) -> str:
+    return f'Endpoint({self.url!r})'
+
   def _default_port(self, scheme: str) -> Optional[int]:
-    if scheme == SCHEME_TCP:
-      return _DEFAULT_PORT_TCP
-    return None
+    return _DEFAULT_PORTS.get(scheme)
 
 
 def parse_url(url: str) -> Endpoint:
@@ -73,6 +135,8 @@ def parse_url(url: str) -> Endpoint:
     scheme = parsed_url.scheme,
     host = parsed_url.hostname,
     port = parsed_url.port,
-    protocol = parsed_url.fragment
+    protocol = parsed_url.fragment,
+    path = parsed_url.path,
+    options = dict(parse_qsl(parsed_url.query))
   )
   return endpoint
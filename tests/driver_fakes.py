@@ -0,0 +1,40 @@
+from typing import Callable, Optional
+
+#
+# Fakes
+#
+class FakeDriver:
+  """
+  Driver that records each media switch it is asked for. Switches are built by
+  `create_switch` from the endpoint when given, and are otherwise a tuple of the
+  arguments the driver received.
+  """
+  def __init__(self, create_switch: Optional[Callable] = None):
+    self.endpoints = []
+    self.discovery = []
+    self.switches = []
+    self._create_switch = create_switch
+
+  @property
+  def created(self) -> int:
+    return len(self.switches)
+
+  @property
+  def switch(self):
+    """
+    The most recently created switch, if any
+    """
+    return self.switches[-1] if len(self.switches) > 0 else None
+
+  def media_switch(self, endpoint, timeout_sec = None, machine_id = None, discovery = None):
+    self.endpoints.append(endpoint)
+    self.discovery.append(discovery)
+    if self._create_switch is None:
+      switch = ('media_switch', endpoint.host, timeout_sec, machine_id, discovery)
+    else:
+      switch = self._create_switch(endpoint)
+    self.switches.append(switch)
+    return switch
+
+  async def async_media_switch(self, endpoint, timeout_sec = None, machine_id = None):
+    return ('async_media_switch', endpoint.host)
@@ -0,0 +1,149 @@
+import asyncio
+import subprocess
+import sys
+import pytest
+
+from importlib.metadata import EntryPoint
+
+import kesslerav
+
+from kesslerav import get_async_media_switch, get_matrix_switch, get_media_switch
+from kesslerav.drivers import DRIVERS, DriverRegistry
+from kesslerav.url_parser import parse_url
+
+from driver_fakes import FakeDriver
+
+FAKE_DRIVER = FakeDriver()
+
+class TestDriverRegistry:
+  def test_imports_referenced_driver_on_first_use(self):
+    sut = DriverRegistry(entry_point_group = None)
+    sut.register('fake', 'protocol2k', f'{__name__}:FAKE_DRIVER')
+
+    imported_before = sut.is_imported('fake', 'protocol2k')
+    result = sut.get('fake', 'protocol2k')
+
+    assert not imported_before
+    assert result is FAKE_DRIVER
+    assert sut.is_imported('fake', 'protocol2k')
+
+  def test_returns_registered_driver_objects(self):
+    sut = DriverRegistry(entry_point_group = None)
+    driver = FakeDriver()
+
+    sut.register('fake', 'protocol2k', driver)
+
+    assert sut.get('fake', 'protocol2k') is driver
+
+  def test_returns_none_for_unknown_drivers(self):
+    sut = DriverRegistry(entry_point_group = None)
+
+    assert sut.get('fake', 'protocol2k') is None
+
+  def test_rejects_malformed_references(self):
+    sut = DriverRegistry(entry_point_group = None)
+
+    with pytest.raises(ValueError):
+      sut.register('fake', 'protocol2k', 'example.drivers')
+
+  def test_unregister_removes_driver(self):
+    sut = DriverRegistry(entry_point_group = None)
+    sut.register('fake', 'protocol2k', FakeDriver())
+
+    sut.unregister('fake', 'protocol2k')
+
+    assert sut.registered() == []
+
+  def test_factory_raises_exception_for_unsupported_kind(self):
+    sut = DriverRegistry(entry_point_group = None)
+    sut.register('fake', 'protocol2k', FakeDriver())
+
+    with pytest.raises(ValueError):
+      sut.factory(parse_url('fake://host'), 'matrix_switch', 'fake://host')
+
+  def test_discovers_entry_point_drivers(self, monkeypatch: pytest.MonkeyPatch):
+    entry_points = [
+      EntryPoint('fake#protocol2k', f'{__name__}:FAKE_DRIVER', 'kesslerav.drivers'),
+      EntryPoint('malformed', f'{__name__}:FAKE_DRIVER', 'kesslerav.drivers'),
+    ]
+    monkeypatch.setattr('importlib.metadata.entry_points', lambda group: entry_points)
+    sut = DriverRegistry()
+
+    result = sut.get('fake', 'protocol2k')
+
+    assert result is FAKE_DRIVER
+    assert sut.registered() == [('fake', 'protocol2k')]
+
+  def test_registered_drivers_take_precedence_over_entry_points(self, monkeypatch: pytest.MonkeyPatch):
+    entry_points = [EntryPoint('fake#protocol2k', f'{__name__}:FAKE_DRIVER', 'kesslerav.drivers')]
+    monkeypatch.setattr('importlib.metadata.entry_points', lambda group: entry_points)
+    sut = DriverRegistry()
+    driver = FakeDriver()
+    sut.register('fake', 'protocol2k', driver)
+
+    registered = sut.registered()
+    result = sut.get('fake', 'protocol2k')
+
+    assert registered == [('fake', 'protocol2k')]
+    assert result is driver
+
+  def test_builtin_drivers_are_registered(self):
+    assert {('serial', 'protocol2k'), ('tcp', 'protocol2k'), ('udp', 'protocol2k')} \
+      <= set(DRIVERS.registered())
+
+class TestDriverDispatch:
+  @pytest.fixture
+  def driver(self):
+    driver = FakeDriver()
+    DRIVERS.register('fake', 'protocol2k', driver)
+    yield driver
+    DRIVERS.unregister('fake', 'protocol2k')
+
+  def test_get_media_switch_uses_registered_driver(self, driver: FakeDriver):
+    result = get_media_switch('fake://switch.local', timeout_sec = 0.5, machine_id = 2)
+
+    assert result == ('media_switch', 'switch.local', 0.5, 2, 'eager')
+
+  def test_get_async_media_switch_uses_registered_driver(self, driver: FakeDriver):
+    result = asyncio.run(get_async_media_switch('fake://switch.local'))
+
+    assert result == ('async_media_switch', 'switch.local')
+
+  def test_raises_exception_for_kind_driver_does_not_support(self, driver: FakeDriver):
+    with pytest.raises(ValueError):
+      get_matrix_switch('fake://switch.local')
+
+  def test_raises_exception_for_unknown_scheme(self):
+    with pytest.raises(ValueError):
+      get_media_switch('unknown://switch.local')
+
+class TestPackageImport:
+  def test_import_defers_drivers(self):
+    code = (
+      'import sys, kesslerav; '
+      'print(",".join(m for m in ("asyncio", "kesslerav.protocol2k", "socket") if m in sys.modules))'
+    )
+
+    result = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True)
+
+    assert result.stdout.strip() == ''
+
+  def test_tcp_driver_defers_serial_support(self):
+    code = (
+      'import sys; from kesslerav.drivers import DRIVERS; DRIVERS.get("tcp", "protocol2k"); '
+      'print(",".join(m for m in ("kesslerav.protocol2k.serial_bus", "termios", "tty") if m in sys.modules))'
+    )
+
+    result = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True)
+
+    assert result.stdout.strip() == ''
+
+  def test_lazy_exports_resolve(self):
+    from kesslerav.protocol2k import get_tcp_media_switch
+
+    assert kesslerav.get_tcp_media_switch is get_tcp_media_switch
+    assert 'SwitchFleet' in dir(kesslerav)
+
+  def test_unknown_attributes_raise_attribute_error(self):
+    with pytest.raises(AttributeError):
+      kesslerav.does_not_exist
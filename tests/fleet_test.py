@@ -0,0 +1,229 @@
+import threading
+import time
+
+from kesslerav.constants import DISCOVERY_LAZY
+from kesslerav.drivers import DRIVERS
+from kesslerav.fleet import SwitchFleet
+
+from driver_fakes import FakeDriver
+
+class TestSwitchFleet:
+  def test_refresh_returns_result_per_device_in_fleet_order(self):
+    urls = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    factory = FakeSwitchFactory()
+    sut = SwitchFleet(urls, factory = factory)
+
+    results = sut.refresh()
+
+    assert list(results.keys()) == urls
+    assert all(result.ok for result in results.values())
+    assert [result.value.url for result in results.values()] == urls
+
+  def test_refresh_runs_devices_concurrently(self):
+    urls = [f'10.0.0.{i}' for i in range(10)]
+    factory = FakeSwitchFactory(delay_sec = 0.1)
+    sut = SwitchFleet(urls, factory = factory, max_concurrency = 10)
+
+    start = time.monotonic()
+    sut.refresh()
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.5
+
+  def test_limits_concurrency(self):
+    urls = [f'10.0.0.{i}' for i in range(12)]
+    factory = FakeSwitchFactory(delay_sec = 0.02)
+    sut = SwitchFleet(urls, factory = factory, max_concurrency = 3)
+
+    sut.refresh()
+
+    assert factory.max_in_flight <= 3
+
+  def test_reports_device_errors_without_failing_others(self):
+    urls = ['10.0.0.1', 'bad', '10.0.0.3']
+    factory = FakeSwitchFactory(failing_urls = {'bad'})
+    sut = SwitchFleet(urls, factory = factory)
+
+    results = sut.select_source(2)
+
+    assert results['10.0.0.1'].ok
+    assert not results['bad'].ok
+    assert isinstance(results['bad'].error, ConnectionError)
+    assert results['10.0.0.3'].ok
+    assert factory.switches['10.0.0.3'].selected_source == 2
+
+  def test_reports_unresponsive_devices_as_timeouts(self):
+    factory = FakeSwitchFactory(unresponsive_urls = {'10.0.0.2'})
+    sut = SwitchFleet(['10.0.0.1', '10.0.0.2'], factory = factory)
+
+    results = sut.refresh()
+
+    assert results['10.0.0.1'].ok
+    assert isinstance(results['10.0.0.2'].error, TimeoutError)
+
+  def test_reports_devices_missing_deadline_as_timeouts(self):
+    factory = FakeSwitchFactory(delay_sec = 0.01, slow_urls = {'slow'})
+    sut = SwitchFleet(['fast', 'slow'], factory = factory)
+    sut.connect()
+
+    start = time.monotonic()
+    results = sut.lock(deadline_sec = 0.1)
+    elapsed = time.monotonic() - start
+    factory.release_slow()
+
+    assert results['fast'].ok
+    assert isinstance(results['slow'].error, TimeoutError)
+    assert elapsed < 0.5
+
+  def test_skips_unavailable_devices(self):
+    factory = FakeSwitchFactory()
+    sut = SwitchFleet(['10.0.0.1', '10.0.0.2'], factory = factory)
+    sut.connect()
+    factory.switches['10.0.0.2'].is_available = False
+
+    results = sut.select_source(2)
+
+    assert results['10.0.0.1'].ok
+    assert isinstance(results['10.0.0.2'].error, ConnectionError)
+    assert factory.switches['10.0.0.2'].selected_source == 0
+
+  def test_reuses_connected_switches(self):
+    factory = FakeSwitchFactory()
+    sut = SwitchFleet(['10.0.0.1'], factory = factory)
+
+    sut.connect()
+    sut.refresh()
+    sut.lock()
+
+    assert factory.create_count == 1
+
+  def test_close_closes_connected_switches(self):
+    factory = FakeSwitchFactory()
+    sut = SwitchFleet(['10.0.0.1', '10.0.0.2'], factory = factory)
+    sut.connect()
+
+    sut.close()
+
+    assert all(switch.was_closed for switch in factory.switches.values())
+    assert sut.switches == {}
+
+  def test_default_factory_defers_loading_state_to_first_operation(self):
+    driver = FakeDriver(lambda endpoint: FakeSwitch(FakeSwitchFactory(), endpoint.url))
+    DRIVERS.register('fake', 'protocol2k', driver)
+    try:
+      sut = SwitchFleet(['fake://switch.local'])
+
+      sut.refresh()
+    finally:
+      DRIVERS.unregister('fake', 'protocol2k')
+
+    assert driver.discovery == [DISCOVERY_LAZY]
+    assert driver.switch.update_count == 1
+
+  def test_connect_loads_state_of_unloaded_switches(self):
+    factory = FakeSwitchFactory()
+    sut = SwitchFleet(['10.0.0.1'], factory = factory)
+    switch = sut._switch_for('10.0.0.1')
+    switch.is_ready = False
+
+    sut.connect()
+
+    assert switch.update_count == 1
+
+  def test_closes_switch_created_by_losing_operation(self):
+    barrier = threading.Barrier(2)
+    created = []
+    def factory(url, timeout_sec = None, machine_id = None):
+      switch = FakeSwitch(FakeSwitchFactory(), url)
+      created.append(switch)
+      barrier.wait(2.0)
+      return switch
+    sut = SwitchFleet(['10.0.0.1'], factory = factory)
+    results = []
+
+    threads = [threading.Thread(target = lambda: results.append(sut._switch_for('10.0.0.1'))) for _ in range(2)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    assert results[0] is results[1]
+    assert [switch.was_closed for switch in created].count(True) == 1
+    assert not results[0].was_closed
+
+#
+# Fakes
+#
+class FakeSwitch:
+  def __init__(self, factory: 'FakeSwitchFactory', url: str):
+    self.url = url
+    self.selected_source = 0
+    self.is_locked = False
+    self.is_responsive = url not in factory.unresponsive_urls
+    self.is_available = True
+    self.is_ready = True
+    self.update_count = 0
+    self.was_closed = False
+    self._factory = factory
+
+  def select_source(self, input: int) -> None:
+    self._factory.work(self.url)
+    self.selected_source = input
+
+  def lock(self) -> None:
+    self._factory.work(self.url)
+    self.is_locked = True
+
+  def unlock(self) -> None:
+    self._factory.work(self.url)
+    self.is_locked = False
+
+  def update(self) -> None:
+    self._factory.work(self.url)
+    self.update_count += 1
+
+  def close(self) -> None:
+    self.was_closed = True
+
+class FakeSwitchFactory:
+  def __init__(
+      self,
+      delay_sec: float = 0.0,
+      failing_urls: set = set(),
+      unresponsive_urls: set = set(),
+      slow_urls: set = set()
+    ):
+    self.delay_sec = delay_sec
+    self.failing_urls = failing_urls
+    self.unresponsive_urls = unresponsive_urls
+    self.slow_urls = slow_urls
+    self.switches: dict[str, FakeSwitch] = {}
+    self.create_count = 0
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self._lock = threading.Lock()
+    self._slow_released = threading.Event()
+
+  def __call__(self, url: str, timeout_sec = None, machine_id = None) -> FakeSwitch:
+    if url in self.failing_urls:
+      raise ConnectionError(f'Unable to connect to {url}')
+    with self._lock:
+      self.create_count += 1
+      switch = FakeSwitch(self, url)
+      self.switches[url] = switch
+    return switch
+
+  def work(self, url: str) -> None:
+    with self._lock:
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    try:
+      if url in self.slow_urls:
+        self._slow_released.wait(2.0)
+      time.sleep(self.delay_sec)
+    finally:
+      with self._lock:
+        self.in_flight -= 1
+
+  def release_slow(self) -> None:
+    self._slow_released.set()
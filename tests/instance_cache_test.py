@@ -0,0 +1,169 @@
+import threading
+import time
+import pytest
+
+from kesslerav import SHARED_MEDIA_SWITCHES, get_media_switch
+from kesslerav.drivers import DRIVERS
+from kesslerav.instance_cache import InstanceCache
+
+from driver_fakes import FakeDriver
+
+class FakeInstance:
+  def __init__(self, name: str = 'fake'):
+    self.name = name
+    self.close_count = 0
+
+  def close(self) -> None:
+    self.close_count += 1
+
+class TestInstanceCache:
+  def test_same_key_shares_instance(self):
+    sut = InstanceCache()
+    created = []
+    def factory():
+      created.append(FakeInstance())
+      return created[-1]
+
+    first = sut.acquire('a', factory)
+    second = sut.acquire('a', factory)
+
+    assert len(created) == 1
+    assert first.instance is second.instance
+    assert sut.reference_count('a') == 2
+
+  def test_handles_pass_attributes_through(self):
+    sut = InstanceCache()
+
+    handle = sut.acquire('a', lambda: FakeInstance('switch'))
+
+    assert handle.name == 'switch'
+
+  def test_closes_instance_when_last_handle_released(self):
+    sut = InstanceCache()
+    instance = FakeInstance()
+    first = sut.acquire('a', lambda: instance)
+    second = sut.acquire('a', lambda: instance)
+
+    first.close()
+    closed_after_first = instance.close_count
+    second.close()
+
+    assert closed_after_first == 0
+    assert instance.close_count == 1
+    assert 'a' not in sut
+
+  def test_releasing_handle_twice_releases_once(self):
+    sut = InstanceCache()
+    instance = FakeInstance()
+    first = sut.acquire('a', lambda: instance)
+    sut.acquire('a', lambda: instance)
+
+    first.release()
+    first.release()
+
+    assert sut.reference_count('a') == 1
+    assert instance.close_count == 0
+
+  def test_released_handles_cannot_be_used(self):
+    sut = InstanceCache()
+    handle = sut.acquire('a', FakeInstance)
+
+    handle.release()
+
+    with pytest.raises(RuntimeError):
+      handle.name
+
+  def test_failed_creation_is_retried(self):
+    sut = InstanceCache()
+    def fail():
+      raise OSError('unreachable')
+
+    with pytest.raises(OSError):
+      sut.acquire('a', fail)
+    result = sut.acquire('a', FakeInstance)
+
+    assert isinstance(result.instance, FakeInstance)
+
+  def test_concurrent_requests_wait_for_single_creation(self):
+    sut = InstanceCache()
+    created = []
+    def factory():
+      time.sleep(0.05)
+      created.append(FakeInstance())
+      return created[-1]
+    handles = []
+
+    threads = [threading.Thread(target = lambda: handles.append(sut.acquire('a', factory))) for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    assert len(created) == 1
+    assert sut.reference_count('a') == 5
+
+  def test_raises_when_options_differ_from_existing_instance(self):
+    sut = InstanceCache()
+    sut.acquire('a', FakeInstance, options = {'timeout_sec': 1.0})
+
+    with pytest.raises(ValueError):
+      sut.acquire('a', FakeInstance, options = {'timeout_sec': 2.0})
+    assert sut.reference_count('a') == 1
+
+  def test_close_closes_every_instance(self):
+    sut = InstanceCache()
+    handle = sut.acquire('a', FakeInstance)
+
+    sut.close()
+    handle.release()
+
+    assert handle.instance.close_count == 1
+    assert len(sut) == 0
+
+class TestSharedMediaSwitches:
+  @pytest.fixture
+  def driver(self):
+    driver = FakeDriver(lambda endpoint: FakeInstance(endpoint.url))
+    DRIVERS.register('fake', 'protocol2k', driver)
+    yield driver
+    DRIVERS.unregister('fake', 'protocol2k')
+    SHARED_MEDIA_SWITCHES.close()
+
+  def test_equivalent_urls_share_media_switch(self, driver: FakeDriver):
+    first = get_media_switch('fake://switch.local:5000', shared = True)
+    second = get_media_switch('FAKE://Switch.Local:5000#protocol2000', shared = True)
+
+    assert driver.created == 1
+    assert first.instance is second.instance
+
+  def test_udp_urls_with_default_port_share_media_switch(self, driver: FakeDriver):
+    udp_driver = DRIVERS.get('udp', 'protocol2k')
+    DRIVERS.register('udp', 'protocol2k', driver)
+    try:
+      first = get_media_switch('udp://switch.local', shared = True)
+      second = get_media_switch('udp://switch.local:50000', shared = True)
+    finally:
+      DRIVERS.register('udp', 'protocol2k', udp_driver)
+
+    assert driver.created == 1
+    assert first.instance is second.instance
+
+  def test_machine_ids_get_separate_media_switches(self, driver: FakeDriver):
+    first = get_media_switch('fake://switch.local', machine_id = 1, shared = True)
+    second = get_media_switch('fake://switch.local', machine_id = 2, shared = True)
+
+    assert driver.created == 2
+    assert first.instance is not second.instance
+
+  def test_conflicting_options_are_rejected(self, driver: FakeDriver):
+    get_media_switch('fake://switch.local', timeout_sec = 1.0, shared = True)
+
+    with pytest.raises(ValueError):
+      get_media_switch('fake://switch.local', timeout_sec = 2.0, shared = True)
+    assert driver.created == 1
+
+  def test_unshared_requests_create_media_switches(self, driver: FakeDriver):
+    get_media_switch('fake://switch.local')
+    get_media_switch('fake://switch.local')
+
+    assert driver.created == 2
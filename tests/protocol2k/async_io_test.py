@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import pytest
+
+from kesslerav.protocol2k.async_io import AsyncTcpDevice
+from kesslerav.protocol2k.io import Codec, Command, Instruction, TcpEndpoint
+
+class TestAsyncTcpDevice:
+  def test_process_returns_response_instructions(self):
+    instruction = Instruction(Command.QUERY_PANEL_LOCK)
+    expected = [Instruction(Command.QUERY_PANEL_LOCK)]
+
+    async def scenario(endpoint: TcpEndpoint) -> list[Instruction]:
+      sut = AsyncTcpDevice(endpoint)
+      try:
+        return await sut.process(instruction)
+      finally:
+        await sut.close()
+
+    results = run_against_server(scenario)
+
+    assert results == expected
+
+  def test_process_reuses_open_connection(self):
+    instruction = Instruction(Command.QUERY_PANEL_LOCK)
+
+    async def scenario(endpoint: TcpEndpoint) -> AsyncTcpDevice:
+      sut = AsyncTcpDevice(endpoint)
+      await sut.process(instruction)
+      await sut.process(instruction)
+      await sut.close()
+      return sut
+
+    sut = run_against_server(scenario)
+
+    assert sut.connections_opened == 1
+    assert sut.connections_reused == 1
+    assert sut.last_connection_reused
+
+  def test_pipelined_process_sends_batch_in_single_write(self):
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 2, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+    writes = []
+
+    async def scenario(endpoint: TcpEndpoint) -> list[Instruction]:
+      sut = AsyncTcpDevice(endpoint, pipelined = True)
+      try:
+        return await sut.process(instructions)
+      finally:
+        await sut.close()
+
+    results = run_against_server(scenario, writes = writes)
+
+    assert writes == [Codec.encode_many(instructions)]
+    assert [result.id for result in results] == [i.id for i in instructions]
+
+  def test_process_times_out_once_when_device_does_not_respond(
+      self,
+      caplog: pytest.LogCaptureFixture
+    ):
+    caplog.set_level(logging.INFO)
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+
+    async def scenario(endpoint: TcpEndpoint) -> list[Instruction]:
+      sut = AsyncTcpDevice(endpoint, pipelined = True)
+      try:
+        return await sut.process(instructions)
+      finally:
+        await sut.close()
+
+    results = run_against_server(scenario, respond = False)
+
+    assert 'Timed out waiting for 2 of 2 responses' in caplog.text
+    assert results == []
+
+#
+# Helpers
+#
+def run_against_server(scenario, respond: bool = True, writes: list = None):
+  """
+  Runs the scenario against a local server that answers every request frame
+  with its response-encoded counterpart.
+  """
+  async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+      while data := await reader.read(1024):
+        if writes is not None:
+          writes.append(data)
+        if respond:
+          responses = [
+            bytes((frame[0] | 0b01000000,)) + frame[1:]
+            for frame in (data[i:i + 4] for i in range(0, len(data), 4))
+          ]
+          writer.write(b''.join(responses))
+          await writer.drain()
+    finally:
+      writer.close()
+
+  async def main():
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+      return await scenario(TcpEndpoint('127.0.0.1', port, 0.2))
+
+  return asyncio.run(main())
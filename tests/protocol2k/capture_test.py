@@ -0,0 +1,103 @@
+import socket
+import pytest
+
+from kesslerav.protocol2k.capture import \
+  HEADER_FORMAT, RECORD_FORMAT, Direction, WireCapture, capture_paths
+from kesslerav.protocol2k.emulator import Emulator
+from kesslerav.protocol2k.io import Codec, Command, Instruction, TcpDevice, TcpEndpoint
+
+class TestWireCapture:
+  def test_writes_header_and_one_record_per_frame(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    frames = Codec.encode_many([Instruction(Command.QUERY_PANEL_LOCK), Instruction(Command.SWITCH_VIDEO, 3, 1, 1)])
+
+    with WireCapture(path) as sut:
+      sut.write(Direction.SENT, frames, timestamp_ns = 42)
+
+    data = path.read_bytes()
+    assert len(data) == HEADER_FORMAT.size + 2 * RECORD_FORMAT.size
+    assert RECORD_FORMAT.unpack_from(data, HEADER_FORMAT.size) == (42, Direction.SENT, frames[:4])
+    assert sut.records_written == 2
+
+  def test_raises_exception_for_partial_frames(self, tmp_path):
+    with WireCapture(tmp_path / 'capture.bin') as sut:
+      with pytest.raises(ValueError):
+        sut.write(Direction.SENT, b'\x01\x83')
+
+  def test_rotates_when_file_is_full(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    frame = Codec.encode(Instruction(Command.QUERY_PANEL_LOCK))
+    sut = WireCapture(path, max_bytes = HEADER_FORMAT.size + 2 * RECORD_FORMAT.size, backup_count = 2)
+
+    for _ in range(7):
+      sut.write(Direction.SENT, frame)
+    sut.close()
+
+    assert capture_paths(path) == [tmp_path / 'capture.bin.2', tmp_path / 'capture.bin.1', path]
+    assert path.stat().st_size == HEADER_FORMAT.size + RECORD_FORMAT.size
+    assert sut.rotations == 3
+
+  def test_rotation_without_backups_discards_old_records(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    frame = Codec.encode(Instruction(Command.QUERY_PANEL_LOCK))
+    sut = WireCapture(path, max_bytes = HEADER_FORMAT.size + RECORD_FORMAT.size, backup_count = 0)
+
+    for _ in range(3):
+      sut.write(Direction.SENT, frame)
+    sut.close()
+
+    assert capture_paths(path) == [path]
+
+  def test_appends_to_existing_capture(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    frame = Codec.encode(Instruction(Command.QUERY_PANEL_LOCK))
+    with WireCapture(path) as first:
+      first.write(Direction.SENT, frame)
+
+    with WireCapture(path) as sut:
+      sut.write(Direction.RECEIVED, frame)
+
+    assert path.stat().st_size == HEADER_FORMAT.size + 2 * RECORD_FORMAT.size
+
+  def test_rejects_max_bytes_too_small_for_a_record(self, tmp_path):
+    with pytest.raises(ValueError):
+      WireCapture(tmp_path / 'capture.bin', max_bytes = HEADER_FORMAT.size)
+
+class TestCapturedSocket:
+  def test_records_whole_frames_split_across_reads(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    (reader, writer) = socket.socketpair()
+    capture = WireCapture(path)
+    sut = capture.wrap(reader)
+    buffer = bytearray(8)
+    try:
+      writer.sendall(b'\x5f\x80')
+      sut.recv_into(buffer)
+      records_after_partial = capture.records_written
+      writer.sendall(b'\x81\x81')
+      sut.recv_into(buffer)
+    finally:
+      sut.close()
+      writer.close()
+      capture.close()
+
+    assert records_after_partial == 0
+    assert capture.records_written == 1
+
+  def test_tcp_device_captures_both_directions(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    capture = WireCapture(path)
+    with Emulator() as emulator:
+      port = emulator.add_switch().port
+      device = TcpDevice(TcpEndpoint('127.0.0.1', port), capture = capture)
+
+      device.process(Instruction(Command.QUERY_PANEL_LOCK))
+      device.close()
+    capture.close()
+
+    data = path.read_bytes()
+    records = list(RECORD_FORMAT.iter_unpack(data[HEADER_FORMAT.size:]))
+    assert [(direction, frame) for (_, direction, frame) in records] == [
+      (Direction.SENT, b'\x1f\x80\x80\xc1'),
+      (Direction.RECEIVED, b'\x5f\x80\x80\x81'),
+    ]
@@ -0,0 +1,168 @@
+import socket
+import threading
+import time
+import pytest
+
+from kesslerav.protocol2k import get_tcp_matrix_switch, get_tcp_media_switch
+from kesslerav.protocol2k.emulator import Emulator, VirtualSwitch
+from kesslerav.protocol2k.io import Codec, Command, Instruction
+
+class TestVirtualSwitch:
+  def test_switch_video_routes_input_and_echoes(self):
+    sut = VirtualSwitch(input_count = 8, output_count = 4)
+    request = Instruction(Command.SWITCH_VIDEO, 5, 2, 1)
+
+    reply = sut.handle(request)
+
+    assert reply == request
+    assert sut.routes == {1: 1, 2: 5, 3: 1, 4: 1}
+
+  def test_switch_video_to_output_zero_routes_every_output(self):
+    sut = VirtualSwitch(input_count = 8, output_count = 3)
+
+    sut.handle(Instruction(Command.SWITCH_VIDEO, 4, 0, 1))
+
+    assert sut.routes == {1: 4, 2: 4, 3: 4}
+
+  def test_invalid_input_replies_with_error(self):
+    sut = VirtualSwitch(input_count = 4)
+
+    reply = sut.handle(Instruction(Command.SWITCH_VIDEO, 9, 1, 1))
+
+    assert reply.id == Command.ERROR
+    assert sut.routes == {1: 1}
+
+  def test_define_machine_reports_counts(self):
+    sut = VirtualSwitch(input_count = 12, output_count = 3)
+
+    inputs = sut.handle(Instruction(Command.DEFINE_MACHINE, 1, 1, 1))
+    outputs = sut.handle(Instruction(Command.DEFINE_MACHINE, 2, 1, 1))
+
+    assert inputs.output_value == 12
+    assert outputs.output_value == 3
+
+  def test_ignores_requests_for_other_machines(self):
+    sut = VirtualSwitch(machine_id = 2)
+
+    reply = sut.handle(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 3))
+
+    assert reply is None
+
+  def test_answers_requests_for_all_machines(self):
+    sut = VirtualSwitch(machine_id = 2)
+
+    reply = sut.handle(Instruction(Command.QUERY_PANEL_LOCK))
+
+    assert reply == Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 2)
+
+  def test_front_panel_is_ignored_while_locked(self):
+    sut = VirtualSwitch()
+    sut.handle(Instruction(Command.PANEL_LOCK, 1, 0, 1))
+
+    event = sut.press_input(3)
+
+    assert event is None
+    assert sut.routes == {1: 1}
+
+class TestEmulator:
+  def test_media_switch_loads_emulated_state(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch(input_count = 6)
+      emulated.switch.press_input(4)
+      emulated.switch.press_lock(True)
+
+      media_switch = get_tcp_media_switch('127.0.0.1', emulated.port)
+      media_switch.close()
+
+    assert media_switch.input_count == 6
+    assert media_switch.output_count == 1
+    assert media_switch.selected_source == 4
+    assert media_switch.is_locked
+
+  def test_matrix_switch_routes_are_applied(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch(input_count = 8, output_count = 4)
+      matrix = get_tcp_matrix_switch('127.0.0.1', emulated.port)
+
+      matrix.route_many({1: 2, 3: 7})
+      matrix.update()
+      matrix.close()
+
+    assert emulated.switch.routes == {1: 2, 2: 1, 3: 7, 4: 1}
+    assert matrix.routes == {1: 2, 2: 1, 3: 7, 4: 1}
+
+  def test_hosts_switches_on_separate_ports(self):
+    with Emulator() as sut:
+      sut.add_switch(input_count = 4)
+      sut.add_switch(input_count = 9)
+
+      counts = [get_tcp_media_switch('127.0.0.1', s.port).input_count for s in sut.switches]
+      ports = {s.port for s in sut.switches}
+
+    assert counts == [4, 9]
+    assert len(ports) == 2
+
+  def test_fragmented_replies_reassemble(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch(input_count = 5, fragment_size_bytes = 1)
+
+      media_switch = get_tcp_media_switch('127.0.0.1', emulated.port, timeout_sec = 1.0)
+      media_switch.close()
+
+    assert media_switch.input_count == 5
+
+  def test_latency_delays_replies(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch(latency_sec = 0.05)
+
+      with socket.create_connection(('127.0.0.1', emulated.port)) as conn:
+        start = time.monotonic()
+        conn.sendall(Codec.encode(Instruction(Command.QUERY_PANEL_LOCK)))
+        conn.recv(4)
+        elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.05
+
+  def test_connections_beyond_limit_are_closed(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch(max_connections = 1)
+
+      with socket.create_connection(('127.0.0.1', emulated.port)) as first:
+        first.sendall(Codec.encode(Instruction(Command.QUERY_PANEL_LOCK)))
+        first.recv(4)
+        with socket.create_connection(('127.0.0.1', emulated.port)) as second:
+          second.settimeout(1.0)
+          data = second.recv(4)
+
+    assert data == b''
+    assert emulated.connections_rejected == 1
+
+  def test_front_panel_events_reach_listeners(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch(input_count = 8)
+      media_switch = get_tcp_media_switch('127.0.0.1', emulated.port)
+      changed = threading.Event()
+      media_switch.add_listener(lambda _: changed.set())
+      media_switch.start_listening()
+
+      emulated.press_input(6)
+      assert changed.wait(2.0)
+      media_switch.close()
+
+    assert media_switch.selected_source == 6
+
+  def test_replies_set_response_bit(self):
+    with Emulator() as sut:
+      emulated = sut.add_switch()
+
+      with socket.create_connection(('127.0.0.1', emulated.port)) as conn:
+        conn.sendall(Codec.encode(Instruction(Command.QUERY_PANEL_LOCK)))
+        data = conn.recv(4)
+
+    assert data[0] == Command.QUERY_PANEL_LOCK | 0x40
+
+  def test_rejects_invalid_fragment_size(self):
+    sut = Emulator()
+
+    with pytest.raises(ValueError):
+      sut.add_switch(fragment_size_bytes = 0)
@@ -1,4 +1,8 @@
-from kesslerav.protocol2k.io import Instruction
+import threading
+
+from typing import Optional
+
+from kesslerav.protocol2k.io import Instruction, Priority
 
 #
 # Fakes
@@ -9,10 +13,15 @@ class FakeSocket:
   def __init__(self):
     self.request_bytes: list[bytes] = []
     self.response_bytes: bytes = FakeSocket.FAKE_INSTRUCTION_BYTES
+    # When set, each read returns the next chunk, timing out once exhausted
+    self.response_chunks: Optional[list[bytes]] = None
     self.response_buffer_size = 0
+    self.unread_bytes = b''
     self.response_index = 0
 
     self.should_timeout = False
+    self.should_reset = False
+    self.timeout_sec = None
 
     self.send_count = 0
     self.recv_count = 0
@@ -20,17 +29,38 @@ class FakeSocket:
     self.was_closed = False
 
   def send(self, data: bytes) -> None:
+    if self.should_reset:
+      raise ConnectionResetError
     self.send_count += 1
     self.request_bytes.append(data)
 
+  def sendall(self, data: bytes) -> None:
+    self.send(data)
+
+  def settimeout(self, timeout_sec) -> None:
+    self.timeout_sec = timeout_sec
+
   def recv(self, bufsize: int) -> bytes:
     self.recv_count += 1
     self.response_buffer_size = bufsize
     if self.should_timeout:
       raise TimeoutError
+    elif self.response_chunks is not None:
+      if len(self.response_chunks) == 0:
+        raise TimeoutError
+      return self.response_chunks.pop(0)
     else:
       return self.response_bytes
 
+  def recv_into(self, buffer, nbytes: int = 0) -> int:
+    size = nbytes or len(buffer)
+    if len(self.unread_bytes) == 0:
+      self.unread_bytes = self.recv(size)
+    data = self.unread_bytes[:size]
+    self.unread_bytes = self.unread_bytes[size:]
+    buffer[:len(data)] = data
+    return len(data)
+
   def close(self) -> None:
     self.close_count += 1
     self.was_closed = True
@@ -41,16 +71,39 @@ class FakeDevice:
     self.response_instructions = []
 
     self.process_count = 0
+    self.processed_batches = []
+    # When set, computes the response instructions for each call
+    self.respond = None
+    self.on_instructions = None
+    self.was_closed = False
 
-  def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      pipelined: Optional[bool] = None,
+      priority: Optional[Priority] = None
+    ) -> list[Instruction]:
     try:
       _ = iter(instructions)
     except TypeError:
       instructions = [instructions]
     self.process_count += 1
     self.processed_instructions.extend(instructions)
+    self.processed_batches.append(list(instructions))
+    if self.respond is not None:
+      return self.respond(instructions)
     return self.response_instructions
 
+  def start_listening(self, on_instructions) -> None:
+    self.on_instructions = on_instructions
+
+  def stop_listening(self) -> None:
+    self.on_instructions = None
+
+  def close(self) -> None:
+    self.stop_listening()
+    self.was_closed = True
+
   def clear_processed_instructions(self):
     self.processed_instructions = []
 
@@ -59,4 +112,45 @@ class FakeDevice:
 
   def clear_instructions(self):
     self.clear_processed_instructions()
-    self.clear_response_instructions()
\ No newline at end of file
+    self.clear_response_instructions()
+
+class BlockingFakeDevice(FakeDevice):
+  """
+  Fake device whose `process` can be held open, to simulate slow devices
+  """
+  def __init__(self):
+    super().__init__()
+    self._released = threading.Event()
+    self._released.set()
+    self._processing = threading.Event()
+
+  def block(self) -> None:
+    self._processing.clear()
+    self._released.clear()
+
+  def unblock(self) -> None:
+    self._released.set()
+
+  def wait_until_processing(self, timeout_sec: float = 2.0) -> None:
+    self._processing.wait(timeout_sec)
+
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      pipelined: Optional[bool] = None,
+      priority: Optional[Priority] = None
+    ) -> list[Instruction]:
+    self._processing.set()
+    self._released.wait()
+    return super().process(instructions, pipelined, priority)
+
+class FakeAsyncDevice(FakeDevice):
+  async def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      pipelined: Optional[bool] = None
+    ) -> list[Instruction]:
+    return FakeDevice.process(self, instructions, pipelined)
+
+  async def close(self) -> None:
+    self.was_closed = True
@@ -0,0 +1,127 @@
+import pytest
+
+from kesslerav.protocol2k.health import CircuitBreaker, CircuitState
+
+class FakeClock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self) -> float:
+    return self.now
+
+class TestCircuitBreaker:
+  def test_starts_closed(self):
+    sut = self.create_breaker()
+
+    assert sut.state == CircuitState.CLOSED
+    assert sut.is_available
+    assert sut.allow_request()
+
+  def test_opens_after_consecutive_failures(self):
+    sut = self.create_breaker(failure_threshold = 3)
+
+    for _ in range(3):
+      sut.record_failure()
+
+    assert sut.state == CircuitState.OPEN
+    assert not sut.is_available
+    assert not sut.allow_request()
+    assert sut.rejections == 1
+    assert sut.times_opened == 1
+
+  def test_success_resets_failure_count(self):
+    sut = self.create_breaker(failure_threshold = 3)
+
+    sut.record_failure()
+    sut.record_failure()
+    sut.record_success()
+    sut.record_failure()
+
+    assert sut.state == CircuitState.CLOSED
+    assert sut.consecutive_failures == 1
+
+  def test_lets_single_probe_through_once_backoff_elapsed(self):
+    clock = FakeClock()
+    sut = self.create_breaker(failure_threshold = 1, base_delay_sec = 1.0, clock = clock)
+    sut.record_failure()
+
+    clock.now += 1.0
+    state_before_probe = sut.state
+    first = sut.allow_request()
+    second = sut.allow_request()
+
+    assert state_before_probe == CircuitState.HALF_OPEN
+    assert first
+    assert not second
+
+  def test_closes_when_probe_succeeds(self):
+    clock = FakeClock()
+    sut = self.create_breaker(failure_threshold = 1, clock = clock)
+    sut.record_failure()
+    clock.now += sut.retry_in_sec
+    sut.allow_request()
+
+    sut.record_success()
+
+    assert sut.state == CircuitState.CLOSED
+    assert sut.consecutive_failures == 0
+
+  def test_doubles_backoff_when_probe_fails(self):
+    clock = FakeClock()
+    sut = self.create_breaker(failure_threshold = 1, base_delay_sec = 1.0, clock = clock)
+    delays = []
+
+    sut.record_failure()
+    for _ in range(4):
+      delays.append(sut.retry_in_sec)
+      clock.now += sut.retry_in_sec
+      sut.allow_request()
+      sut.record_failure()
+
+    assert delays == [1.0, 2.0, 4.0, 8.0]
+
+  def test_caps_backoff(self):
+    clock = FakeClock()
+    sut = self.create_breaker(failure_threshold = 1, base_delay_sec = 1.0, max_delay_sec = 5.0, clock = clock)
+
+    sut.record_failure()
+    for _ in range(100):
+      clock.now += sut.retry_in_sec
+      sut.allow_request()
+      sut.record_failure()
+
+    assert sut.retry_in_sec == 5.0
+
+  def test_jitter_shortens_backoff(self):
+    sut = self.create_breaker(failure_threshold = 1, base_delay_sec = 4.0, jitter = 0.5, rng = lambda: 1.0)
+
+    sut.record_failure()
+
+    assert sut.retry_in_sec == 2.0
+
+  def test_snapshot_reports_state(self):
+    sut = self.create_breaker(failure_threshold = 1, base_delay_sec = 2.0)
+    sut.record_failure()
+
+    result = sut.snapshot()
+
+    assert result == {
+      'state': 'open',
+      'consecutive_failures': 1,
+      'retry_in_sec': 2.0,
+      'times_opened': 1,
+      'rejections': 0,
+    }
+
+  @pytest.mark.parametrize('kwargs', [
+    {'failure_threshold': 0},
+    {'base_delay_sec': 0},
+    {'base_delay_sec': 2.0, 'max_delay_sec': 1.0},
+    {'jitter': 1.5},
+  ])
+  def test_rejects_invalid_settings(self, kwargs: dict):
+    with pytest.raises(ValueError):
+      CircuitBreaker(**kwargs)
+
+  def create_breaker(self, clock = None, rng = lambda: 0.0, **kwargs) -> CircuitBreaker:
+    return CircuitBreaker(clock = clock or FakeClock(), rng = rng, **kwargs)
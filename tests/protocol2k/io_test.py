@@ -1,10 +1,17 @@
+import copy
 import logging
+import pickle
 import pytest
 import random
 import socket
+import threading
+import time
 
+from kesslerav.protocol2k.emulator import Emulator
+from kesslerav.protocol2k.health import CircuitBreaker, CircuitState
 from kesslerav.protocol2k.io import \
-  Command, Instruction, Codec, TcpDevice, TcpEndpoint, _VALID_RANGE
+  Command, CommandQueue, Instruction, InstructionBatch, Codec, FrameCorrelator, \
+  FrameDecoder, Priority, ResponseCorrelator, TcpDevice, TcpEndpoint, _VALID_RANGE
 
 from fakes import FakeSocket
 
@@ -23,6 +30,20 @@ class TestCommand:
 
     assert result is False
 
+  def test_lookup_returns_command_for_known_command_id(self):
+    valid_cmd = gen_valid_cmd()
+
+    result = Command.lookup(valid_cmd.value)
+
+    assert result is valid_cmd
+
+  def test_lookup_returns_none_for_unknown_command_id(self):
+    invalid_cmd_id = gen_invalid_cmd_id()
+
+    result = Command.lookup(invalid_cmd_id)
+
+    assert result is None
+
 class TestInstruction:
   def test_name_returns_command_name_for_supported_commands(self):
     valid_cmd = gen_valid_cmd()
@@ -122,6 +143,148 @@ class TestInstruction:
 
     assert result == expected
 
+  def test_frame_tuple_returns_tuple_of_data(self):
+    instruction = Instruction(Command.SWITCH_VIDEO, 3, 1, 1)
+
+    result = instruction.frame_tuple
+
+    assert result == (Command.SWITCH_VIDEO.value, 3, 1, 1)
+
+  def test_is_immutable(self):
+    sut = Instruction(Command.SWITCH_VIDEO, 3, 1, 1)
+
+    with pytest.raises(AttributeError):
+      sut.foo = 1
+    with pytest.raises(AttributeError):
+      sut._frame = (1, 2, 3, 4)
+
+  def test_equal_instructions_hash_equally(self):
+    first = Instruction(Command.SWITCH_VIDEO, 3, 1, 1)
+    second = Instruction(1, 3, 1, 1)
+
+    result = {first: 'value'}
+
+    assert first == second
+    assert result[second] == 'value'
+
+  def test_reuses_instance_for_repeated_instructions(self):
+    first = Instruction(Command.QUERY_PANEL_LOCK, None, None, 1)
+
+    result = Instruction(Command.QUERY_PANEL_LOCK, None, None, 1)
+
+    assert result is first
+
+  def test_decoded_instructions_do_not_crowd_out_interned_instructions(self):
+    data = b''.join(
+      bytes((Command.SWITCH_VIDEO, 0x80 | input_value, 0x80 | output_value, 0x81))
+      for input_value in range(128)
+      for output_value in range(64)
+    )
+
+    decoded = Codec.decode_many(data)
+    first = Instruction(Command.QUERY_PANEL_LOCK, None, None, 3)
+    result = Instruction(Command.QUERY_PANEL_LOCK, None, None, 3)
+
+    assert len(decoded) > Instruction.INTERN_CACHE_SIZE
+    assert result is first
+
+  def test_decoding_reuses_interned_instructions(self):
+    query = Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1)
+
+    result = Codec.decode(Codec.encode(query))
+
+    assert result is query
+
+  def test_interning_continues_once_cache_is_full(self):
+    for input_value in range(128):
+      for output_value in range(40):
+        Instruction(Command.SWITCH_VIDEO, input_value, output_value, 2)
+
+    first = Instruction(Command.QUERY_PANEL_LOCK, None, None, 4)
+    result = Instruction(Command.QUERY_PANEL_LOCK, None, None, 4)
+
+    assert result is first
+
+  def test_survives_copy_and_pickle(self):
+    sut = Instruction(Command.SWITCH_VIDEO, 3, 1, 1)
+
+    copied = copy.deepcopy(sut)
+    unpickled = pickle.loads(pickle.dumps(sut))
+
+    assert copied == sut
+    assert unpickled == sut
+
+class TestInstructionBatch:
+  def test_columns_default_like_instruction_arguments(self):
+    sut = InstructionBatch([Command.QUERY_PANEL_LOCK, Command.SWITCH_VIDEO])
+
+    assert list(sut) == [
+      Instruction(Command.QUERY_PANEL_LOCK),
+      Instruction(Command.SWITCH_VIDEO),
+    ]
+
+  def test_accepts_bytes_like_columns(self):
+    sut = InstructionBatch(bytes([1, 1]), bytearray([3, 4]), memoryview(b'\x01\x02'), [1, 1])
+
+    assert sut.to_instructions() == [
+      Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+      Instruction(Command.SWITCH_VIDEO, 4, 2, 1),
+    ]
+
+  def test_raises_exception_for_invalid_values(self):
+    with pytest.raises(ValueError):
+      InstructionBatch([1, 1], [3, gen_invalid_io_value()])
+
+  def test_raises_exception_for_mismatched_columns(self):
+    with pytest.raises(ValueError):
+      InstructionBatch([1, 1], [3])
+
+  def test_raises_exception_for_invalid_command_ids(self):
+    with pytest.raises(ValueError):
+      InstructionBatch([256])
+
+  def test_from_instructions_round_trips(self):
+    instructions = [
+      Instruction(gen_valid_cmd(), gen_valid_io_value(), gen_valid_io_value(), gen_valid_io_value())
+      for _ in range(50)
+    ]
+
+    sut = InstructionBatch.from_instructions(instructions)
+
+    assert len(sut) == 50
+    assert list(sut) == instructions
+
+  def test_indexing_and_slicing(self):
+    sut = InstructionBatch([1, 5, 31], [3, 0, 0], [1, 2, 0], [1, 1, 1])
+
+    assert sut[1] == Instruction(Command.QUERY_OUTPUT_STATUS, 0, 2, 1)
+    assert sut[1:] == InstructionBatch([5, 31], [0, 0], [2, 0], [1, 1])
+
+  def test_concat_joins_batches(self):
+    first = InstructionBatch([1], [3])
+    second = InstructionBatch([31])
+
+    result = InstructionBatch.concat([first, second])
+
+    assert list(result) == [Instruction(Command.SWITCH_VIDEO, 3), Instruction(Command.QUERY_PANEL_LOCK)]
+
+  def test_columns_are_read_only(self):
+    sut = InstructionBatch([1], [3])
+
+    with pytest.raises(TypeError):
+      sut.inputs[0] = 4
+
+  def test_as_numpy_shares_memory(self):
+    numpy = pytest.importorskip('numpy')
+    sut = InstructionBatch([1, 1], [3, 4])
+
+    (commands, inputs, _, machine_ids) = sut.as_numpy()
+
+    assert commands.dtype == numpy.uint8
+    assert inputs.tolist() == [3, 4]
+    assert machine_ids.tolist() == [Instruction.DEFAULT_MACHINE_ID] * 2
+    assert not inputs.flags.writeable
+
 class TestCodec:
   def test_encode_generates_valid_bytes(self):
     expected = b'\x1f\x80\x80\xc1'
@@ -131,6 +294,14 @@ class TestCodec:
 
     assert result == expected
 
+  def test_encode_caches_encoded_bytes(self):
+    cmd = Instruction(Command.QUERY_PANEL_LOCK)
+    first = Codec.encode(cmd)
+
+    result = Codec.encode(cmd)
+
+    assert result is first
+
   def test_decode_hydrates_from_request_bytes(self):
     req_bytes = b'\x1f\x80\x80\xc1'
     expected = Instruction(Command.QUERY_PANEL_LOCK)
@@ -163,6 +334,373 @@ class TestCodec:
 
     assert result == input
 
+  def test_encode_many_concatenates_frames(self):
+    instructions = [
+      Instruction(Command.QUERY_PANEL_LOCK),
+      Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+    ]
+    expected = b'\x1f\x80\x80\xc1\x01\x83\x81\x81'
+
+    result = Codec.encode_many(instructions)
+
+    assert result == expected
+
+  def test_decode_many_hydrates_request_and_response_frames(self):
+    data = b'\x1f\x80\x80\xc1\x41\x83\x81\x81\x7e\x81\x90\x81'
+    expected = [
+      Instruction(Command.QUERY_PANEL_LOCK),
+      Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 1, 16, 1),
+    ]
+
+    result = Codec.decode_many(data)
+
+    assert result == expected
+
+  def test_decode_many_returns_raw_frames_when_requested(self):
+    data = b'\x41\x83\x81\x81\x7e\x81\x90\x81'
+    expected = [(1, 3, 1, 1), (62, 1, 16, 1)]
+
+    result = Codec.decode_many(memoryview(data), raw = True)
+
+    assert result == expected
+
+  def test_decode_many_matches_decode(self):
+    instructions = [
+      Instruction(gen_valid_cmd(), gen_valid_io_value(), gen_valid_io_value(), gen_valid_io_value())
+      for _ in range(100)
+    ]
+    data = Codec.encode_many(instructions)
+
+    result = Codec.decode_many(data)
+
+    assert result == [Codec.decode(Codec.encode(i)) for i in instructions]
+
+  def test_decode_many_raises_exception_for_partial_frames(self):
+    data = b'\x41\x83\x81\x81\x7e'
+
+    with pytest.raises(ValueError):
+      Codec.decode_many(data)
+
+  def test_encode_batch_matches_encode_many(self):
+    instructions = [
+      Instruction(gen_valid_cmd(), gen_valid_io_value(), gen_valid_io_value(), gen_valid_io_value())
+      for _ in range(100)
+    ]
+
+    result = Codec.encode_many(InstructionBatch.from_instructions(instructions))
+
+    assert result == Codec.encode_many(instructions)
+
+  def test_decode_batch_hydrates_request_and_response_frames(self):
+    data = b'\x1f\x80\x80\xc1\x41\x83\x81\x81\x7e\x81\x90\x81'
+
+    result = Codec.decode_batch(memoryview(data))
+
+    assert result == InstructionBatch.from_instructions(Codec.decode_many(data))
+
+  def test_decode_batch_raises_exception_for_partial_frames(self):
+    with pytest.raises(ValueError):
+      Codec.decode_batch(b'\x41\x83\x81\x81\x7e')
+
+class TestFrameDecoder:
+  def test_feed_decodes_whole_frames(self):
+    sut = FrameDecoder()
+
+    results = list(sut.feed(b'\x5f\x80\x81\x81'))
+
+    assert results == [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+
+  def test_feed_reassembles_fragmented_frames(self):
+    data = b'\x5f\x80\x81\x81\x41\x83\x81\x81'
+    expected = [
+      Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1),
+      Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+    ]
+    sut = FrameDecoder()
+
+    results = []
+    for index in range(len(data)):
+      results.extend(sut.feed(data[index:index + 1]))
+
+    assert results == expected
+    assert sut.pending_bytes == 0
+
+  def test_feed_carries_partial_frame_across_reads(self):
+    sut = FrameDecoder()
+
+    first = list(sut.feed(b'\x5f\x80\x81\x81\x41\x83'))
+    second = list(sut.feed(b'\x81\x81'))
+
+    assert first == [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+    assert second == [Instruction(Command.SWITCH_VIDEO, 3, 1, 1)]
+
+  def test_feed_decodes_coalesced_input_larger_than_capacity(self):
+    frame_count = 1000
+    expected = [Instruction(Command.SWITCH_VIDEO, i % 16, 1, 1) for i in range(frame_count)]
+    data = b''.join(Codec.encode(instruction) for instruction in expected)
+    sut = FrameDecoder(capacity_bytes = 8)
+
+    results = list(sut.feed(data))
+
+    assert results == expected
+
+  def test_retains_unconsumed_frames_for_next_read(self):
+    sut = FrameDecoder()
+
+    first = sut.feed(b'\x5f\x80\x81\x81\x41\x83\x81\x81')
+    next(first)
+    second = list(sut.feed(b'\x41\x84\x81\x81'))
+
+    assert second == [
+      Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+      Instruction(Command.SWITCH_VIDEO, 4, 1, 1),
+    ]
+
+  def test_read_from_reads_into_buffer(self):
+    (reader, writer) = socket.socketpair()
+    sut = FrameDecoder()
+    try:
+      writer.sendall(b'\x5f\x80\x81')
+
+      first = list(sut.read_from(reader))
+      writer.sendall(b'\x81')
+      second = list(sut.read_from(reader))
+    finally:
+      reader.close()
+      writer.close()
+
+    assert first == []
+    assert second == [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+
+  def test_read_from_raises_when_connection_closed(self):
+    (reader, writer) = socket.socketpair()
+    sut = FrameDecoder()
+    writer.close()
+
+    try:
+      with pytest.raises(ConnectionResetError):
+        list(sut.read_from(reader))
+    finally:
+      reader.close()
+
+  def test_read_frames_from_returns_whole_encoded_frames(self):
+    (reader, writer) = socket.socketpair()
+    sut = FrameDecoder()
+    try:
+      writer.sendall(b'\x5f\x80\x81\x81\x41\x83')
+
+      first = sut.read_frames_from(reader)
+      writer.sendall(b'\x81\x81')
+      second = sut.read_frames_from(reader)
+    finally:
+      reader.close()
+      writer.close()
+
+    assert first == b'\x5f\x80\x81\x81'
+    assert second == b'\x41\x83\x81\x81'
+
+class TestResponseCorrelator:
+  def test_accept_returns_request_answered_by_reply(self):
+    request = Instruction(Command.QUERY_PANEL_LOCK)
+    sut = ResponseCorrelator([request])
+
+    result = sut.accept(Codec.decode(b'\x5f\x80\x81\x81'))
+
+    assert result == request
+    assert sut.is_complete
+
+  def test_accept_returns_none_for_unsolicited_reply(self):
+    request = Instruction(Command.QUERY_PANEL_LOCK)
+    sut = ResponseCorrelator([request])
+
+    result = sut.accept(Instruction(Command.SWITCH_VIDEO, 3, 1, 1))
+
+    assert result is None
+    assert sut.pending == [request]
+
+  def test_accept_distinguishes_define_machine_queries(self):
+    input_query = Instruction(Command.DEFINE_MACHINE, 1, 1)
+    output_query = Instruction(Command.DEFINE_MACHINE, 2, 1)
+    sut = ResponseCorrelator([input_query, output_query])
+
+    result = sut.accept(Instruction(Command.DEFINE_MACHINE, 2, 1, 1))
+
+    assert result == output_query
+    assert sut.pending == [input_query]
+
+  def test_accept_answers_oldest_request_with_error_reply(self):
+    first = Instruction(Command.SWITCH_VIDEO, 3, 1)
+    second = Instruction(Command.QUERY_PANEL_LOCK)
+    sut = ResponseCorrelator([first, second])
+
+    result = sut.accept(Instruction(Command.ERROR, 0, 0, 1))
+
+    assert result == first
+    assert sut.pending == [second]
+
+  def test_accept_treats_error_reply_as_unsolicited_when_complete(self):
+    sut = ResponseCorrelator([])
+
+    result = sut.accept(Instruction(Command.ERROR, 0, 0, 1))
+
+    assert result is None
+
+class TestFrameCorrelator:
+  def test_accept_counts_down_outstanding_requests(self):
+    sut = FrameCorrelator(InstructionBatch([5, 5, 31], [0, 0, 0], [1, 2, 0]))
+
+    first = sut.accept(Command.QUERY_OUTPUT_STATUS, 0)
+    unsolicited = sut.accept(Command.SWITCH_VIDEO, 3)
+
+    assert first == Command.QUERY_OUTPUT_STATUS
+    assert unsolicited is None
+    assert sut.pending_count == 2
+
+  def test_accept_distinguishes_define_machine_queries(self):
+    sut = FrameCorrelator(InstructionBatch([62], [1]))
+
+    result = sut.accept(Command.DEFINE_MACHINE, 2)
+
+    assert result is None
+    assert not sut.is_complete
+
+  def test_accept_answers_earliest_request_with_error_reply(self):
+    sut = FrameCorrelator(InstructionBatch([1, 31], [3, 0]))
+
+    result = sut.accept(Command.ERROR, 0)
+
+    assert result == Command.SWITCH_VIDEO
+    assert sut.pending_count == 1
+
+  def test_accept_treats_error_reply_as_unsolicited_when_complete(self):
+    sut = FrameCorrelator(InstructionBatch())
+
+    result = sut.accept(Command.ERROR, 0)
+
+    assert result is None
+
+class TestPriority:
+  def test_queries_are_background(self):
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+
+    result = Priority.for_instructions(instructions)
+
+    assert result == Priority.BACKGROUND
+
+  def test_commands_that_change_state_are_interactive(self):
+    instructions = [
+      Instruction(Command.QUERY_PANEL_LOCK),
+      Instruction(Command.SWITCH_VIDEO, 2, 1),
+    ]
+
+    result = Priority.for_instructions(instructions)
+
+    assert result == Priority.INTERACTIVE
+
+class TestCommandQueue:
+  def test_serves_interactive_waiters_before_background(self):
+    sut = CommandQueue()
+    order = []
+
+    def wait_for_turn(priority: Priority) -> None:
+      sut.acquire(priority)
+      order.append(priority)
+      sut.release()
+
+    sut.acquire()
+    waiters = []
+    for (depth, priority) in enumerate((Priority.BACKGROUND, Priority.INTERACTIVE), 1):
+      waiter = threading.Thread(target = wait_for_turn, args = (priority,))
+      waiter.start()
+      waiters.append(waiter)
+      wait_until(lambda: sut.depth == depth)
+    sut.release()
+    for waiter in waiters:
+      waiter.join(2.0)
+
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+  def test_is_wanted_only_by_higher_priority_waiters(self):
+    sut = CommandQueue()
+    sut.acquire(Priority.BACKGROUND)
+    waiter = threading.Thread(target = lambda: (sut.acquire(Priority.BACKGROUND), sut.release()))
+    waiter.start()
+    wait_until(lambda: sut.depth == 1)
+
+    result = sut.is_wanted_by(Priority.BACKGROUND)
+    sut.release()
+    waiter.join(2.0)
+
+    assert result is False
+
+  def test_holding_waits_behind_higher_priority_waiters(self):
+    sut = CommandQueue()
+    order = []
+
+    def hold(priority: Priority) -> None:
+      with sut.holding(priority):
+        order.append(priority)
+
+    sut.acquire()
+    waiters = []
+    for (depth, priority) in enumerate((Priority.BACKGROUND, Priority.INTERACTIVE), 1):
+      waiter = threading.Thread(target = hold, args = (priority,))
+      waiter.start()
+      waiters.append(waiter)
+      wait_until(lambda: sut.depth == depth)
+    sut.release()
+    for waiter in waiters:
+      waiter.join(2.0)
+
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+    assert sut.stats()['depth'] == 0
+
+  def test_stats_report_depth_and_waits(self):
+    sut = CommandQueue()
+
+    with sut:
+      pass
+    sut.acquire(Priority.BACKGROUND)
+    sut.yield_to(Priority.BACKGROUND)
+    sut.release()
+    result = sut.stats()
+
+    assert result['depth'] == 0
+    assert result['max_depth'] == 1
+    assert result['preemptions'] == 1
+    assert result['waits']['interactive']['count'] == 1
+    assert result['waits']['background']['count'] == 1
+
+  def test_yielded_request_resumes_ahead_of_later_arrivals(self):
+    sut = CommandQueue()
+    order = []
+
+    def wait_for_turn(name: str, priority: Priority) -> None:
+      with sut.holding(priority):
+        order.append(name)
+
+    sut.acquire(Priority.BACKGROUND)
+    waiters = []
+    for (depth, (name, priority)) in enumerate(
+        (('later', Priority.BACKGROUND), ('interactive', Priority.INTERACTIVE)),
+        1
+      ):
+      waiter = threading.Thread(target = wait_for_turn, args = (name, priority))
+      waiter.start()
+      waiters.append(waiter)
+      wait_until(lambda: sut.depth == depth)
+    sut.yield_to(Priority.BACKGROUND)
+    order.append('yielded')
+    sut.release()
+    for waiter in waiters:
+      waiter.join(2.0)
+
+    assert order == ['interactive', 'yielded', 'later']
+
 class TestTcpEndpoint:
   _host = 'localhost'
 
@@ -205,6 +743,67 @@ class TestTcpEndpoint:
     assert sut.timeout_sec == TcpEndpoint.DEFAULT_TIMEOUT_SEC
 
 class TestTcpDevice:
+  def test_process_returns_batch_for_batch(self):
+    batch = InstructionBatch([Command.SWITCH_VIDEO] * 200, [i % 16 + 1 for i in range(200)], [1] * 200)
+    with Emulator() as emulator:
+      emulated = emulator.add_switch(input_count = 16)
+      sut = TcpDevice(TcpEndpoint('127.0.0.1', emulated.port, 1.0), pipelined = True)
+
+      result = sut.process(batch)
+      sut.close()
+
+    assert isinstance(result, InstructionBatch)
+    assert result == InstructionBatch(batch.commands, batch.inputs, batch.outputs, [1] * 200)
+    assert emulated.switch.routes == {1: 200 % 16}
+
+  def test_process_batch_without_pipelining_sends_one_frame_at_a_time(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_bytes = b'\x5f\x80\x81\x81'
+    sut = self.create_device()
+
+    result = sut.process(InstructionBatch([Command.QUERY_PANEL_LOCK] * 3))
+
+    assert fake_socket.send_count == 3
+    assert list(result) == [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)] * 3
+
+  def test_interactive_command_preempts_background_batch(self):
+    refresh = [Instruction(Command.DEFINE_MACHINE, 1, 1)] * 4
+    completed = []
+    with Emulator() as emulator:
+      port = emulator.add_switch(latency_sec = 0.05).port
+      sut = TcpDevice(TcpEndpoint('127.0.0.1', port, 1.0))
+      background = threading.Thread(
+        target = lambda: (sut.process(refresh), completed.append('refresh'))
+      )
+
+      background.start()
+      time.sleep(0.02)
+      sut.process(Instruction(Command.SWITCH_VIDEO, 2, 1))
+      completed.append('select')
+      background.join(2.0)
+      sut.close()
+
+    assert completed == ['select', 'refresh']
+    assert sut.queue_stats['preemptions'] == 1
+
+  def test_preempted_batch_counts_one_connection_reuse(self):
+    refresh = [Instruction(Command.DEFINE_MACHINE, 1, 1)] * 4
+    with Emulator() as emulator:
+      port = emulator.add_switch(latency_sec = 0.05).port
+      sut = TcpDevice(TcpEndpoint('127.0.0.1', port, 1.0))
+      background = threading.Thread(target = lambda: sut.process(refresh))
+
+      background.start()
+      time.sleep(0.02)
+      sut.process(Instruction(Command.SWITCH_VIDEO, 2, 1))
+      background.join(2.0)
+      sut.close()
+
+    assert sut.queue_stats['preemptions'] == 1
+    assert sut.connections_opened == 1
+    assert sut.connections_reused == 1
+    assert sut.queue_stats['waits']['background']['count'] == 1
+
   def test_creates_connection_using_specified_endpoint_details(self, monkeypatch: pytest.MonkeyPatch):
     expected_host = '10.0.0.1'
     expected_port = 1337
@@ -288,20 +887,321 @@ class TestTcpDevice:
 
     assert results == expected_results
 
-  def test_process_closes_connection_when_complete(self, monkeypatch: pytest.MonkeyPatch):
+  def test_process_closes_connection_when_keep_alive_disabled(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = TcpDevice(TcpEndpoint('localhost'), keep_alive = False)
+
+    sut.process(instruction)
+
+    assert fake_socket.was_closed
+
+  def test_process_keeps_connection_open_when_complete(self, monkeypatch: pytest.MonkeyPatch):
     instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
     fake_socket = self.stub_socket(monkeypatch)
     sut = self.create_device()
 
     sut.process(instruction)
 
+    assert not fake_socket.was_closed
+
+  def test_process_reuses_open_connection(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    sockets = self.stub_sockets(monkeypatch)
+    sut = self.create_device()
+
+    sut.process(instruction)
+    first_reused = sut.last_connection_reused
+    sut.process(instruction)
+
+    assert len(sockets) == 1
+    assert not first_reused
+    assert sut.last_connection_reused
+    assert sut.connections_opened == 1
+    assert sut.connections_reused == 1
+
+  def test_process_reconnects_when_connection_idle_too_long(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    sockets = self.stub_sockets(monkeypatch)
+    now = self.stub_clock(monkeypatch)
+    sut = TcpDevice(TcpEndpoint('localhost'), idle_timeout_sec = 5.0)
+
+    sut.process(instruction)
+    now[0] += 10.0
+    sut.process(instruction)
+
+    assert len(sockets) == 2
+    assert sockets[0].was_closed
+    assert not sut.last_connection_reused
+
+  def test_process_reconnects_when_connection_exceeds_max_lifetime(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    sockets = self.stub_sockets(monkeypatch)
+    now = self.stub_clock(monkeypatch)
+    sut = TcpDevice(
+      TcpEndpoint('localhost'),
+      idle_timeout_sec = None,
+      max_lifetime_sec = 60.0
+    )
+
+    for _ in range(4):
+      sut.process(instruction)
+      now[0] += 25.0
+
+    assert len(sockets) == 2
+    assert sockets[0].was_closed
+
+  def test_process_reconnects_transparently_when_connection_dropped(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    sockets = self.stub_sockets(monkeypatch)
+    sut = self.create_device()
+    sut.process(instruction)
+    sockets[0].should_reset = True
+
+    results = sut.process(instruction)
+
+    assert len(sockets) == 2
+    assert sockets[0].was_closed
+    assert sockets[1].send_count == 1
+    assert len(results) == 1
+
+  def test_pipelined_process_sends_batch_in_single_write(self, monkeypatch: pytest.MonkeyPatch):
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+    expected_bytes = b''.join(Codec.encode(i) for i in instructions)
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_chunks = [b'\x7e\x81\x88\x81\x5f\x80\x81\x81']
+    sut = TcpDevice(TcpEndpoint('localhost'), pipelined = True)
+
+    sut.process(instructions)
+
+    assert fake_socket.send_count == 1
+    assert fake_socket.request_bytes[0] == expected_bytes
+
+  def test_pipelined_process_matches_replies_received_out_of_order(self, monkeypatch: pytest.MonkeyPatch):
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 2, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+    expected_results = [
+      Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 2, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 1, 8, 1),
+    ]
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_chunks = [
+      b'\x5f\x80\x81\x81\x7e\x82\x81\x81',
+      b'\x7e\x81\x88\x81',
+      b'\x7e\x81\x88\x81', # Never read; batch completes before this
+    ]
+    sut = TcpDevice(TcpEndpoint('localhost'), pipelined = True)
+
+    results = sut.process(instructions)
+
+    assert results == expected_results
+    assert fake_socket.recv_count == 2
+
+  def test_pipelined_process_times_out_once_for_failed_batch(
+      self,
+      caplog: pytest.LogCaptureFixture,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    caplog.set_level(logging.INFO)
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 2, 1),
+      Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.should_timeout = True
+    sut = self.create_device()
+
+    results = sut.process(instructions, pipelined = True)
+
+    assert 'Timed out waiting for 4 of 4 responses' in caplog.text
+    assert fake_socket.recv_count == 1
+    assert len(results) == 0
+
+  def test_process_reassembles_response_split_across_reads(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_PANEL_LOCK)
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_chunks = [b'\x5f\x80', b'\x81\x81']
+    sut = self.create_device()
+
+    results = sut.process(instruction)
+
+    assert results == [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+
+  def test_listener_delivers_unsolicited_instructions(self, monkeypatch: pytest.MonkeyPatch):
+    (device_end, client_end) = socket.socketpair()
+    monkeypatch.setattr(socket, 'create_connection', lambda *_: client_end)
+    received = []
+    delivered = threading.Event()
+    def on_instructions(instructions):
+      received.extend(instructions)
+      delivered.set()
+    sut = self.create_device()
+    sut.start_listening(on_instructions)
+    try:
+      device_end.sendall(b'\x41\x83\x81\x81')
+
+      delivered.wait(2.0)
+    finally:
+      sut.close()
+      device_end.close()
+
+    assert received == [Instruction(Command.SWITCH_VIDEO, 3, 1, 1)]
+    assert not sut.is_listening
+
+  def test_listener_takes_device_at_background_priority(self, monkeypatch: pytest.MonkeyPatch):
+    (device_end, client_end) = socket.socketpair()
+    monkeypatch.setattr(socket, 'create_connection', lambda *_: client_end)
+    delivered = threading.Event()
+    sut = self.create_device()
+    sut.start_listening(lambda _: delivered.set())
+    try:
+      device_end.sendall(b'\x41\x83\x81\x81')
+
+      delivered.wait(2.0)
+    finally:
+      sut.stop_listening()
+      device_end.close()
+    result = sut.queue_stats['waits']
+    sut.close()
+
+    assert delivered.is_set()
+    assert result['interactive']['count'] == 0
+    assert result['background']['count'] >= 2
+
+  def test_start_listening_raises_when_already_listening(self, monkeypatch: pytest.MonkeyPatch):
+    (device_end, client_end) = socket.socketpair()
+    monkeypatch.setattr(socket, 'create_connection', lambda *_: client_end)
+    sut = self.create_device()
+    sut.start_listening(lambda _: None)
+    try:
+      with pytest.raises(RuntimeError):
+        sut.start_listening(lambda _: None)
+    finally:
+      sut.close()
+      device_end.close()
+
+  def test_process_waits_for_matching_reply_past_unsolicited_frames(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_PANEL_LOCK)
+    expected = [
+      Instruction(Command.SWITCH_VIDEO, 3, 1, 1),
+      Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1),
+    ]
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_chunks = [
+      b'\x41\x83\x81\x81', # Unsolicited front panel change
+      b'\x5f\x80\x81\x81',
+      b'\x41\x84\x81\x81', # Never read; reply already arrived
+    ]
+    sut = self.create_device()
+
+    results = sut.process(instruction)
+
+    assert results == expected
+    assert fake_socket.recv_count == 2
+
+  def test_process_completes_each_instruction_on_its_own_reply(self, monkeypatch: pytest.MonkeyPatch):
+    instructions = [
+      Instruction(Command.QUERY_PANEL_LOCK),
+      Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1),
+    ]
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_chunks = [
+      b'\x5f\x80\x81\x81',
+      b'\x45\x80\x83\x81',
+    ]
+    sut = self.create_device()
+
+    results = sut.process(instructions)
+
+    assert [result.id for result in results] == [i.id for i in instructions]
+    assert fake_socket.recv_count == 2
+
+  def test_close_closes_open_connection(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device()
+    sut.process(instruction)
+
+    sut.close()
+
     assert fake_socket.was_closed
 
+  def test_process_fails_fast_once_circuit_opens(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    attempts = self.stub_unreachable(monkeypatch)
+    sut = TcpDevice(TcpEndpoint('localhost'), circuit_breaker = CircuitBreaker(failure_threshold = 2))
+
+    results = [sut.process(instruction) for _ in range(5)]
+
+    assert attempts == [('localhost', 5000)] * 2
+    assert results == [[]] * 5
+    assert not sut.is_available
+    assert sut.circuit_breaker.state == CircuitState.OPEN
+
+  def test_process_probes_device_once_backoff_elapses(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS)
+    self.stub_unreachable(monkeypatch)
+    now = [1000.0]
+    breaker = CircuitBreaker(failure_threshold = 1, base_delay_sec = 2.0, clock = lambda: now[0])
+    sut = TcpDevice(TcpEndpoint('localhost'), circuit_breaker = breaker)
+    sut.process(instruction)
+    fake_socket = self.stub_socket(monkeypatch)
+
+    rejected = sut.process(instruction)
+    now[0] += breaker.retry_in_sec
+    results = sut.process(instruction)
+
+    assert rejected == []
+    assert len(results) == 1
+    assert fake_socket.send_count == 1
+    assert sut.is_available
+    assert breaker.state == CircuitState.CLOSED
+
+  def test_process_counts_unanswered_requests_as_failures(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.should_timeout = True
+    sut = TcpDevice(TcpEndpoint('localhost'), circuit_breaker = CircuitBreaker(failure_threshold = 1))
+
+    sut.process(Instruction(Command.QUERY_OUTPUT_STATUS))
+
+    assert not sut.is_available
+
+  def stub_unreachable(self, patch: pytest.MonkeyPatch) -> list[tuple[str, int]]:
+    attempts = []
+    def create_connection(host_port_tuple, timeout_sec):
+      attempts.append(host_port_tuple)
+      raise ConnectionRefusedError('Connection refused')
+    patch.setattr(socket, 'create_connection', create_connection)
+    return attempts
+
   def stub_socket(self, patch: pytest.MonkeyPatch) -> FakeSocket:
     fake_socket = FakeSocket()
     patch.setattr(socket, 'create_connection', lambda *_: fake_socket)
     return fake_socket
 
+  def stub_sockets(self, patch: pytest.MonkeyPatch) -> list[FakeSocket]:
+    sockets = []
+    def create_connection(*_):
+      fake_socket = FakeSocket()
+      sockets.append(fake_socket)
+      return fake_socket
+    patch.setattr(socket, 'create_connection', create_connection)
+    return sockets
+
+  def stub_clock(self, patch: pytest.MonkeyPatch) -> list[float]:
+    now = [1000.0]
+    patch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
   def create_device(self, endpoint: TcpEndpoint = TcpEndpoint('localhost')):
     return TcpDevice(endpoint)
 
@@ -324,3 +1224,9 @@ def gen_invalid_io_value(rand = random) -> int:
 def gen_port(rand = random) -> int:
   return rand.randrange(49152, 65535)
 
+def wait_until(predicate, timeout_sec: float = 2.0) -> None:
+  deadline = time.monotonic() + timeout_sec
+  while not predicate():
+    if time.monotonic() >= deadline:
+      raise TimeoutError('Condition not met')
+    time.sleep(0.001)
@@ -0,0 +1,176 @@
+import pytest
+
+from kesslerav.protocol2k.io import Command, Instruction
+from kesslerav.protocol2k.matrix_switch import MatrixSwitch
+
+from fakes import FakeDevice
+
+class TestMatrixSwitch:
+  def test_initializes_routing_table_from_device(self):
+    (sut, _) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+
+    assert sut.input_count == 8
+    assert sut.output_count == 4
+    assert sut.routes == {1: 3, 2: 1, 3: 4, 4: 1}
+
+  def test_update_refreshes_all_outputs_in_one_pipelined_batch(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    fake_device.processed_batches.clear()
+
+    sut.update()
+
+    assert len(fake_device.processed_batches) == 1
+    queried_outputs = [
+      instruction.output_value
+      for instruction in fake_device.processed_batches[0]
+      if instruction.id == Command.QUERY_OUTPUT_STATUS
+    ]
+    assert queried_outputs == [1, 2, 3, 4]
+
+  def test_update_reloads_changed_routes(self):
+    routes = [3, 1, 4, 1]
+    (sut, _) = self.create_matrix_switch(routes = routes)
+    routes[2] = 7
+
+    sut.update()
+
+    assert sut.source_for(3) == 7
+
+  def test_route_sends_switch_video_instruction(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    fake_device.clear_processed_instructions()
+
+    sut.route(2, 6)
+
+    assert fake_device.processed_instructions == [Instruction(Command.SWITCH_VIDEO, 6, 2, 1)]
+    assert sut.source_for(2) == 6
+
+  def test_route_many_sends_only_changed_routes_in_single_batch(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    fake_device.processed_batches.clear()
+
+    sut.route_many({1: 3, 2: 5, 3: 4, 4: 8})
+
+    assert fake_device.processed_batches == [[
+      Instruction(Command.SWITCH_VIDEO, 5, 2, 1),
+      Instruction(Command.SWITCH_VIDEO, 8, 4, 1),
+    ]]
+    assert sut.routes == {1: 3, 2: 5, 3: 4, 4: 8}
+
+  def test_route_many_applies_only_routes_confirmed_by_device(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    # Only output 2's route is echoed back; output 4's goes unanswered
+    fake_device.respond = lambda _: [Instruction(Command.SWITCH_VIDEO, 5, 2, 1)]
+
+    sut.route_many({2: 5, 4: 8})
+
+    assert sut.routes == {1: 3, 2: 5, 3: 4, 4: 1}
+
+  def test_route_many_skips_device_when_nothing_changed(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    fake_device.processed_batches.clear()
+
+    sut.route_many({1: 3, 4: 1})
+
+    assert fake_device.processed_batches == []
+
+  def test_route_raises_exception_for_invalid_output(self):
+    (sut, _) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+
+    with pytest.raises(ValueError):
+      sut.route(5, 1)
+
+  def test_route_raises_exception_for_invalid_input(self):
+    (sut, _) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+
+    with pytest.raises(ValueError):
+      sut.route(1, 9)
+
+  def test_route_many_changes_nothing_when_any_route_is_invalid(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    fake_device.processed_batches.clear()
+
+    with pytest.raises(ValueError):
+      sut.route_many({1: 2, 9: 1})
+
+    assert sut.routes == {1: 3, 2: 1, 3: 4, 4: 1}
+    assert fake_device.processed_batches == []
+
+  def test_update_keeps_routes_when_status_reply_is_missing(self):
+    routes = [3, 1, 4, 1]
+    (sut, fake_device) = self.create_matrix_switch(routes = routes)
+    routes[:] = [5, 6, 7, 8]
+    respond = fake_device.respond
+    def respond_with_error(instructions):
+      responses = respond(instructions)
+      # Output 2 answers with an error instead of its status
+      index = [response.id for response in responses].index(Command.QUERY_OUTPUT_STATUS) + 1
+      responses[index] = Instruction(Command.ERROR, 0, 0, 1)
+      return responses
+    fake_device.respond = respond_with_error
+
+    sut.update()
+
+    assert sut.routes == {1: 3, 2: 1, 3: 4, 4: 1}
+
+  def test_applies_route_to_all_outputs_when_output_0_reported(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1, 4, 1])
+    fake_device.respond = lambda _: [Instruction(Command.SWITCH_VIDEO, 2, 0, 1)]
+
+    sut.lock()
+
+    assert sut.routes == {1: 2, 2: 2, 3: 2, 4: 2}
+
+  def test_lock_and_unlock_send_panel_lock_instructions(self):
+    (sut, fake_device) = self.create_matrix_switch(routes = [3, 1])
+    fake_device.clear_processed_instructions()
+
+    sut.lock()
+    was_locked = sut.is_locked
+    sut.unlock()
+
+    assert was_locked
+    assert not sut.is_locked
+    assert fake_device.processed_instructions == [
+      Instruction(Command.PANEL_LOCK, 1, 0, 1),
+      Instruction(Command.PANEL_LOCK, 0, 0, 1),
+    ]
+
+  def create_matrix_switch(
+      self,
+      routes: list[int],
+      input_count: int = 8
+    ) -> tuple[MatrixSwitch, FakeDevice]:
+    fake_device = FakeDevice()
+    fake_device.respond = lambda instructions: respond_as_matrix(
+      instructions,
+      routes,
+      input_count
+    )
+    return (MatrixSwitch(fake_device, 1), fake_device)
+
+#
+# Helpers
+#
+def respond_as_matrix(
+    instructions: list[Instruction],
+    routes: list[int],
+    input_count: int
+  ) -> list[Instruction]:
+  responses = []
+  for instruction in instructions:
+    match instruction.id:
+      case Command.DEFINE_MACHINE:
+        count = input_count if instruction.input_value == 1 else len(routes)
+        responses.append(Instruction(Command.DEFINE_MACHINE, instruction.input_value, count, 1))
+      case Command.QUERY_OUTPUT_STATUS:
+        routed = routes[instruction.output_value - 1]
+        responses.append(Instruction(Command.QUERY_OUTPUT_STATUS, 0, routed, 1))
+      case Command.QUERY_PANEL_LOCK:
+        responses.append(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+      case Command.SWITCH_VIDEO:
+        routes[instruction.output_value - 1] = instruction.input_value
+        responses.append(instruction)
+      case _:
+        responses.append(instruction)
+  return responses
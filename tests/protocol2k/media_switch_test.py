@@ -1,9 +1,16 @@
+import asyncio
+import pytest
+import threading
+import time
+
 from typing import Optional
 
+from kesslerav.constants import \
+  DISCOVERY_BACKGROUND, DISCOVERY_LAZY
 from kesslerav.protocol2k.io import Command, Instruction
-from kesslerav.protocol2k.media_switch import MediaSwitch
+from kesslerav.protocol2k.media_switch import AsyncMediaSwitch, MediaSwitch
 
-from fakes import FakeDevice
+from fakes import BlockingFakeDevice, FakeAsyncDevice, FakeDevice
 
 class TestMediaSwitch:
   def test_sets_machine_id_when_specified(self):
@@ -251,6 +258,310 @@ class TestMediaSwitch:
     assert sut.is_locked
     assert fake_device.processed_instructions == expected
   
+  def test_start_listening_applies_unsolicited_instructions(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 8, 1),
+      Instruction(Command.QUERY_OUTPUT_STATUS, 0, 2, 1),
+    ]
+    (sut, _) = self.create_media_switch(device = fake_device)
+
+    sut.start_listening()
+    fake_device.on_instructions([
+      Instruction(Command.SWITCH_VIDEO, 5, 0, 1),
+      Instruction(Command.PANEL_LOCK, 1, 0, 1),
+    ])
+
+    assert sut.selected_source == 5
+    assert sut.is_locked
+
+  def test_notifies_listeners_when_state_changes(self):
+    fake_device = FakeDevice()
+    (sut, _) = self.create_media_switch(device = fake_device)
+    notifications = []
+    sut.add_listener(notifications.append)
+    sut.start_listening()
+
+    fake_device.on_instructions([Instruction(Command.SWITCH_VIDEO, 5, 0, 1)])
+    fake_device.on_instructions([Instruction(Command.SWITCH_VIDEO, 5, 0, 1)])
+    sut.lock()
+
+    assert notifications == [sut, sut]
+
+  def test_does_not_notify_removed_listeners(self):
+    fake_device = FakeDevice()
+    (sut, _) = self.create_media_switch(device = fake_device)
+    notifications = []
+    sut.add_listener(notifications.append)
+    sut.remove_listener(notifications.append)
+
+    sut.lock()
+
+    assert notifications == []
+
+  def test_close_stops_listening_and_closes_device(self):
+    fake_device = FakeDevice()
+    (sut, _) = self.create_media_switch(device = fake_device)
+    sut.start_listening()
+
+    sut.close()
+
+    assert fake_device.on_instructions is None
+    assert fake_device.was_closed
+
+  def test_update_shares_in_flight_refresh_between_callers(self, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    fake_device = BlockingFakeDevice()
+    fake_device.response_instructions = [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+    sut = MediaSwitch(fake_device, 1, max_age_sec = 10.0)
+    fake_device.process_count = 0
+    now[0] += 20.0
+    fake_device.block()
+    callers = [threading.Thread(target = sut.update) for _ in range(5)]
+
+    for caller in callers:
+      caller.start()
+    fake_device.wait_until_processing()
+    fake_device.unblock()
+    for caller in callers:
+      caller.join()
+
+    assert fake_device.process_count == 1
+
+  def test_update_skips_refresh_when_state_newer_than_max_age(self, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+    sut = MediaSwitch(fake_device, 1, max_age_sec = 10.0)
+
+    now[0] += 5.0
+    sut.update()
+    count_while_fresh = fake_device.process_count
+    now[0] += 5.0
+    sut.update()
+
+    assert count_while_fresh == 1
+    assert fake_device.process_count == 2
+
+  def test_update_refreshes_fresh_state_when_forced(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1)]
+    sut = MediaSwitch(fake_device, 1, max_age_sec = 60.0)
+
+    sut.update(force = True)
+
+    assert fake_device.process_count == 2
+
+  def test_stale_reads_return_immediately_and_refresh_in_background(self, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    fake_device = BlockingFakeDevice()
+    fake_device.response_instructions = [Instruction(Command.QUERY_OUTPUT_STATUS, 0, 2, 1)]
+    sut = MediaSwitch(fake_device, 1, max_age_sec = 10.0, stale_while_revalidate = True)
+    fake_device.response_instructions = [Instruction(Command.QUERY_OUTPUT_STATUS, 0, 4, 1)]
+    fake_device.block()
+    now[0] += 20.0
+
+    stale_source = sut.selected_source
+    fake_device.wait_until_processing()
+    fake_device.unblock()
+    sut.update()
+
+    assert stale_source == 2
+    assert sut.selected_source == 4
+    assert fake_device.process_count == 2
+
+  def test_raises_exception_for_unknown_discovery_mode(self):
+    with pytest.raises(ValueError):
+      MediaSwitch(FakeDevice(), 1, discovery = 'sometime')
+
+  def test_raises_exception_for_stale_while_revalidate_without_max_age(self):
+    with pytest.raises(ValueError):
+      MediaSwitch(FakeDevice(), 1, stale_while_revalidate = True)
+
+  def test_lazy_discovery_does_not_communicate_with_device_when_constructed(self):
+    fake_device = FakeDevice()
+
+    sut = MediaSwitch(fake_device, 1, discovery = DISCOVERY_LAZY)
+
+    assert fake_device.process_count == 0
+    assert not sut.is_ready
+
+  def test_lazy_discovery_loads_state_on_first_read(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 8, 1),
+      Instruction(Command.QUERY_OUTPUT_STATUS, 0, 3, 1),
+    ]
+    sut = MediaSwitch(fake_device, 1, discovery = DISCOVERY_LAZY)
+
+    result = sut.selected_source
+    _ = sut.input_count
+
+    assert result == 3
+    assert sut.is_ready
+    assert fake_device.process_count == 1
+
+  def test_lazy_discovery_lets_listeners_read_switch(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [Instruction(Command.QUERY_OUTPUT_STATUS, 0, 3, 1)]
+    sut = MediaSwitch(fake_device, 1, discovery = DISCOVERY_LAZY)
+    notified_sources = []
+    sut.add_listener(lambda switch: notified_sources.append(switch.selected_source))
+    results = []
+
+    reader = threading.Thread(target = lambda: results.append(sut.selected_source), daemon = True)
+    reader.start()
+    reader.join(2.0)
+
+    assert not reader.is_alive()
+    assert results == [3]
+    assert notified_sources == [3]
+
+  def test_lazy_discovery_loads_input_count_before_selecting_source(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [Instruction(Command.DEFINE_MACHINE, 1, 8, 1)]
+    sut = MediaSwitch(fake_device, 1, discovery = DISCOVERY_LAZY)
+
+    sut.select_source(5)
+
+    assert fake_device.processed_instructions[-1] == Instruction(Command.SWITCH_VIDEO, 5, 0, 1)
+
+  def test_background_discovery_returns_before_device_responds(self):
+    fake_device = BlockingFakeDevice()
+    fake_device.response_instructions = [Instruction(Command.QUERY_OUTPUT_STATUS, 0, 3, 1)]
+    fake_device.block()
+
+    sut = MediaSwitch(fake_device, 1, discovery = DISCOVERY_BACKGROUND)
+    was_ready = sut.is_ready
+    unknown_source = sut.selected_source
+    fake_device.unblock()
+    became_ready = sut.wait_ready(2.0)
+
+    assert not was_ready
+    assert unknown_source == 0
+    assert became_ready
+    assert sut.selected_source == 3
+
+  def test_wait_ready_starts_lazy_discovery(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, 1, discovery = DISCOVERY_LAZY)
+
+    result = sut.wait_ready(2.0)
+
+    assert result
+    assert fake_device.process_count == 1
+
+  def test_coalesces_commands_issued_while_one_is_in_flight(self):
+    (sut, fake_device) = self.create_coalescing_media_switch()
+    fake_device.block()
+    callers = []
+
+    for input in (2, 3, 4, 5):
+      caller = threading.Thread(target = sut.select_source, args = (input,))
+      caller.start()
+      callers.append(caller)
+      if input == 2:
+        fake_device.wait_until_processing()
+      else:
+        wait_for_pending_write(sut, Instruction(Command.SWITCH_VIDEO, input, None, 1))
+    fake_device.unblock()
+    for caller in callers:
+      caller.join(2.0)
+
+    assert not any(caller.is_alive() for caller in callers)
+    assert fake_device.processed_batches == [
+      [Instruction(Command.SWITCH_VIDEO, 2, None, 1)],
+      [Instruction(Command.SWITCH_VIDEO, 5, None, 1)],
+    ]
+    assert sut.selected_source == 5
+
+  def test_coalesces_commands_within_window(self):
+    (sut, fake_device) = self.create_coalescing_media_switch(window_sec = 0.2)
+    callers = [
+      threading.Thread(target = sut.select_source, args = (input,))
+      for input in (2, 3)
+    ]
+    callers.append(threading.Thread(target = sut.lock))
+
+    for caller in callers:
+      caller.start()
+    for caller in callers:
+      caller.join(2.0)
+
+    assert fake_device.process_count == 1
+    assert Instruction(Command.PANEL_LOCK, 1, None, 1) in fake_device.processed_instructions
+    assert len(fake_device.processed_instructions) == 2
+
+  def test_coalescing_sends_lock_and_unlock_in_order(self):
+    (sut, fake_device) = self.create_coalescing_media_switch()
+    fake_device.block()
+    callers = [
+      threading.Thread(target = sut.select_source, args = (2,)),
+      threading.Thread(target = sut.lock),
+      threading.Thread(target = sut.unlock),
+      threading.Thread(target = sut.lock),
+    ]
+
+    callers[0].start()
+    fake_device.wait_until_processing()
+    for (caller, instruction) in zip(callers[1:], (
+        Instruction(Command.PANEL_LOCK, 1, None, 1),
+        Instruction(Command.PANEL_LOCK, 0, None, 1),
+        Instruction(Command.PANEL_LOCK, 1, None, 1),
+      )):
+      caller.start()
+      wait_for_pending_write(sut, instruction)
+    fake_device.unblock()
+    for caller in callers:
+      caller.join(2.0)
+
+    assert not any(caller.is_alive() for caller in callers)
+    assert fake_device.processed_batches[1] == [
+      Instruction(Command.PANEL_LOCK, 0, None, 1),
+      Instruction(Command.PANEL_LOCK, 1, None, 1),
+    ]
+    assert sut.is_locked
+
+  def test_coalescing_lets_listeners_issue_commands(self):
+    (sut, fake_device) = self.create_coalescing_media_switch()
+    sut.add_listener(lambda switch: switch.lock())
+
+    caller = threading.Thread(target = sut.select_source, args = (3,), daemon = True)
+    caller.start()
+    caller.join(2.0)
+    wait_for_locked(sut)
+
+    assert not caller.is_alive()
+    assert sut.selected_source == 3
+    assert Instruction(Command.PANEL_LOCK, 1, None, 1) in fake_device.processed_instructions
+
+  def test_sends_every_command_when_not_coalescing(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [Instruction(Command.DEFINE_MACHINE, 1, 8, 1)]
+    sut = MediaSwitch(fake_device, 1)
+    fake_device.process_count = 0
+
+    sut.select_source(2)
+    sut.select_source(3)
+
+    assert fake_device.process_count == 2
+
+  def create_coalescing_media_switch(
+      self,
+      window_sec: float = 0.0
+    ) -> tuple[MediaSwitch, BlockingFakeDevice]:
+    fake_device = BlockingFakeDevice()
+    fake_device.response_instructions = [Instruction(Command.DEFINE_MACHINE, 1, 8, 1)]
+    sut = MediaSwitch(fake_device, 1, coalesce_window_sec = window_sec)
+    fake_device.response_instructions = []
+    fake_device.processed_batches = []
+    fake_device.clear_processed_instructions()
+    fake_device.process_count = 0
+    return (sut, fake_device)
+
   def create_media_switch(
       self,
       device = FakeDevice(),
@@ -258,3 +569,84 @@ class TestMediaSwitch:
     ) -> tuple[MediaSwitch, FakeDevice]:
     return (MediaSwitch(device, machine_id), device)
 
+def wait_for_locked(sut: MediaSwitch, timeout_sec: float = 2.0) -> None:
+  deadline = time.monotonic() + timeout_sec
+  while time.monotonic() < deadline:
+    if sut.is_locked:
+      return
+    time.sleep(0.001)
+  raise TimeoutError('Media switch was not locked')
+
+def wait_for_pending_write(
+    sut: MediaSwitch,
+    instruction: Instruction,
+    timeout_sec: float = 2.0
+  ) -> None:
+  deadline = time.monotonic() + timeout_sec
+  while time.monotonic() < deadline:
+    # Most recently queued, so that it is sent after the commands before it
+    pending = list(sut._pending_writes.values())
+    if len(pending) > 0 and pending[-1][0] == instruction:
+      return
+    time.sleep(0.001)
+  raise TimeoutError(f'{instruction} was not queued')
+
+class TestAsyncMediaSwitch:
+  def test_does_not_communicate_with_device_when_constructed(self):
+    fake_device = FakeAsyncDevice()
+
+    AsyncMediaSwitch(fake_device, 1)
+
+    assert fake_device.process_count == 0
+
+  def test_update_loads_state_from_device(self):
+    input_count = 8
+    output_count = 2
+    selected_source = 3
+    fake_device = FakeAsyncDevice()
+    fake_device.response_instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, input_count, 1),
+      Instruction(Command.DEFINE_MACHINE, 2, output_count, 1),
+      Instruction(Command.QUERY_OUTPUT_STATUS, 0, selected_source, 1),
+      Instruction(Command.QUERY_PANEL_LOCK, 0, 1, 1),
+    ]
+    sut = AsyncMediaSwitch(fake_device, 1)
+
+    asyncio.run(sut.update())
+
+    assert sut.input_count == input_count
+    assert sut.output_count == output_count
+    assert sut.selected_source == selected_source
+    assert sut.is_locked
+
+  def test_selected_source_sends_switch_video_instruction(self):
+    selected_source = 3
+    expected = [Instruction(Command.SWITCH_VIDEO, selected_source, 0, 1)]
+    fake_device = FakeAsyncDevice()
+    fake_device.response_instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 8, 1),
+    ]
+    sut = AsyncMediaSwitch(fake_device, 1)
+    asyncio.run(sut.update())
+    fake_device.clear_instructions()
+
+    asyncio.run(sut.select_source(selected_source))
+
+    assert sut.selected_source == selected_source
+    assert fake_device.processed_instructions == expected
+
+  def test_lock_and_unlock_send_panel_lock_instructions(self):
+    expected = [
+      Instruction(Command.PANEL_LOCK, 1, 0, 1),
+      Instruction(Command.PANEL_LOCK, 0, 0, 1),
+    ]
+    fake_device = FakeAsyncDevice()
+    sut = AsyncMediaSwitch(fake_device, 1)
+
+    asyncio.run(sut.lock())
+    was_locked = sut.is_locked
+    asyncio.run(sut.unlock())
+
+    assert was_locked
+    assert not sut.is_locked
+    assert fake_device.processed_instructions == expected
@@ -0,0 +1,147 @@
+import pytest
+
+from kesslerav.protocol2k.emulator import Emulator
+from kesslerav.protocol2k.io import Command, Instruction, TcpDevice, TcpEndpoint
+from kesslerav.protocol2k.media_switch import MediaSwitch
+from kesslerav.protocol2k.metrics import Histogram, MetricsRegistry
+
+from fakes import FakeDevice
+
+class TestHistogram:
+  def test_buckets_are_cumulative(self):
+    sut = Histogram((0.1, 1.0))
+
+    sut.observe(0.05)
+    sut.observe(0.5)
+    sut.observe(2.0)
+    result = sut.snapshot()
+
+    assert result['buckets'] == {0.1: 1, 1.0: 2, float('inf'): 3}
+    assert result['count'] == 3
+    assert result['sum'] == pytest.approx(2.55)
+
+  def test_value_on_bound_counts_in_that_bucket(self):
+    sut = Histogram((0.1, 1.0))
+
+    sut.observe(0.1)
+
+    assert sut.snapshot()['buckets'][0.1] == 1
+
+class TestMetricsRegistry:
+  def test_is_disabled_by_default(self):
+    sut = MetricsRegistry()
+
+    assert not sut.enabled
+
+  def test_snapshot_groups_metrics_by_device(self):
+    sut = MetricsRegistry(enabled = True)
+
+    sut.device('a').increment('timeouts', 2)
+    sut.device('b').observe('command_latency_seconds', 0.01, 'SWITCH_VIDEO')
+    result = sut.snapshot()
+
+    assert result['a']['counters'] == {'timeouts': 2}
+    assert result['b']['histograms']['command_latency_seconds']['SWITCH_VIDEO']['count'] == 1
+
+  def test_prometheus_export(self):
+    sut = MetricsRegistry(enabled = True, bounds = (0.1,))
+    sut.device('10.0.0.1:5000').increment('timeouts')
+    sut.device('10.0.0.1:5000').observe('command_latency_seconds', 0.05, 'QUERY_PANEL_LOCK')
+
+    result = sut.to_prometheus()
+
+    assert result.splitlines() == [
+      '# HELP kesslerav_command_latency_seconds Time from sending a command to receiving its reply',
+      '# TYPE kesslerav_command_latency_seconds histogram',
+      'kesslerav_command_latency_seconds_bucket{device="10.0.0.1:5000",command="QUERY_PANEL_LOCK",le="0.1"} 1',
+      'kesslerav_command_latency_seconds_bucket{device="10.0.0.1:5000",command="QUERY_PANEL_LOCK",le="+Inf"} 1',
+      'kesslerav_command_latency_seconds_sum{device="10.0.0.1:5000",command="QUERY_PANEL_LOCK"} 0.05',
+      'kesslerav_command_latency_seconds_count{device="10.0.0.1:5000",command="QUERY_PANEL_LOCK"} 1',
+      '# HELP kesslerav_timeouts_total Commands that received no reply before timing out',
+      '# TYPE kesslerav_timeouts_total counter',
+      'kesslerav_timeouts_total{device="10.0.0.1:5000"} 1',
+    ]
+
+  def test_prometheus_export_escapes_labels(self):
+    sut = MetricsRegistry(enabled = True)
+    sut.device('a"b').increment('errors')
+
+    result = sut.to_prometheus()
+
+    assert 'kesslerav_errors_total{device="a\\"b"} 1' in result
+
+  def test_prometheus_export_is_empty_without_metrics(self):
+    sut = MetricsRegistry(enabled = True)
+
+    assert sut.to_prometheus() == ''
+
+class TestTcpDeviceMetrics:
+  def test_records_nothing_while_disabled(self):
+    registry = MetricsRegistry()
+    with Emulator() as emulator:
+      port = emulator.add_switch().port
+      sut = TcpDevice(TcpEndpoint('127.0.0.1', port), metrics = registry)
+
+      sut.process(Instruction(Command.QUERY_PANEL_LOCK))
+      sut.close()
+
+    assert registry.snapshot() == {}
+
+  def test_records_latency_connections_and_bytes(self):
+    registry = MetricsRegistry(enabled = True)
+    with Emulator() as emulator:
+      port = emulator.add_switch().port
+      sut = TcpDevice(TcpEndpoint('127.0.0.1', port), metrics = registry, pipelined = True)
+
+      sut.process([Instruction(Command.QUERY_PANEL_LOCK), Instruction(Command.DEFINE_MACHINE, 1, 1)])
+      sut.close()
+
+    result = registry.snapshot()[sut.label]
+    assert result['counters'] == {'bytes_received': 8, 'bytes_sent': 8, 'connections': 1}
+    latencies = result['histograms']['command_latency_seconds']
+    assert latencies['QUERY_PANEL_LOCK']['count'] == 1
+    assert latencies['DEFINE_MACHINE']['count'] == 1
+    assert result['histograms']['connect_seconds'][None]['count'] == 1
+
+  def test_counts_timeouts(self):
+    registry = MetricsRegistry(enabled = True)
+    with Emulator() as emulator:
+      port = emulator.add_switch(machine_id = 1).port
+      sut = TcpDevice(TcpEndpoint('127.0.0.1', port, 0.05), metrics = registry)
+
+      # Addressed to a machine that is not there, so never answered
+      sut.process(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 5))
+      sut.close()
+
+    assert registry.device(sut.label).counter('timeouts') == 1
+
+  def test_counts_errors(self):
+    registry = MetricsRegistry(enabled = True)
+    sut = TcpDevice(TcpEndpoint('127.0.0.1', 1, 0.05), metrics = registry)
+
+    sut.process(Instruction(Command.QUERY_PANEL_LOCK))
+
+    assert registry.device(sut.label).counter('errors') == 1
+
+class TestMediaSwitchMetrics:
+  def test_records_update_latency_and_skipped_updates(self):
+    registry = MetricsRegistry(enabled = True)
+    device = FakeDevice()
+    device.respond = lambda instructions: list(instructions)
+    sut = MediaSwitch(device, 1, max_age_sec = 60.0, metrics = registry)
+
+    sut.update()
+    result = registry.device('FakeDevice')
+
+    assert result.histogram('update_seconds').count == 1
+    assert result.counter('updates_skipped') == 1
+
+  def test_uses_device_registry_by_default(self):
+    registry = MetricsRegistry(enabled = True)
+    with Emulator() as emulator:
+      port = emulator.add_switch().port
+      device = TcpDevice(TcpEndpoint('127.0.0.1', port), metrics = registry)
+
+      MediaSwitch(device).close()
+
+    assert registry.device(device.label).histogram('update_seconds').count == 1
@@ -0,0 +1,227 @@
+import socket
+import threading
+import time
+import pytest
+
+from kesslerav.protocol2k.capture import HEADER_FORMAT, Direction, WireCapture
+from kesslerav.protocol2k.io import Codec, Command, Instruction, InstructionBatch
+from kesslerav.protocol2k.media_switch import MediaSwitch
+from kesslerav.protocol2k.replay import CaptureReader, apply_to_switch, main, open_captures, play, serve
+
+from fakes import FakeDevice
+
+def write_capture(path, records: list[tuple[int, Direction, Instruction]]) -> None:
+  with WireCapture(path) as capture:
+    for (timestamp_ns, direction, instruction) in records:
+      capture.write(direction, Codec.encode(instruction), timestamp_ns)
+
+def write_garbled_capture(path) -> None:
+  with WireCapture(path) as capture:
+    capture.write(Direction.SENT, Codec.encode(QUERY), 10)
+    capture.write(Direction.RECEIVED, GARBLED_FRAME, 20)
+    capture.write(Direction.RECEIVED, Codec.encode(LOCKED), 30)
+
+QUERY = Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1, 1)
+STATUS = Instruction(Command.QUERY_OUTPUT_STATUS, 0, 6, 1)
+LOCKED = Instruction(Command.PANEL_LOCK, 1, 0, 1)
+# Values must have their high bit set, so this frame does not decode
+GARBLED_FRAME = b'\x41\x01\x81\x81'
+
+class TestCaptureReader:
+  def test_reads_records(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [(10, Direction.SENT, QUERY), (20, Direction.RECEIVED, STATUS)])
+
+    with CaptureReader(path) as sut:
+      records = list(sut.records())
+      last = sut.record(-1)
+
+      assert len(sut) == 2
+      assert (sut.start_ns, sut.end_ns) == (10, 20)
+
+    assert records == [(10, Direction.SENT, Codec.encode(QUERY)), (20, Direction.RECEIVED, Codec.encode(STATUS))]
+    assert last == records[1]
+
+  def test_batches_filter_by_direction(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [
+      (10, Direction.SENT, QUERY),
+      (20, Direction.RECEIVED, STATUS),
+      (30, Direction.RECEIVED, LOCKED),
+    ])
+
+    with CaptureReader(path) as sut:
+      result = list(sut.batches(Direction.RECEIVED, chunk_records = 2))
+
+    assert result == [InstructionBatch.from_instructions([STATUS]), InstructionBatch.from_instructions([LOCKED])]
+
+  def test_instructions_span_chunks(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    instructions = [Instruction(Command.SWITCH_VIDEO, i % 16, 1, 1) for i in range(10000)]
+    write_capture(path, [(i, Direction.SENT, instruction) for (i, instruction) in enumerate(instructions)])
+
+    with CaptureReader(path) as sut:
+      result = list(sut.instructions())
+
+    assert result == instructions
+
+  def test_summary_counts_commands_by_direction(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [
+      (10, Direction.SENT, QUERY),
+      (20, Direction.RECEIVED, STATUS),
+      (30, Direction.RECEIVED, LOCKED),
+    ])
+
+    with CaptureReader(path) as sut:
+      result = sut.summary()
+
+    assert result['records'] == 3
+    assert result['commands'] == {
+      'sent': {'QUERY_OUTPUT_STATUS': 1},
+      'received': {'QUERY_OUTPUT_STATUS': 1, 'PANEL_LOCK': 1},
+    }
+
+  def test_summary_counts_invalid_frames(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_garbled_capture(path)
+
+    with CaptureReader(path) as sut:
+      result = sut.summary()
+
+    assert result['commands']['received'] == {'PANEL_LOCK': 1}
+    assert result['invalid_frames'] == {'sent': 0, 'received': 1}
+
+  def test_batches_skip_invalid_frames(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_garbled_capture(path)
+
+    with CaptureReader(path) as sut:
+      result = list(sut.instructions(Direction.RECEIVED))
+
+    assert result == [LOCKED]
+
+  def test_ignores_partial_trailing_record(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [(10, Direction.SENT, QUERY)])
+    with open(path, 'ab') as file:
+      file.write(b'\x00' * 5)
+
+    with CaptureReader(path) as sut:
+      assert len(sut) == 1
+
+  def test_rejects_files_that_are_not_captures(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    path.write_bytes(b'\x00' * HEADER_FORMAT.size)
+
+    with pytest.raises(ValueError):
+      CaptureReader(path)
+
+  def test_open_captures_includes_rotated_files_oldest_first(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    with WireCapture(path, max_bytes = HEADER_FORMAT.size + 16) as capture:
+      for timestamp_ns in (1, 2, 3):
+        capture.write(Direction.SENT, Codec.encode(QUERY), timestamp_ns)
+
+    readers = open_captures(path)
+    starts = [reader.start_ns for reader in readers]
+    for reader in readers:
+      reader.close()
+
+    assert starts == [1, 2, 3]
+
+class TestReplay:
+  def test_apply_to_switch_replays_received_state(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [
+      (10, Direction.SENT, QUERY),
+      (20, Direction.RECEIVED, STATUS),
+      (30, Direction.RECEIVED, LOCKED),
+    ])
+    media_switch = MediaSwitch(FakeDevice(), discovery = 'lazy')
+    changes = []
+    media_switch.add_listener(changes.append)
+
+    with CaptureReader(path) as reader:
+      result = apply_to_switch(reader, media_switch)
+
+    assert result == 2
+    assert media_switch._selected_source == 6
+    assert media_switch._is_locked
+    assert len(changes) == 1
+
+  def test_apply_to_switch_skips_invalid_frames(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_garbled_capture(path)
+    media_switch = MediaSwitch(FakeDevice(), discovery = 'lazy')
+
+    with CaptureReader(path) as reader:
+      result = apply_to_switch(reader, media_switch)
+
+    assert result == 1
+    assert media_switch._is_locked
+
+  def test_dump_shows_invalid_frames(self, tmp_path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture):
+    path = tmp_path / 'capture.bin'
+    write_garbled_capture(path)
+    monkeypatch.setattr('sys.argv', ['replay', 'dump', str(path)])
+
+    main()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert lines[1].endswith(f'{GARBLED_FRAME.hex()} <invalid frame>')
+
+  def test_play_writes_received_frames(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [
+      (0, Direction.SENT, QUERY),
+      (0, Direction.RECEIVED, STATUS),
+      (1, Direction.RECEIVED, LOCKED),
+    ])
+    (reader, writer) = socket.socketpair()
+
+    with CaptureReader(path) as capture:
+      result = play(capture, writer, speed = None)
+    writer.close()
+    data = reader.recv(64)
+    reader.close()
+
+    assert result == 2
+    assert data == Codec.encode(STATUS) + Codec.encode(LOCKED)
+
+  def test_play_paces_frames_by_timestamp(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [
+      (0, Direction.RECEIVED, STATUS),
+      (200_000_000, Direction.RECEIVED, LOCKED),
+    ])
+    (reader, writer) = socket.socketpair()
+
+    start = time.monotonic()
+    with CaptureReader(path) as capture:
+      play(capture, writer, speed = 4.0)
+    elapsed = time.monotonic() - start
+    writer.close()
+    reader.close()
+
+    assert 0.05 <= elapsed < 0.2
+
+  def test_serve_plays_capture_to_client(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    write_capture(path, [(0, Direction.RECEIVED, STATUS)])
+    listening = threading.Event()
+    address = []
+    def on_listening(bound):
+      address.append(bound)
+      listening.set()
+
+    with CaptureReader(path) as capture:
+      server = threading.Thread(target = serve, args = (capture,), kwargs = {'on_listening': on_listening})
+      server.start()
+      assert listening.wait(2.0)
+      with socket.create_connection(address[0][:2]) as conn:
+        data = conn.recv(4)
+      server.join(2.0)
+
+    assert data == Codec.encode(STATUS)
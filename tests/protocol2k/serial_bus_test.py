@@ -0,0 +1,212 @@
+import os
+import select
+import threading
+import time
+import pytest
+
+from typing import Callable
+
+from kesslerav import get_media_switch
+from kesslerav.protocol2k.io import Codec, Command, FrameDecoder, Instruction
+from kesslerav.protocol2k.serial_bus import SerialBus, SerialDevice, SerialEndpoint
+
+class TestSerialEndpoint:
+  def test_rejects_unsupported_baud_rate(self):
+    with pytest.raises(ValueError):
+      SerialEndpoint('/dev/ttyUSB0', 12345)
+
+  def test_transmit_time_accounts_for_framing_bits(self):
+    sut = SerialEndpoint('/dev/ttyUSB0', 9600)
+
+    result = sut.transmit_time_sec(960)
+
+    assert result == pytest.approx(1.0)
+
+class TestSerialDevice:
+  @pytest.fixture
+  def stand_in(self):
+    stand_in = PtyStandIn({1, 2})
+    yield stand_in
+    stand_in.close()
+
+  def test_process_returns_response_instructions(self, stand_in):
+    sut = SerialDevice(SerialEndpoint(stand_in.path), 1)
+    instruction = Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1)
+
+    try:
+      results = sut.process(instruction)
+    finally:
+      sut.close()
+
+    assert results == [instruction]
+
+  def test_devices_on_one_port_share_a_bus(self, stand_in):
+    endpoint = SerialEndpoint(stand_in.path)
+    first = SerialDevice(endpoint, 1)
+    second = SerialDevice(endpoint, 2)
+
+    shared = first.bus is second.bus
+    first.close()
+    second.close()
+
+    assert shared
+    assert stand_in.path not in SerialBus._buses
+
+  def test_rejects_duplicate_machine_id(self, stand_in):
+    endpoint = SerialEndpoint(stand_in.path)
+    first = SerialDevice(endpoint, 1)
+
+    try:
+      with pytest.raises(ValueError):
+        SerialDevice(endpoint, 1)
+    finally:
+      first.close()
+
+    assert stand_in.path not in SerialBus._buses
+
+  def test_replies_are_routed_by_machine_id(self, stand_in):
+    endpoint = SerialEndpoint(stand_in.path)
+    first = SerialDevice(endpoint, 1)
+    second = SerialDevice(endpoint, 2)
+    received = []
+    event = threading.Event()
+    second.start_listening(lambda instructions: (received.extend(instructions), event.set()))
+    unsolicited = Instruction(Command.SWITCH_VIDEO, 3, 1, 2)
+
+    try:
+      stand_in.send(unsolicited)
+      assert event.wait(2.0)
+      results = first.process(Instruction(Command.SWITCH_VIDEO, 4, 1, 1))
+    finally:
+      first.close()
+      second.close()
+
+    assert received == [unsolicited]
+    assert results == [Instruction(Command.SWITCH_VIDEO, 4, 1, 1)]
+
+  def test_machines_take_turns_on_the_bus(self, stand_in):
+    endpoint = SerialEndpoint(stand_in.path)
+    first = SerialDevice(endpoint, 1)
+    second = SerialDevice(endpoint, 2)
+    stand_in.hold_replies()
+    threads = []
+
+    def submit(device: SerialDevice, input: int, expected_pending: int) -> None:
+      instruction = Instruction(Command.SWITCH_VIDEO, input, 1, device.machine_id)
+      thread = threading.Thread(target = device.process, args = (instruction,))
+      thread.start()
+      threads.append(thread)
+      wait_until(lambda: first.bus.pending_count == expected_pending
+        and len(stand_in.frames) >= 1)
+
+    try:
+      submit(first, 1, 0)
+      submit(first, 2, 1)
+      submit(first, 3, 2)
+      submit(second, 4, 3)
+      stand_in.release_replies()
+      for thread in threads:
+        thread.join(5.0)
+    finally:
+      first.close()
+      second.close()
+
+    assert [frame.input_value for frame in stand_in.frames] == [1, 2, 4, 3]
+
+  def test_writes_are_throttled_to_baud_rate(self, stand_in):
+    endpoint = SerialEndpoint(stand_in.path, 1200)
+    sut = SerialDevice(endpoint, 1, pipelined = True)
+    batch = [Instruction(Command.SWITCH_VIDEO, input, 1, 1) for input in range(1, 9)]
+    expected = endpoint.transmit_time_sec(len(batch) * Instruction.SIZE_BYTES)
+
+    try:
+      start = time.monotonic()
+      sut.process(batch)
+      sut.process(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+      elapsed = time.monotonic() - start
+    finally:
+      sut.close()
+
+    assert elapsed >= expected
+
+  def test_process_times_out_when_machine_is_absent(self, stand_in):
+    sut = SerialDevice(SerialEndpoint(stand_in.path, timeout_sec = 0.1), 7)
+
+    try:
+      results = sut.process(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 7))
+    finally:
+      sut.close()
+
+    assert results == []
+
+class TestGetMediaSwitch:
+  def test_serial_url_addresses_machine_id(self):
+    stand_in = PtyStandIn({3})
+    try:
+      sut = get_media_switch(f'serial://{stand_in.path}?machine_id=3&baud=19200')
+
+      sut.close()
+    finally:
+      stand_in.close()
+
+    assert sut.is_responsive
+    assert {frame.machine_id for frame in stand_in.frames} == {3}
+
+def wait_until(predicate: Callable[[], bool], timeout_sec: float = 2.0) -> None:
+  deadline = time.monotonic() + timeout_sec
+  while not predicate():
+    if time.monotonic() >= deadline:
+      raise TimeoutError('Condition not met')
+    time.sleep(0.005)
+
+class PtyStandIn:
+  """
+  Bus of local devices behind a pseudo-terminal. Each request frame addressed
+  to one of `machine_ids` is answered with its reply form.
+  """
+
+  def __init__(self, machine_ids: set[int]):
+    (self._master, self._slave) = os.openpty()
+    self.path = os.ttyname(self._slave)
+    self.machine_ids = machine_ids
+    self.frames: list[Instruction] = []
+    self._replies_released = threading.Event()
+    self._replies_released.set()
+    self._closed = threading.Event()
+    self._thread = threading.Thread(target = self._serve, daemon = True)
+    self._thread.start()
+
+  def hold_replies(self) -> None:
+    self._replies_released.clear()
+
+  def release_replies(self) -> None:
+    self._replies_released.set()
+
+  def send(self, instruction: Instruction) -> None:
+    os.write(self._master, self._reply_bytes(instruction))
+
+  def close(self) -> None:
+    self._closed.set()
+    self._replies_released.set()
+    self._thread.join()
+    os.close(self._master)
+    os.close(self._slave)
+
+  def _serve(self) -> None:
+    decoder = FrameDecoder()
+    while not self._closed.is_set():
+      (readable, _, _) = select.select([self._master], [], [], 0.05)
+      if len(readable) == 0:
+        continue
+      for frame in decoder.feed(os.read(self._master, 4096)):
+        self.frames.append(frame)
+        if frame.machine_id not in self.machine_ids:
+          continue
+        self._replies_released.wait()
+        self.send(frame)
+
+  @staticmethod
+  def _reply_bytes(instruction: Instruction) -> bytes:
+    reply = bytearray(Codec.encode(instruction))
+    reply[0] |= 0x40
+    return bytes(reply)
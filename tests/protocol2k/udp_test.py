@@ -0,0 +1,281 @@
+import gc
+import socket
+import threading
+import pytest
+
+from kesslerav import get_media_switch
+from kesslerav.protocol2k.io import Codec, Command, Instruction
+from kesslerav.protocol2k.udp import UdpDevice, UdpEndpoint, UdpTransport
+
+class TestUdpEndpoint:
+  def test_port_defaults_to_udp_port(self):
+    sut = UdpEndpoint('10.0.0.1')
+
+    assert sut.port == UdpEndpoint.DEFAULT_PORT
+
+  def test_port_can_be_specified(self):
+    sut = UdpEndpoint('10.0.0.1', 1337)
+
+    assert sut.port == 1337
+
+class TestUdpDevice:
+  @pytest.fixture
+  def transport(self):
+    transport = UdpTransport(('127.0.0.1', 0))
+    yield transport
+    transport.close()
+
+  @pytest.fixture
+  def stand_in(self):
+    stand_in = UdpStandIn()
+    yield stand_in
+    stand_in.close()
+
+  def test_process_returns_response_instructions(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    instruction = Instruction(Command.QUERY_PANEL_LOCK, 0, 1)
+
+    results = sut.process(instruction)
+
+    assert results == [instruction]
+
+  def test_process_resolves_hostname(self, transport, stand_in):
+    endpoint = UdpEndpoint('localhost', stand_in.address[1])
+
+    sut = UdpDevice(endpoint, transport)
+
+    assert sut.address == stand_in.address
+
+  def test_raises_for_host_without_address_of_transport_family(self, transport):
+    endpoint = UdpEndpoint('::1')
+
+    with pytest.raises(ValueError):
+      UdpDevice(endpoint, transport)
+
+  def test_resolves_ipv6_host_for_ipv6_transport(self):
+    if not socket.has_ipv6:
+      pytest.skip('IPv6 is not supported')
+    transport = UdpTransport(('::1', 0))
+    try:
+      sut = UdpDevice(UdpEndpoint('::1', 5000), transport)
+    finally:
+      transport.close()
+
+    assert transport.family == socket.AF_INET6
+    assert sut.address == ('::1', 5000)
+
+  def test_pipelined_process_sends_batch_in_single_datagram(self, transport, stand_in):
+    sut = create_device(transport, stand_in, pipelined = True)
+    instructions = [
+      Instruction(Command.DEFINE_MACHINE, 1, 1),
+      Instruction(Command.DEFINE_MACHINE, 2, 1),
+      Instruction(Command.QUERY_PANEL_LOCK),
+    ]
+
+    results = sut.process(instructions)
+
+    assert stand_in.datagrams == [Codec.encode_many(instructions)]
+    assert results == instructions
+
+  def test_process_retransmits_unanswered_requests(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    instruction = Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1)
+    stand_in.drop_count = 1
+
+    results = sut.process(instruction)
+
+    assert results == [instruction]
+    assert len(stand_in.datagrams) == 2
+    assert sut.retransmit_count == 1
+
+  def test_process_gives_up_after_retries(self, transport, stand_in):
+    sut = create_device(transport, stand_in, retries = 2)
+    stand_in.drop_count = 10
+
+    results = sut.process(Instruction(Command.QUERY_PANEL_LOCK))
+
+    assert results == []
+    assert len(stand_in.datagrams) == 3
+
+  def test_replies_are_routed_by_source_address(self, transport, stand_in):
+    other_stand_in = UdpStandIn()
+    try:
+      sut = create_device(transport, stand_in)
+      other = create_device(transport, other_stand_in)
+      other_stand_in.reply_override = Codec.encode(Instruction(Command.SWITCH_VIDEO, 7, 1))
+
+      results = sut.process(Instruction(Command.SWITCH_VIDEO, 2, 1))
+      other_results = other.process(Instruction(Command.SWITCH_VIDEO, 3, 1))
+    finally:
+      other_stand_in.close()
+
+    assert results == [Instruction(Command.SWITCH_VIDEO, 2, 1)]
+    assert other_results == [Instruction(Command.SWITCH_VIDEO, 7, 1)]
+    assert stand_in.sources == [transport.local_address]
+    assert other_stand_in.sources == [transport.local_address]
+
+  def test_unsolicited_instructions_are_passed_to_listener(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    received = []
+    event = threading.Event()
+    instruction = Instruction(Command.SWITCH_VIDEO, 4, 1)
+
+    sut.start_listening(lambda instructions: (received.extend(instructions), event.set()))
+    stand_in.send(Codec.encode(instruction), transport.local_address)
+
+    assert event.wait(2.0)
+    assert received == [instruction]
+
+  def test_slow_listener_does_not_hold_up_replies(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    entered = threading.Event()
+    released = threading.Event()
+    threads = []
+    def on_instructions(_):
+      threads.append(threading.current_thread().name)
+      entered.set()
+      released.wait(2.0)
+    request = Instruction(Command.QUERY_PANEL_LOCK, 0, 1)
+    sut.start_listening(on_instructions)
+    try:
+      stand_in.send(Codec.encode(Instruction(Command.SWITCH_VIDEO, 4, 1)), transport.local_address)
+      entered.wait(2.0)
+
+      results = sut.process(request)
+    finally:
+      released.set()
+      sut.close()
+
+    assert results == [request]
+    assert threads == [f'kesslerav-listener-{stand_in.address[0]}:{stand_in.address[1]}']
+    assert not sut.is_listening
+
+  def test_unsolicited_instructions_are_returned_by_next_process(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    unsolicited = Instruction(Command.SWITCH_VIDEO, 4, 1)
+    request = Instruction(Command.QUERY_PANEL_LOCK, 0, 1)
+    stand_in.send(Codec.encode(unsolicited), transport.local_address)
+
+    # The first request may race the unsolicited frame, so poll until seen
+    results = []
+    for _ in range(10):
+      results.extend(sut.process(request))
+      if unsolicited in results:
+        break
+
+    assert unsolicited in results
+
+  def test_truncated_datagram_does_not_misalign_replies(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    instruction = Instruction(Command.QUERY_PANEL_LOCK, 0, 1)
+
+    stand_in.send(b'\x5f\x80\x81', transport.local_address)
+    results = sut.process(instruction)
+
+    assert results == [instruction]
+
+  def test_invalid_frames_are_discarded(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    instruction = Instruction(Command.QUERY_PANEL_LOCK, 0, 1)
+    stand_in.reply_override = b'\x41\x01\x81\x81' + Codec.encode(instruction)
+
+    results = sut.process(instruction)
+
+    assert results == [instruction]
+
+  def test_devices_can_share_an_address(self, transport, stand_in):
+    first = create_device(transport, stand_in)
+    second = create_device(transport, stand_in)
+    instruction = Instruction(Command.QUERY_PANEL_LOCK, 0, 1)
+
+    first_results = first.process(instruction)
+    second.close()
+    second_results = first.process(instruction)
+
+    assert first_results == [instruction]
+    assert second_results == [instruction]
+
+  def test_dropped_devices_are_detached_from_transport(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+    address = sut.address
+
+    del sut
+    gc.collect()
+
+    assert transport._handlers_for(address) == []
+
+  def test_close_detaches_device_from_transport(self, transport, stand_in):
+    sut = create_device(transport, stand_in)
+
+    sut.close()
+    again = create_device(transport, stand_in)
+
+    assert again.address == sut.address
+
+class TestGetMediaSwitch:
+  def test_udp_url_loads_state_over_udp(self):
+    stand_in = UdpStandIn()
+    try:
+      sut = get_media_switch(f'udp://127.0.0.1:{stand_in.address[1]}', timeout_sec = 0.5)
+
+      sut.close()
+    finally:
+      stand_in.close()
+
+    assert len(stand_in.datagrams) == 4
+    assert sut.is_responsive
+
+def create_device(
+    transport: UdpTransport,
+    stand_in: 'UdpStandIn',
+    pipelined: bool = False,
+    retries: int = UdpEndpoint.DEFAULT_RETRIES
+  ) -> UdpDevice:
+  endpoint = UdpEndpoint('127.0.0.1', stand_in.address[1], 0.1, retries)
+  return UdpDevice(endpoint, transport, pipelined = pipelined)
+
+class UdpStandIn:
+  """
+  Local UDP device that answers each request frame with its reply form
+  """
+
+  def __init__(self):
+    self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self._socket.bind(('127.0.0.1', 0))
+    self._socket.settimeout(0.05)
+    self.address = self._socket.getsockname()
+    self.datagrams: list[bytes] = []
+    self.sources: list[tuple[str, int]] = []
+    self.drop_count = 0
+    self.reply_override = None
+    self._closed = threading.Event()
+    self._thread = threading.Thread(target = self._serve, daemon = True)
+    self._thread.start()
+
+  def send(self, data: bytes, address: tuple[str, int]) -> None:
+    self._socket.sendto(data, address)
+
+  def close(self) -> None:
+    self._closed.set()
+    self._thread.join()
+    self._socket.close()
+
+  def _serve(self) -> None:
+    while not self._closed.is_set():
+      try:
+        (data, address) = self._socket.recvfrom(4096)
+      except TimeoutError:
+        continue
+      self.datagrams.append(data)
+      if address not in self.sources:
+        self.sources.append(address)
+      if self.drop_count > 0:
+        self.drop_count -= 1
+        continue
+      if self.reply_override is not None:
+        reply = self.reply_override
+      else:
+        reply = bytearray(data)
+        for index in range(0, len(reply), Instruction.SIZE_BYTES):
+          reply[index] |= 0x40
+      self._socket.sendto(bytes(reply), address)
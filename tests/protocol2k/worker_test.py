@@ -0,0 +1,186 @@
+import threading
+import pytest
+
+from concurrent.futures import CancelledError
+
+from kesslerav.protocol2k import get_tcp_media_switch
+from kesslerav.protocol2k.emulator import Emulator
+from kesslerav.protocol2k.io import Command, Instruction, Priority
+from kesslerav.protocol2k.worker import WorkerDevice
+
+from fakes import BlockingFakeDevice, FakeDevice
+
+def create_echo_device(device_type = FakeDevice) -> FakeDevice:
+  device = device_type()
+  device.respond = lambda instructions: list(instructions)
+  return device
+
+class TestWorkerDevice:
+  def test_process_returns_responses(self):
+    device = create_echo_device()
+    sut = WorkerDevice(device)
+    instruction = Instruction(Command.SWITCH_VIDEO, 2, 1, 1)
+
+    result = sut.process(instruction)
+    sut.close()
+
+    assert result == [instruction]
+
+  def test_submit_returns_future(self):
+    device = create_echo_device()
+    sut = WorkerDevice(device)
+    instruction = Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1)
+
+    future = sut.submit([instruction])
+
+    assert future.result(2.0) == [instruction]
+    sut.close()
+
+  def test_merges_queued_requests_and_distributes_replies(self):
+    device = create_echo_device(BlockingFakeDevice)
+    sut = WorkerDevice(device)
+    device.block()
+    first = sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+    device.wait_until_processing()
+    queued = [sut.submit(Instruction(Command.QUERY_OUTPUT_STATUS, 0, i, 1)) for i in range(1, 4)]
+
+    device.unblock()
+    results = [future.result(2.0) for future in queued]
+    sut.close()
+
+    assert first.result() == [Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1)]
+    assert results == [[Instruction(Command.QUERY_OUTPUT_STATUS, 0, i, 1)] for i in range(1, 4)]
+    assert len(device.processed_batches) == 2
+    assert sut.batches_sent == 2
+
+  def test_does_not_merge_when_disabled(self):
+    device = create_echo_device(BlockingFakeDevice)
+    sut = WorkerDevice(device, merge_requests = False)
+    device.block()
+    sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+    device.wait_until_processing()
+    queued = [sut.submit(Instruction(Command.QUERY_OUTPUT_STATUS, 0, i, 1)) for i in range(1, 4)]
+
+    device.unblock()
+    for future in queued:
+      future.result(2.0)
+    sut.close()
+
+    assert len(device.processed_batches) == 4
+
+  def test_serves_interactive_requests_first(self):
+    device = create_echo_device(BlockingFakeDevice)
+    sut = WorkerDevice(device, merge_requests = False)
+    device.block()
+    sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+    device.wait_until_processing()
+    background = sut.submit(Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1, 1))
+    interactive = sut.submit(Instruction(Command.SWITCH_VIDEO, 3, 1, 1))
+
+    device.unblock()
+    background.result(2.0)
+    interactive.result(2.0)
+    sut.close()
+
+    assert [batch[0].id for batch in device.processed_batches] == [
+      Command.QUERY_PANEL_LOCK,
+      Command.SWITCH_VIDEO,
+      Command.QUERY_OUTPUT_STATUS
+    ]
+
+  def test_unsolicited_replies_go_to_first_request(self):
+    event = Instruction(Command.SWITCH_VIDEO, 4, 1, 1)
+    device = BlockingFakeDevice()
+    device.respond = lambda instructions: [event] + list(instructions)
+    sut = WorkerDevice(device)
+    device.block()
+    sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+    device.wait_until_processing()
+    first = sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1), priority = Priority.BACKGROUND)
+    second = sut.submit(Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1, 1))
+
+    device.unblock()
+    first_result = first.result(2.0)
+    second_result = second.result(2.0)
+    sut.close()
+
+    assert first_result == [event, Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1)]
+    assert second_result == [Instruction(Command.QUERY_OUTPUT_STATUS, 0, 1, 1)]
+
+  def test_device_errors_fail_the_futures(self):
+    device = FakeDevice()
+    def fail(_):
+      raise OSError('boom')
+    device.respond = fail
+    sut = WorkerDevice(device)
+
+    future = sut.submit(Instruction(Command.QUERY_PANEL_LOCK))
+
+    with pytest.raises(OSError):
+      future.result(2.0)
+    sut.close()
+
+  def test_cancelled_requests_are_not_sent(self):
+    device = create_echo_device(BlockingFakeDevice)
+    sut = WorkerDevice(device)
+    device.block()
+    sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+    device.wait_until_processing()
+    cancelled = sut.submit(Instruction(Command.SWITCH_VIDEO, 3, 1, 1))
+
+    cancelled.cancel()
+    device.unblock()
+    sut.close()
+
+    with pytest.raises(CancelledError):
+      cancelled.result()
+    assert len(device.processed_batches) == 1
+
+  def test_close_completes_queued_requests_and_closes_device(self):
+    device = create_echo_device(BlockingFakeDevice)
+    sut = WorkerDevice(device)
+    device.block()
+    sut.submit(Instruction(Command.QUERY_PANEL_LOCK, 0, 0, 1))
+    device.wait_until_processing()
+    queued = sut.submit(Instruction(Command.SWITCH_VIDEO, 3, 1, 1))
+
+    threading.Timer(0.05, device.unblock).start()
+    sut.close()
+
+    assert queued.done()
+    assert device.was_closed
+
+  def test_submit_after_close_raises(self):
+    sut = WorkerDevice(FakeDevice())
+    sut.close()
+
+    with pytest.raises(RuntimeError):
+      sut.submit(Instruction(Command.QUERY_PANEL_LOCK))
+
+class TestThreadedMediaSwitch:
+  def test_threads_share_a_single_connection(self):
+    with Emulator() as emulator:
+      emulated = emulator.add_switch(input_count = 16, latency_sec = 0.002)
+      media_switch = get_tcp_media_switch('127.0.0.1', emulated.port, threaded = True)
+      errors = []
+
+      def run(offset: int) -> None:
+        try:
+          for i in range(20):
+            media_switch.select_source((offset + i) % 16 + 1)
+            media_switch.update()
+        except Exception as ex:
+          errors.append(ex)
+
+      threads = [threading.Thread(target = run, args = (n,)) for n in range(8)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      media_switch.update()
+      media_switch.close()
+
+    assert errors == []
+    assert emulated.connections_accepted == 1
+    assert media_switch.selected_source == emulated.switch.routes[1]
+    assert media_switch.input_count == 16
@@ -1,6 +1,6 @@
 from kesslerav.constants import PROTOCOL_2K
 from kesslerav.url_parser import Endpoint, parse_url, \
-  _DEFAULT_HOST, _DEFAULT_PORT_TCP, _DEFAULT_PROTOCOL, \
+  _DEFAULT_HOST, _DEFAULT_PORT_TCP, _DEFAULT_PORT_UDP, _DEFAULT_PROTOCOL, \
   _DEFAULT_SCHEME, _PROTOCOL_2K_ALT
 
 class TestEndpoint:
@@ -36,9 +36,14 @@ class TestEndpoint:
 
     assert sut.port == _DEFAULT_PORT_TCP
 
-  def test_leaves_port_unspecified_for_unknown_schemes(self):
+  def test_sets_port_default_when_not_specified_and_udp_scheme(self):
     sut = Endpoint(scheme = 'udp')
 
+    assert sut.port == _DEFAULT_PORT_UDP
+
+  def test_leaves_port_unspecified_for_unknown_schemes(self):
+    sut = Endpoint(scheme = 'serial')
+
     assert sut.port is None
 
   def test_sets_port_as_specified(self):
@@ -68,6 +73,57 @@ class TestEndpoint:
 
     assert sut.protocol == PROTOCOL_2K
 
+  # Equality
+  def test_equivalent_urls_are_equal(self):
+    urls = ['10.0.0.5', 'tcp://10.0.0.5:5000#protocol2k', 'TCP://10.0.0.5#protocol2000']
+
+    results = [parse_url(url) for url in urls]
+
+    assert all(result == results[0] for result in results)
+    assert len(set(results)) == 1
+
+  def test_trailing_slash_is_ignored_for_network_schemes(self):
+    sut = parse_url('tcp://10.0.0.5:5000/')
+
+    assert sut == parse_url('tcp://10.0.0.5:5000')
+    assert sut.path is None
+    assert parse_url('udp://10.0.0.5/') == parse_url('udp://10.0.0.5')
+
+  def test_protocol_is_compared_case_insensitively(self):
+    sut = parse_url('10.0.0.5#Protocol2000')
+
+    assert sut == parse_url('10.0.0.5#protocol2k')
+    assert sut.protocol == PROTOCOL_2K
+
+  def test_udp_urls_with_default_port_are_equal(self):
+    sut = parse_url('udp://10.0.0.5')
+
+    assert sut == parse_url('udp://10.0.0.5:50000')
+    assert sut.url == 'udp://10.0.0.5:50000#protocol2k'
+
+  def test_different_endpoints_are_not_equal(self):
+    sut = parse_url('10.0.0.5')
+
+    assert sut != parse_url('10.0.0.5:5001')
+    assert sut != parse_url('10.0.0.6')
+    assert sut != parse_url('udp://10.0.0.5:5000')
+
+  def test_options_are_compared_regardless_of_order(self):
+    sut = parse_url('serial:///dev/ttyUSB0?baud=19200&machine_id=2')
+
+    assert sut == parse_url('serial:///dev/ttyUSB0?machine_id=2&baud=19200')
+    assert sut != parse_url('serial:///dev/ttyUSB0?machine_id=3&baud=19200')
+
+  def test_url_is_normalized(self):
+    sut = parse_url('Switch.Local')
+
+    assert sut.url == 'tcp://switch.local:5000#protocol2k'
+
+  def test_url_includes_path_and_sorted_options(self):
+    sut = parse_url('serial:///dev/ttyUSB0?machine_id=2&baud=19200')
+
+    assert sut.url == 'serial://localhost/dev/ttyUSB0?baud=19200&machine_id=2#protocol2k'
+
 class TestParseUrl:
   def test_host_only_parses_correctly(self):
     url = 'localhost'
@@ -100,7 +156,7 @@ class TestParseUrl:
 
     assert result.scheme == scheme
     assert result.host == host
-    assert result.port is None
+    assert result.port == _DEFAULT_PORT_UDP
     assert result.protocol == _DEFAULT_PROTOCOL
 
   def test_scheme_host_and_port_parses_correctly(self):
@@ -154,3 +210,19 @@ class TestParseUrl:
     assert result.host == host
     assert result.port == port
     assert result.protocol == protocol
+
+  def test_serial_path_and_options_parse_correctly(self):
+    url = 'serial:///dev/ttyUSB0?baud=19200&machine_id=2'
+
+    result = parse_url(url)
+
+    assert result.scheme == 'serial'
+    assert result.path == '/dev/ttyUSB0'
+    assert result.options == {'baud': '19200', 'machine_id': '2'}
+    assert result.port is None
+
+  def test_path_is_none_when_url_has_no_path(self):
+    result = parse_url('tcp://10.0.0.1')
+
+    assert result.path is None
+    assert result.options == {}